@@ -1,11 +1,10 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
-import psycopg2
-from psycopg2 import pool
 import hashlib
 import secrets
 import os
+import sys
 from datetime import datetime, timedelta, UTC
 import json
 import smtplib
@@ -18,10 +17,20 @@ import random
 import logging
 import traceback
 from logging.handlers import RotatingFileHandler
+from db_session import DatabasePool
+from static_assets import StaticAssets
+from page_cache import PageCache
+from log_pipeline import LogPipeline, LazyData, DataFormatter, parse_sample_rates
+from metrics import MetricsRegistry, FANOUT_BUCKETS
+from socket_codec import install_codecs
 
+# Game modules live in the api.games package, so the site root has to be importable when run from api/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api.games.three_stones_moves import iter_move_pages, move_record, MAX_PAGE_SIZE
+
+# Static files are served by serve_static through the asset manifest, not Flask's static view
 app = Flask(__name__, 
-            static_folder='../assets',
-            static_url_path='/assets',
+            static_folder=None,
             template_folder='../pages')
 CORS(app)  # Allow cross-origin requests
 # Use threading mode for Windows compatibility
@@ -39,10 +48,13 @@ socketio = SocketIO(
 
 # Three Stones game server is now in api/games/three_stones_server.py
 
+SITE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IS_PRODUCTION = os.environ.get('FLASK_ENV') == 'production' or os.environ.get('ENV') == 'production'
+
 # Setup logging
 def setup_logging():
-    """Setup comprehensive logging system"""
-    log_level = os.environ.get('LOG_LEVEL', 'DEBUG').upper()
+    """Setup comprehensive logging system (handlers run on a background listener thread)"""
+    log_level = os.environ.get('LOG_LEVEL', 'INFO').upper()
     log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
     
     # Create logs directory if it doesn't exist
@@ -51,7 +63,7 @@ def setup_logging():
     
     # Configure root logger
     logger = logging.getLogger()
-    logger.setLevel(getattr(logging, log_level, logging.DEBUG))
+    logger.setLevel(getattr(logging, log_level, logging.INFO))
     
     # Clear existing handlers
     logger.handlers.clear()
@@ -59,12 +71,11 @@ def setup_logging():
     # Console handler with colored output
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.DEBUG)
-    console_format = logging.Formatter(
+    console_format = DataFormatter(
         '%(asctime)s [%(levelname)s] %(name)s: %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(console_format)
-    logger.addHandler(console_handler)
     
     # File handler with rotation
     log_file = os.path.join(log_dir, 'server.log')
@@ -74,12 +85,11 @@ def setup_logging():
         backupCount=5
     )
     file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter(
+    file_format = DataFormatter(
         '%(asctime)s [%(levelname)s] %(name)s [%(filename)s:%(lineno)d]: %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     file_handler.setFormatter(file_format)
-    logger.addHandler(file_handler)
     
     # Error log file
     error_log_file = os.path.join(log_dir, 'errors.log')
@@ -90,49 +100,98 @@ def setup_logging():
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(file_format)
-    logger.addHandler(error_handler)
     
-    return logger
+    # Request threads only push records onto a queue; formatting, JSON and file I/O
+    # happen on the listener thread. Repeated messages are capped per second.
+    pipeline = LogPipeline(
+        [console_handler, file_handler, error_handler],
+        rate_limit=int(os.environ.get('LOG_RATE_LIMIT', '20')),
+        sample_rates=parse_sample_rates(os.environ.get('LOG_SAMPLE'))
+    )
+    pipeline.install(logger)
+    
+    return logger, pipeline
 
 # Initialize logging
-logger = setup_logging()
+logger, log_pipeline = setup_logging()
 
 # Helper functions for logging
-def log_info(message, extra_data=None):
+# Extra data is wrapped in LazyData and only serialized (size-capped) if a handler writes it
+def log_info(message, extra_data=None, sample=None):
     """Log info message with optional extra data"""
-    if extra_data:
-        logger.info(f"{message} | Data: {json.dumps(extra_data, default=str)}")
-    else:
-        logger.info(message)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(message, extra={'data': LazyData(extra_data) if extra_data else None, 'sample': sample})
 
-def log_debug(message, extra_data=None):
+def log_debug(message, extra_data=None, sample=None):
     """Log debug message with optional extra data"""
-    if extra_data:
-        logger.debug(f"{message} | Data: {json.dumps(extra_data, default=str)}")
-    else:
-        logger.debug(message)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, extra={'data': LazyData(extra_data) if extra_data else None, 'sample': sample})
 
 def log_error(message, error=None, extra_data=None):
     """Log error message with optional exception and extra data"""
     error_msg = message
     if error:
         error_msg += f" | Error: {str(error)}"
-    if extra_data:
-        error_msg += f" | Data: {json.dumps(extra_data, default=str)}"
-    logger.error(error_msg, exc_info=error if error else None)
+    logger.error(error_msg, exc_info=error if error else None,
+                 extra={'data': LazyData(extra_data) if extra_data else None})
 
 def log_warning(message, extra_data=None):
     """Log warning message with optional extra data"""
-    if extra_data:
-        logger.warning(f"{message} | Data: {json.dumps(extra_data, default=str)}")
-    else:
-        logger.warning(message)
+    logger.warning(message, extra={'data': LazyData(extra_data) if extra_data else None})
 
 # Three Stones game functions moved to api/games/three_stones_server.py
 
+# Hashed and precompressed files from assets/ and games/ (re-read on change in development)
+static_files = StaticAssets(SITE_ROOT, auto_reload=not IS_PRODUCTION)
+
+# Minified pages from pages/ and games/, served by route-table lookup ('/' is the login page)
+pages = PageCache(SITE_ROOT, static_files, aliases={'': 'login.html'}, auto_reload=not IS_PRODUCTION)
+
 # PostgreSQL connection pool
 db_pool = None
 
+# Metrics exposed at /api/metrics (Prometheus text format)
+metrics = MetricsRegistry()
+http_latency = metrics.histogram('http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status'))
+socket_latency = metrics.histogram('socketio_event_duration_seconds', 'Socket.IO event handler latency', ('event',))
+emit_total = metrics.counter('socketio_emits_total', 'Socket.IO events emitted by the server', ('event',))
+emit_recipients = metrics.histogram('socketio_emit_recipients', 'Clients addressed per emit', ('event',), buckets=FANOUT_BUCKETS)
+db_wait = metrics.histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled database connection')
+db_hold = metrics.histogram('db_pool_hold_seconds', 'Time a pooled database connection was held')
+metrics.gauge('db_pool_in_use', 'Database connections currently checked out',
+              lambda: db_pool.stats()['in_use'] if db_pool else 0)
+metrics.counter_value('db_pool_timeouts_total', 'Checkouts that timed out waiting for a connection',
+                      lambda: db_pool.stats()['timeouts'] if db_pool else 0)
+metrics.gauge('log_queue_depth', 'Log records waiting for the listener thread', lambda: log_pipeline.stats()['queue_depth'])
+
+def observe_db_checkout(wait, hold):
+    db_wait.observe(wait)
+    db_hold.observe(hold)
+
+def instrument_emit(sio):
+    """Count every server emit and how many clients it addresses"""
+    original_emit = sio.emit
+    
+    def emit(event, *args, **kwargs):
+        try:
+            room = kwargs.get('to') or kwargs.get('room')
+            namespace_rooms = sio.server.manager.rooms.get(kwargs.get('namespace') or '/', {})
+            recipients = len(namespace_rooms.get(room, ()))
+        except Exception:
+            recipients = 0
+        emit_total.inc(event)
+        emit_recipients.observe(recipients, event)
+        return original_emit(event, *args, **kwargs)
+    
+    sio.emit = emit
+
+instrument_emit(socketio)
+
+# JSON for every client, MessagePack for connections that ask for it with ?codec=msgpack
+socket_codecs = install_codecs(socketio)
+metrics.gauge('socketio_msgpack_connections', 'Connected clients using the MessagePack codec',
+              lambda: socket_codecs.get_stats()['connected_msgpack'])
+
 # Email configuration (istifadəçi tərəfindən veriləcək)
 SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
 SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
@@ -151,150 +210,247 @@ def init_db_pool():
         db_password = os.environ.get('DB_PASSWORD', 'npg_SxvR6sZIK9yi')
         db_port = int(os.environ.get('DB_PORT', '5432'))
         
-        db_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 10,
+        db_pool = DatabasePool.from_env(
             host=db_host,
             database=db_database,
             user=db_user,
             password=db_password,
             port=db_port,
-            sslmode='require'
+            sslmode=os.environ.get('DB_SSLMODE', 'require')
         )
-        log_info("Database connection pool created successfully", {'min_conn': 1, 'max_conn': 10, 'host': db_host})
+        db_pool.start_leak_monitor()
+        db_pool.add_listener(observe_db_checkout)
+        log_info("Database connection pool created successfully", {
+            'min_conn': db_pool.minconn,
+            'max_conn': db_pool.maxconn,
+            'wait_timeout': db_pool.wait_timeout,
+            'host': db_host
+        })
         create_tables()
     except Exception as e:
         log_error("Error creating connection pool", e, {'host': db_host, 'database': db_database})
 
+@app.before_request
+def open_db_scope():
+    """Pin at most one pooled connection to each HTTP request"""
+    g.request_started = time.perf_counter()
+    if db_pool:
+        db_pool.begin_scope()
+
+@app.after_request
+def record_request_latency(response):
+    """Observe request latency under the matched route pattern (not the raw path)"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_latency.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+    return response
+
+@app.teardown_request
+def close_db_scope(error=None):
+    """Return the request's connection to the pool"""
+    if db_pool:
+        db_pool.end_scope()
+
 def create_tables():
     """Create necessary tables if they don't exist"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                phone_number VARCHAR(20) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE
-            )
-        """)
-        
-        # Game stats table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS game_stats (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                total_games INTEGER DEFAULT 0,
-                total_score BIGINT DEFAULT 0,
-                best_wave INTEGER DEFAULT 0,
-                best_score BIGINT DEFAULT 0,
-                total_enemies_killed INTEGER DEFAULT 0,
-                total_time_played INTEGER DEFAULT 0,
-                diamonds INTEGER DEFAULT 500,
-                stars INTEGER DEFAULT 100,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Add diamonds and stars columns if they don't exist (for existing databases)
-        try:
-            cursor.execute("ALTER TABLE game_stats ADD COLUMN IF NOT EXISTS diamonds INTEGER DEFAULT 500")
-            cursor.execute("ALTER TABLE game_stats ADD COLUMN IF NOT EXISTS stars INTEGER DEFAULT 100")
-            # Update existing users who don't have diamonds/stars set
-            cursor.execute("UPDATE game_stats SET diamonds = 500 WHERE diamonds IS NULL")
-            cursor.execute("UPDATE game_stats SET stars = 100 WHERE stars IS NULL")
-        except Exception as e:
-            print(f"[INFO] Columns may already exist: {e}")
-        
-        # Game sessions table (for detailed game history)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS game_sessions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                score BIGINT DEFAULT 0,
-                wave_reached INTEGER DEFAULT 0,
-                enemies_killed INTEGER DEFAULT 0,
-                game_duration INTEGER DEFAULT 0,
-                ended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                game_data JSONB
-            )
-        """)
-        
-        # Password reset tokens table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS password_reset_tokens (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                token VARCHAR(255) UNIQUE NOT NULL,
-                expires_at TIMESTAMP NOT NULL,
-                used BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Saved game states table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS saved_game_states (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                game_state JSONB NOT NULL,
-                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_game_over BOOLEAN DEFAULT FALSE,
-                UNIQUE(user_id)
-            )
-        """)
-        
-        # Three stones game rooms table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS three_stones_rooms (
-                id SERIAL PRIMARY KEY,
-                room_code VARCHAR(10) UNIQUE NOT NULL,
-                room_name VARCHAR(255) NOT NULL,
-                password_hash VARCHAR(255),
-                creator_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                creator_socket_id VARCHAR(255),
-                orange_player_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                orange_socket_id VARCHAR(255),
-                blue_player_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
-                blue_socket_id VARCHAR(255),
-                game_state JSONB,
-                started BOOLEAN DEFAULT FALSE,
-                game_over BOOLEAN DEFAULT FALSE,
-                winner VARCHAR(10),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                started_at TIMESTAMP,
-                ended_at TIMESTAMP
-            )
-        """)
-        
-        # Create index for faster room lookups
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_code 
-            ON three_stones_rooms(room_code)
-        """)
-        
-        # Create index for active rooms
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_active 
-            ON three_stones_rooms(room_code, started, game_over) 
-            WHERE started = FALSE AND game_over = FALSE
-        """)
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn:
+            cursor = conn.cursor()
+            
+            # Users table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    username VARCHAR(50) UNIQUE NOT NULL,
+                    email VARCHAR(255) UNIQUE NOT NULL,
+                    phone_number VARCHAR(20) UNIQUE NOT NULL,
+                    password_hash VARCHAR(255) NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_login TIMESTAMP,
+                    is_active BOOLEAN DEFAULT TRUE
+                )
+            """)
+        
+            # Game stats table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS game_stats (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    total_games INTEGER DEFAULT 0,
+                    total_score BIGINT DEFAULT 0,
+                    best_wave INTEGER DEFAULT 0,
+                    best_score BIGINT DEFAULT 0,
+                    total_enemies_killed INTEGER DEFAULT 0,
+                    total_time_played INTEGER DEFAULT 0,
+                    diamonds INTEGER DEFAULT 500,
+                    stars INTEGER DEFAULT 100,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        
+            # Add diamonds and stars columns if they don't exist (for existing databases)
+            try:
+                cursor.execute("ALTER TABLE game_stats ADD COLUMN IF NOT EXISTS diamonds INTEGER DEFAULT 500")
+                cursor.execute("ALTER TABLE game_stats ADD COLUMN IF NOT EXISTS stars INTEGER DEFAULT 100")
+                # Update existing users who don't have diamonds/stars set
+                cursor.execute("UPDATE game_stats SET diamonds = 500 WHERE diamonds IS NULL")
+                cursor.execute("UPDATE game_stats SET stars = 100 WHERE stars IS NULL")
+            except Exception as e:
+                print(f"[INFO] Columns may already exist: {e}")
+        
+            # Game sessions table (for detailed game history)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS game_sessions (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    score BIGINT DEFAULT 0,
+                    wave_reached INTEGER DEFAULT 0,
+                    enemies_killed INTEGER DEFAULT 0,
+                    game_duration INTEGER DEFAULT 0,
+                    ended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    game_data JSONB
+                )
+            """)
+        
+            # Password reset tokens table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS password_reset_tokens (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    token VARCHAR(255) UNIQUE NOT NULL,
+                    expires_at TIMESTAMP NOT NULL,
+                    used BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        
+            # Saved game states table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS saved_game_states (
+                    id SERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    game_state JSONB NOT NULL,
+                    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_game_over BOOLEAN DEFAULT FALSE,
+                    UNIQUE(user_id)
+                )
+            """)
+        
+            # Three stones game rooms table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS three_stones_rooms (
+                    id SERIAL PRIMARY KEY,
+                    room_code VARCHAR(10) UNIQUE NOT NULL,
+                    room_name VARCHAR(255) NOT NULL,
+                    password_hash VARCHAR(255),
+                    creator_user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                    creator_socket_id VARCHAR(255),
+                    orange_player_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                    orange_socket_id VARCHAR(255),
+                    blue_player_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                    blue_socket_id VARCHAR(255),
+                    game_state JSONB,
+                    game_state_packed BIGINT,
+                    game_state_seq INTEGER,
+                    started BOOLEAN DEFAULT FALSE,
+                    game_over BOOLEAN DEFAULT FALSE,
+                    winner VARCHAR(10),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    ended_at TIMESTAMP,
+                    last_active_at TIMESTAMP
+                )
+            """)
+        
+            # Packed game state column (for existing databases)
+            cursor.execute("ALTER TABLE three_stones_rooms ADD COLUMN IF NOT EXISTS game_state_packed BIGINT")
+            cursor.execute("ALTER TABLE three_stones_rooms ADD COLUMN IF NOT EXISTS game_state_seq INTEGER")
+            cursor.execute("ALTER TABLE three_stones_rooms ADD COLUMN IF NOT EXISTS last_active_at TIMESTAMP")
+
+            # Create index for faster room lookups
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_code 
+                ON three_stones_rooms(room_code)
+            """)
+        
+            # Create index for active rooms
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_active 
+                ON three_stones_rooms(room_code, started, game_over) 
+                WHERE started = FALSE AND game_over = FALSE
+            """)
+        
+            # Boş otaqları süpürən sorğu üçün (oldest idle first)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_last_active 
+                ON three_stones_rooms ((COALESCE(last_active_at, created_at)))
+            """)
+        
+            # Room codes are this sequence's numbers through a keyed permutation (36^6 codes)
+            cursor.execute("""
+                CREATE SEQUENCE IF NOT EXISTS three_stones_room_code_seq
+                MINVALUE 0 MAXVALUE 2176782335 START 0
+            """)
+        
+            # Append-only move log; a room's state is its last snapshot plus the moves after game_state_seq
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS three_stones_moves (
+                    room_code VARCHAR(10) NOT NULL REFERENCES three_stones_rooms(room_code) ON DELETE CASCADE,
+                    seq INTEGER NOT NULL,
+                    stone_id VARCHAR(16) NOT NULL,
+                    from_node VARCHAR(8),
+                    to_node VARCHAR(8) NOT NULL,
+                    flags SMALLINT NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (room_code, seq)
+                )
+            """)
+        
+            # Arxivləşdirilmiş otaqlar: rooms idle past their TTL move here (and their moves below)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS three_stones_rooms_archive (
+                    id INTEGER PRIMARY KEY,
+                    room_code VARCHAR(10) NOT NULL,
+                    room_name VARCHAR(255),
+                    creator_user_id INTEGER,
+                    orange_player_id INTEGER,
+                    blue_player_id INTEGER,
+                    game_state JSONB,
+                    game_state_packed BIGINT,
+                    game_state_seq INTEGER,
+                    started BOOLEAN,
+                    created_at TIMESTAMP,
+                    started_at TIMESTAMP,
+                    last_active_at TIMESTAMP,
+                    archive_reason VARCHAR(16) NOT NULL,
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_three_stones_rooms_archive_code 
+                ON three_stones_rooms_archive(room_code)
+            """)
+            # Room codes are never reused, but archived moves are keyed by the room's id all the same
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS three_stones_moves_archive (
+                    room_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    stone_id VARCHAR(16) NOT NULL,
+                    from_node VARCHAR(8),
+                    to_node VARCHAR(8) NOT NULL,
+                    flags SMALLINT NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP,
+                    PRIMARY KEY (room_id, seq)
+                )
+            """)
+        
+            conn.commit()
+            cursor.close()
         log_info("Database tables created successfully")
     except Exception as e:
         log_error("Error creating tables", e)
-        if conn:
-            db_pool.putconn(conn)
 
 def hash_password(password):
     """Hash password using SHA256"""
@@ -339,7 +495,6 @@ def send_email(to_email, subject, body):
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register new user"""
-    conn = None
     try:
         data = request.get_json()
         username = data.get('username', '').strip()
@@ -360,49 +515,39 @@ def register():
         if not password or len(password) < 4:
             return jsonify({'success': False, 'error': 'Şifrə ən azı 4 simvol olmalıdır'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Check if username exists
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        if cursor.fetchone():
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Bu istifadəçi adı artıq mövcuddur'}), 400
-        
-        # Check if email exists
-        cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Bu email ünvanı artıq istifadə olunur'}), 400
-        
-        # Check if phone number exists
-        cursor.execute("SELECT id FROM users WHERE phone_number = %s", (phone_number,))
-        if cursor.fetchone():
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Bu telefon nömrəsi artıq istifadə olunur'}), 400
-        
-        # Create user
-        password_hash = hash_password(password)
-        cursor.execute("""
-            INSERT INTO users (username, email, phone_number, password_hash)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id
-        """, (username, email, phone_number, password_hash))
-        
-        user_id = cursor.fetchone()[0]
-        
-        # Create initial game stats with starting diamonds (500) and stars (100)
-        cursor.execute("""
-            INSERT INTO game_stats (user_id, diamonds, stars)
-            VALUES (%s, 500, 100)
-        """, (user_id,))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Check if username exists
+            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+            if cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Bu istifadəçi adı artıq mövcuddur'}), 400
+            
+            # Check if email exists
+            cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Bu email ünvanı artıq istifadə olunur'}), 400
+            
+            # Check if phone number exists
+            cursor.execute("SELECT id FROM users WHERE phone_number = %s", (phone_number,))
+            if cursor.fetchone():
+                return jsonify({'success': False, 'error': 'Bu telefon nömrəsi artıq istifadə olunur'}), 400
+            
+            # Create user
+            password_hash = hash_password(password)
+            cursor.execute("""
+                INSERT INTO users (username, email, phone_number, password_hash)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            """, (username, email, phone_number, password_hash))
+            
+            user_id = cursor.fetchone()[0]
+            
+            # Create initial game stats with starting diamonds (500) and stars (100)
+            cursor.execute("""
+                INSERT INTO game_stats (user_id, diamonds, stars)
+                VALUES (%s, 500, 100)
+            """, (user_id,))
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -412,9 +557,6 @@ def register():
         
     except Exception as e:
         print(f"[ERROR] Register error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/login', methods=['POST'])
@@ -428,50 +570,42 @@ def login():
         if not username or not password:
             return jsonify({'success': False, 'error': 'İstifadəçi adı və şifrə tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        password_hash = hash_password(password)
-        cursor.execute("""
-            SELECT id, username, is_active
-            FROM users
-            WHERE username = %s AND password_hash = %s
-        """, (username, password_hash))
-        
-        user = cursor.fetchone()
-        
-        if not user:
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'İstifadəçi adı və ya şifrə yanlışdır'}), 401
-        
-        user_id, db_username, is_active = user
-        
-        if not is_active:
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Hesab deaktivdir'}), 403
-        
-        # Update last login
-        cursor.execute("""
-            UPDATE users
-            SET last_login = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (user_id,))
-        
-        # Get user stats including diamonds and stars
-        cursor.execute("""
-            SELECT total_games, total_score, best_wave, best_score, 
-                   total_enemies_killed, total_time_played, diamonds, stars
-            FROM game_stats
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        stats = cursor.fetchone()
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            password_hash = hash_password(password)
+            cursor.execute("""
+                SELECT id, username, is_active
+                FROM users
+                WHERE username = %s AND password_hash = %s
+            """, (username, password_hash))
+            
+            user = cursor.fetchone()
+            
+            if not user:
+                return jsonify({'success': False, 'error': 'İstifadəçi adı və ya şifrə yanlışdır'}), 401
+            
+            user_id, db_username, is_active = user
+            
+            if not is_active:
+                return jsonify({'success': False, 'error': 'Hesab deaktivdir'}), 403
+            
+            # Update last login
+            cursor.execute("""
+                UPDATE users
+                SET last_login = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (user_id,))
+            
+            # Get user stats including diamonds and stars
+            cursor.execute("""
+                SELECT total_games, total_score, best_wave, best_score, 
+                       total_enemies_killed, total_time_played, diamonds, stars
+                FROM game_stats
+                WHERE user_id = %s
+            """, (user_id,))
+            
+            stats = cursor.fetchone()
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -493,9 +627,6 @@ def login():
         
     except Exception as e:
         print(f"[ERROR] Login error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/save-game', methods=['POST'])
@@ -516,50 +647,46 @@ def save_game():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Save game session
-        cursor.execute("""
-            INSERT INTO game_sessions (user_id, score, wave_reached, enemies_killed, game_duration, game_data)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING id
-        """, (user_id, score, wave_reached, enemies_killed, game_duration, json.dumps(game_data)))
-        
-        session_id = cursor.fetchone()[0]
-        
-        # Update game stats including diamonds and stars
-        update_fields = [
-            "total_games = total_games + 1",
-            "total_score = total_score + %s",
-            "best_wave = GREATEST(best_wave, %s)",
-            "best_score = GREATEST(best_score, %s)",
-            "total_enemies_killed = total_enemies_killed + %s",
-            "total_time_played = total_time_played + %s",
-            "updated_at = CURRENT_TIMESTAMP"
-        ]
-        update_values = [score, wave_reached, score, enemies_killed, game_duration]
-        
-        # Add diamonds and stars updates if provided
-        if diamonds_earned != 0:
-            update_fields.append("diamonds = diamonds + %s")
-            update_values.append(diamonds_earned)
-        
-        if stars_earned != 0:
-            update_fields.append("stars = stars + %s")
-            update_values.append(stars_earned)
-        
-        update_values.append(user_id)
-        
-        cursor.execute(f"""
-            UPDATE game_stats
-            SET {', '.join(update_fields)}
-            WHERE user_id = %s
-        """, update_values)
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Save game session
+            cursor.execute("""
+                INSERT INTO game_sessions (user_id, score, wave_reached, enemies_killed, game_duration, game_data)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (user_id, score, wave_reached, enemies_killed, game_duration, json.dumps(game_data)))
+            
+            session_id = cursor.fetchone()[0]
+            
+            # Update game stats including diamonds and stars
+            update_fields = [
+                "total_games = total_games + 1",
+                "total_score = total_score + %s",
+                "best_wave = GREATEST(best_wave, %s)",
+                "best_score = GREATEST(best_score, %s)",
+                "total_enemies_killed = total_enemies_killed + %s",
+                "total_time_played = total_time_played + %s",
+                "updated_at = CURRENT_TIMESTAMP"
+            ]
+            update_values = [score, wave_reached, score, enemies_killed, game_duration]
+            
+            # Add diamonds and stars updates if provided
+            if diamonds_earned != 0:
+                update_fields.append("diamonds = diamonds + %s")
+                update_values.append(diamonds_earned)
+            
+            if stars_earned != 0:
+                update_fields.append("stars = stars + %s")
+                update_values.append(stars_earned)
+            
+            update_values.append(user_id)
+            
+            cursor.execute(f"""
+                UPDATE game_stats
+                SET {', '.join(update_fields)}
+                WHERE user_id = %s
+            """, update_values)
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -569,41 +696,29 @@ def save_game():
         
     except Exception as e:
         print(f"[ERROR] Save game error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/get-stats', methods=['GET'])
 def get_stats():
     """Get user stats"""
-    conn = None
-    cursor = None
     try:
         user_id = request.args.get('user_id', type=int)
         
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT total_games, total_score, best_wave, best_score, 
-                   total_enemies_killed, total_time_played, diamonds, stars
-            FROM game_stats
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        stats = cursor.fetchone()
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT total_games, total_score, best_wave, best_score, 
+                       total_enemies_killed, total_time_played, diamonds, stars
+                FROM game_stats
+                WHERE user_id = %s
+            """, (user_id,))
+            
+            stats = cursor.fetchone()
         
         # Əgər stats yoxdursa, default dəyərlər qaytar
         if not stats:
-            cursor.close()
-            db_pool.putconn(conn)
-            conn = None
-            cursor = None
-            
             # Default stats qaytar - yeni istifadəçi üçün
             return jsonify({
                 'success': True,
@@ -619,11 +734,6 @@ def get_stats():
                 }
             })
         
-        cursor.close()
-        db_pool.putconn(conn)
-        conn = None
-        cursor = None
-        
         return jsonify({
             'success': True,
             'stats': {
@@ -642,22 +752,11 @@ def get_stats():
         print(f"[ERROR] Get stats error: {e}")
         import traceback
         traceback.print_exc()
-        if cursor:
-            try:
-                cursor.close()
-            except:
-                pass
-        if conn:
-            try:
-                db_pool.putconn(conn)
-            except:
-                pass
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/update-currency', methods=['POST'])
 def update_currency():
     """Update user diamonds and stars"""
-    conn = None
     try:
         data = request.get_json()
         user_id = data.get('user_id')
@@ -667,9 +766,6 @@ def update_currency():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
         # Update diamonds and stars
         update_fields = []
         update_values = []
@@ -683,24 +779,21 @@ def update_currency():
             update_values.append(stars_change)
         
         if not update_fields:
-            cursor.close()
-            db_pool.putconn(conn)
             return jsonify({'success': True, 'message': 'Dəyişiklik yoxdur'})
         
         update_fields.append("updated_at = CURRENT_TIMESTAMP")
         update_values.append(user_id)
         
-        cursor.execute(f"""
-            UPDATE game_stats
-            SET {', '.join(update_fields)}
-            WHERE user_id = %s
-            RETURNING diamonds, stars
-        """, update_values)
-        
-        result = cursor.fetchone()
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE game_stats
+                SET {', '.join(update_fields)}
+                WHERE user_id = %s
+                RETURNING diamonds, stars
+            """, update_values)
+            
+            result = cursor.fetchone()
+            conn.commit()
         
         if result:
             return jsonify({
@@ -714,15 +807,11 @@ def update_currency():
         
     except Exception as e:
         print(f"[ERROR] Update currency error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/forgot-password', methods=['POST'])
 def forgot_password():
     """Request password reset - send email with reset token"""
-    conn = None
     try:
         data = request.get_json()
         email = data.get('email', '').strip().lower()
@@ -730,30 +819,27 @@ def forgot_password():
         if not email or '@' not in email:
             return jsonify({'success': False, 'error': 'Etibarlı email ünvanı daxil edin'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Find user by email
-        cursor.execute("SELECT id, username FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        
-        if not user:
-            # Don't reveal if email exists (security)
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': True, 'message': 'Əgər email mövcuddursa, şifrə sıfırlama linki göndərildi'})
-        
-        user_id, username = user
-        
-        # Generate reset token
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.now(UTC) + timedelta(hours=1)  # Token 1 saat etibarlıdır
-        
-        # Save token to database
-        cursor.execute("""
-            INSERT INTO password_reset_tokens (user_id, token, expires_at)
-            VALUES (%s, %s, %s)
-        """, (user_id, token, expires_at))
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Find user by email
+            cursor.execute("SELECT id, username FROM users WHERE email = %s", (email,))
+            user = cursor.fetchone()
+            
+            if not user:
+                # Don't reveal if email exists (security)
+                return jsonify({'success': True, 'message': 'Əgər email mövcuddursa, şifrə sıfırlama linki göndərildi'})
+            
+            user_id, username = user
+            
+            # Generate reset token
+            token = secrets.token_urlsafe(32)
+            expires_at = datetime.now(UTC) + timedelta(hours=1)  # Token 1 saat etibarlıdır
+            
+            # Save token to database
+            cursor.execute("""
+                INSERT INTO password_reset_tokens (user_id, token, expires_at)
+                VALUES (%s, %s, %s)
+            """, (user_id, token, expires_at))
+            conn.commit()
         
         # Send email with reset link
         # RESET_PASSWORD_URL environment variable-dan al, yoxdursa BASE_URL istifadə et
@@ -778,10 +864,6 @@ def forgot_password():
         </html>
         """
         
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
-        
         # Try to send email (but don't fail if email is not configured)
         email_sent = send_email(email, email_subject, email_body)
         
@@ -795,26 +877,18 @@ def forgot_password():
         
     except Exception as e:
         print(f"[ERROR] Forgot password error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/verify-reset-token', methods=['GET'])
 def verify_reset_token():
     """Get username from reset token (for displaying on reset page)"""
-    conn = None
     try:
         token = request.args.get('token', '').strip()
         
         if not token:
             return jsonify({'success': False, 'error': 'Token tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = None
-        try:
-            cursor = conn.cursor()
-            
+        with db_pool.session() as conn, conn.cursor() as cursor:
             # Find token and get username
             cursor.execute("""
                 SELECT prt.user_id, prt.expires_at, prt.used, u.username
@@ -824,68 +898,39 @@ def verify_reset_token():
             """, (token,))
             
             token_data = cursor.fetchone()
-            
-            if not token_data:
-                cursor.close()
-                db_pool.putconn(conn)
-                return jsonify({'success': False, 'error': 'Etibarsız və ya mövcud olmayan token'}), 400
-            
-            user_id, expires_at, used, username = token_data
-            
-            # Make expires_at timezone-aware if it's naive (PostgreSQL returns naive datetime)
-            if expires_at.tzinfo is None:
-                expires_at = expires_at.replace(tzinfo=UTC)
-            
-            # Check if token is expired
-            if datetime.now(UTC) > expires_at:
-                cursor.close()
-                db_pool.putconn(conn)
-                return jsonify({'success': False, 'error': 'Token müddəti bitib'}), 400
-            
-            # Check if token already used
-            if used:
-                cursor.close()
-                db_pool.putconn(conn)
-                return jsonify({'success': False, 'error': 'Bu token artıq istifadə edilib'}), 400
-            
-            cursor.close()
-            db_pool.putconn(conn)
-            
-            return jsonify({
-                'success': True,
-                'username': username,
-                'message': 'Token etibarlıdır'
-            })
-        except Exception as inner_e:
-            print(f"[ERROR] Inner verify reset token error: {inner_e}")
-            if cursor:
-                try:
-                    cursor.close()
-                except:
-                    pass
-            if conn:
-                try:
-                    db_pool.putconn(conn)
-                except:
-                    pass
-            raise inner_e
+        
+        if not token_data:
+            return jsonify({'success': False, 'error': 'Etibarsız və ya mövcud olmayan token'}), 400
+        
+        user_id, expires_at, used, username = token_data
+        
+        # Make expires_at timezone-aware if it's naive (PostgreSQL returns naive datetime)
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=UTC)
+        
+        # Check if token is expired
+        if datetime.now(UTC) > expires_at:
+            return jsonify({'success': False, 'error': 'Token müddəti bitib'}), 400
+        
+        # Check if token already used
+        if used:
+            return jsonify({'success': False, 'error': 'Bu token artıq istifadə edilib'}), 400
+        
+        return jsonify({
+            'success': True,
+            'username': username,
+            'message': 'Token etibarlıdır'
+        })
         
     except Exception as e:
         print(f"[ERROR] Verify reset token error: {e}")
         import traceback
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
-        if conn:
-            try:
-                cursor.close()
-            except:
-                pass
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/reset-password', methods=['POST'])
 def reset_password():
     """Reset password using token"""
-    conn = None
     try:
         data = request.get_json()
         token = data.get('token', '').strip()
@@ -897,82 +942,92 @@ def reset_password():
         if not new_password or len(new_password) < 4:
             return jsonify({'success': False, 'error': 'Yeni şifrə ən azı 4 simvol olmalıdır'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Find valid token
-        cursor.execute("""
-            SELECT user_id, expires_at, used
-            FROM password_reset_tokens
-            WHERE token = %s
-        """, (token,))
-        
-        token_data = cursor.fetchone()
-        
-        if not token_data:
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Etibarsız və ya mövcud olmayan token'}), 400
-        
-        user_id, expires_at, used = token_data
-        
-        # Make expires_at timezone-aware if it's naive (PostgreSQL returns naive datetime)
-        if expires_at.tzinfo is None:
-            expires_at = expires_at.replace(tzinfo=UTC)
-        
-        # Check if token is expired
-        if datetime.now(UTC) > expires_at:
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Token müddəti bitib'}), 400
-        
-        # Check if token already used
-        if used:
-            cursor.close()
-            db_pool.putconn(conn)
-            return jsonify({'success': False, 'error': 'Bu token artıq istifadə edilib'}), 400
-        
-        # Update password (token already verified the user)
-        new_password_hash = hash_password(new_password)
-        cursor.execute("""
-            UPDATE users
-            SET password_hash = %s
-            WHERE id = %s
-        """, (new_password_hash, user_id))
-        
-        # Mark token as used
-        cursor.execute("""
-            UPDATE password_reset_tokens
-            SET used = TRUE
-            WHERE token = %s
-        """, (token,))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Find valid token
+            cursor.execute("""
+                SELECT user_id, expires_at, used
+                FROM password_reset_tokens
+                WHERE token = %s
+            """, (token,))
+            
+            token_data = cursor.fetchone()
+            
+            if not token_data:
+                return jsonify({'success': False, 'error': 'Etibarsız və ya mövcud olmayan token'}), 400
+            
+            user_id, expires_at, used = token_data
+            
+            # Make expires_at timezone-aware if it's naive (PostgreSQL returns naive datetime)
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=UTC)
+            
+            # Check if token is expired
+            if datetime.now(UTC) > expires_at:
+                return jsonify({'success': False, 'error': 'Token müddəti bitib'}), 400
+            
+            # Check if token already used
+            if used:
+                return jsonify({'success': False, 'error': 'Bu token artıq istifadə edilib'}), 400
+            
+            # Update password (token already verified the user)
+            new_password_hash = hash_password(new_password)
+            cursor.execute("""
+                UPDATE users
+                SET password_hash = %s
+                WHERE id = %s
+            """, (new_password_hash, user_id))
+            
+            # Mark token as used
+            cursor.execute("""
+                UPDATE password_reset_tokens
+                SET used = TRUE
+                WHERE token = %s
+            """, (token,))
+            
+            conn.commit()
         
         return jsonify({'success': True, 'message': 'Şifrə uğurla dəyişdirildi'})
         
     except Exception as e:
         print(f"[ERROR] Reset password error: {e}")
-        if conn:
-            cursor.close()
-            db_pool.putconn(conn)
         return jsonify({'success': False, 'error': f'Xəta: {str(e)}'}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
         return jsonify({'success': True, 'status': 'healthy'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics (protected by METRICS_TOKEN when it is set)"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}' and request.args.get('token') != token:
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/three-stones/rooms/<room_code>/moves', methods=['GET'])
+def three_stones_moves(room_code):
+    """Stream a match's moves as NDJSON (?after=<seq>&limit=<page size>), one page of rows at a time"""
+    try:
+        after = int(request.args.get('after', 0))
+        limit = min(max(int(request.args.get('limit', 500)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'after və limit tam ədəd olmalıdır'}), 400
+    if not db_pool:
+        return jsonify({'success': False, 'error': 'Database mövcud deyil'}), 503
+
+    def generate():
+        # Each page is read on its own short-lived connection, never held while the client reads
+        for page in iter_move_pages(db_pool, room_code, after, limit):
+            yield ''.join(json.dumps(move_record(row), separators=(',', ':')) + '\n' for row in page)
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/api/save-game-state', methods=['POST'])
 def save_game_state():
     """Save current game state"""
@@ -985,23 +1040,19 @@ def save_game_state():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Yeni qeyd və ya mövcud qeydi yenilə
-        cursor.execute("""
-            INSERT INTO saved_game_states (user_id, game_state, is_game_over)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id) 
-            DO UPDATE SET 
-                game_state = EXCLUDED.game_state,
-                is_game_over = EXCLUDED.is_game_over,
-                saved_at = CURRENT_TIMESTAMP
-        """, (user_id, json.dumps(game_state), is_game_over))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Yeni qeyd və ya mövcud qeydi yenilə
+            cursor.execute("""
+                INSERT INTO saved_game_states (user_id, game_state, is_game_over)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (user_id) 
+                DO UPDATE SET 
+                    game_state = EXCLUDED.game_state,
+                    is_game_over = EXCLUDED.is_game_over,
+                    saved_at = CURRENT_TIMESTAMP
+            """, (user_id, json.dumps(game_state), is_game_over))
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -1021,20 +1072,15 @@ def load_game_state():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Yadda saxlanılmış oyun vəziyyətini yüklə
-        cursor.execute("""
-            SELECT game_state, is_game_over, saved_at
-            FROM saved_game_states
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        result = cursor.fetchone()
-        
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            # Yadda saxlanılmış oyun vəziyyətini yüklə
+            cursor.execute("""
+                SELECT game_state, is_game_over, saved_at
+                FROM saved_game_states
+                WHERE user_id = %s
+            """, (user_id,))
+            
+            result = cursor.fetchone()
         
         if result:
             game_state = result[0]
@@ -1067,17 +1113,13 @@ def delete_game_state():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID tələb olunur'}), 400
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            DELETE FROM saved_game_states
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM saved_game_states
+                WHERE user_id = %s
+            """, (user_id,))
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -1092,145 +1134,28 @@ def delete_game_state():
 @app.route('/favicon.ico')
 def favicon():
     """Serve favicon"""
-    try:
-        return app.send_static_file('favicon.svg')
-    except:
-        return '', 204  # No content if not found
+    response = static_files.response('assets/favicon.svg', request)
+    return response if response is not None else ('', 204)  # No content if not found
 
 # Serve HTML pages and static files
 @app.route('/')
 def index():
     """Serve login page as default"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'login.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve login.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/index.html')
-def game_index():
-    """Serve game index page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        index_path = os.path.join(pages_folder, 'index.html')
-        if os.path.exists(index_path):
-            response = send_from_directory(pages_folder, 'index.html')
-            # Ensure correct Content-Type
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            return response
-        else:
-            print(f"[ERROR] index.html not found at: {index_path}")
-            return jsonify({'error': 'Page not found'}), 404
-    except Exception as e:
-        print(f"[ERROR] Failed to serve index.html: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/login.html')
-def login_page():
-    """Serve login page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'login.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve login.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/register.html')
-def register_page():
-    """Serve register page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'register.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve register.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/forgot-password.html')
-def forgot_password_page():
-    """Serve forgot password page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'forgot-password.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve forgot-password.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/reset-password.html')
-@app.route('/reset-password.html/')
-def reset_password_page():
-    """Serve reset password page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'reset-password.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve reset-password.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
-
-@app.route('/mobile.html')
-def mobile_page():
-    """Serve mobile page"""
-    try:
-        pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-        response = send_from_directory(pages_folder, 'mobile.html')
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
-    except Exception as e:
-        print(f"[ERROR] Failed to serve mobile.html: {e}")
-        return jsonify({'error': 'Page not found'}), 404
+    return serve_page('')
 
 # Serve static files explicitly (Flask auto-serving might not work)
 @app.route('/assets/<path:filename>')
 def serve_static(filename):
-    """Serve static files from assets folder"""
-    try:
-        # Remove query string from filename for file existence check
-        clean_filename = filename.split('?')[0] if '?' in filename else filename
-        
-        # Get absolute path to assets folder
-        assets_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'assets')
-        file_path = os.path.join(assets_folder, clean_filename)
-        
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            response = send_from_directory(os.path.dirname(file_path), os.path.basename(file_path))
-            # Set correct Content-Type based on file extension
-            if clean_filename.endswith('.js'):
-                response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-            elif clean_filename.endswith('.css'):
-                response.headers['Content-Type'] = 'text/css; charset=utf-8'
-            elif clean_filename.endswith('.html'):
-                response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            elif clean_filename.endswith('.svg'):
-                response.headers['Content-Type'] = 'image/svg+xml'
-            elif clean_filename.endswith('.png'):
-                response.headers['Content-Type'] = 'image/png'
-            elif clean_filename.endswith('.jpg') or clean_filename.endswith('.jpeg'):
-                response.headers['Content-Type'] = 'image/jpeg'
-            return response
-        else:
-            print(f"[ERROR] Static file not found: {file_path} (filename: {filename})")
-            return '', 404
-    except Exception as e:
-        print(f"[ERROR] Static file not found: {filename}, error: {e}")
-        import traceback
-        traceback.print_exc()
+    """Serve static files from assets folder (plain or fingerprinted URLs)"""
+    response = static_files.response('assets/' + filename, request)
+    if response is None:
+        print(f"[ERROR] Static file not found: {filename}")
         return '', 404
+    return response
 
 @app.route('/<path:path>')
 def serve_page(path):
-    """Serve HTML pages and static files"""
+    """Serve HTML pages (from the page cache) and games static files"""
     # API routes - already handled by Flask route handlers above
     if path.startswith('api/'):
         return jsonify({'error': 'Not found'}), 404
@@ -1239,81 +1164,18 @@ def serve_page(path):
     if path.startswith('assets/'):
         return jsonify({'error': 'Asset not found'}), 404
     
-    # URL duplikasiyasını normalize et (məsələn: reset-password.html/reset-password.html -> reset-password.html)
-    if 'reset-password.html' in path:
-        # Eğer path'de reset-password.html iki kere varsa, normalize et
-        parts = path.split('/')
-        if parts.count('reset-password.html') > 1:
-            # İlk reset-password.html'i al, query string'i koru
-            normalized_path = 'reset-password.html'
-            # Query string'i tap
-            if '?' in path:
-                # Find the query string from the original path
-                query_start = path.find('?')
-                query_part = path[query_start:]
-                normalized_path = normalized_path + query_part
-            path = normalized_path
-        # Eğer path'de reset-password.html/ varsa, normalize et (sonunda slash varsa)
-        elif path == 'reset-password.html/' or path.startswith('reset-password.html/'):
-            # Remove trailing slash and normalize
-            normalized_path = path.rstrip('/')
-            if normalized_path != 'reset-password.html':
-                # If there's something after reset-password.html/, extract query string
-                if '?' in normalized_path:
-                    query_start = normalized_path.find('?')
-                    normalized_path = 'reset-password.html' + normalized_path[query_start:]
-                else:
-                    normalized_path = 'reset-password.html'
-            path = normalized_path
+    # pages/*.html and games/**/*.html, including aliases like /login and /reset-password.html/
+    response = pages.response(path, request)
+    if response is not None:
+        return response
     
-    # Serve games folder (games/neondefender/index.html, etc.)
+    # Scripts, styles and images under games/ come from the asset manifest
     if path.startswith('games/'):
-        # Remove query string from path for file existence check
-        clean_path = path.split('?')[0] if '?' in path else path
-        
-        # Remove 'games/' prefix from path since games_folder already points to games directory
-        relative_path = clean_path[6:] if clean_path.startswith('games/') else clean_path
-        
-        games_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'games')
-        games_path = os.path.join(games_folder, relative_path)
-        
-        if os.path.exists(games_path) and os.path.isfile(games_path):
-            response = send_from_directory(os.path.dirname(games_path), os.path.basename(games_path))
-            # Ensure correct Content-Type based on file extension
-            if relative_path.endswith('.html'):
-                response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            elif relative_path.endswith('.js'):
-                response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-            elif relative_path.endswith('.css'):
-                response.headers['Content-Type'] = 'text/css; charset=utf-8'
-            elif relative_path.endswith('.json'):
-                response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            return response
-        else:
-            print(f"[ERROR] Games file not found: {games_path} (original path: {path}, relative_path: {relative_path})")
-            return jsonify({'error': 'File not found'}), 404
-    
-    # Serve HTML pages from pages folder
-    pages_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'pages')
-    if not path.endswith('.html'):
-        html_path = path + '.html'
-        full_path = os.path.join(pages_folder, html_path)
-        if os.path.exists(full_path):
-            response = send_from_directory(pages_folder, html_path)
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        response = static_files.response(path, request)
+        if response is not None:
             return response
-    
-    # Try to serve as HTML page
-    page_path = os.path.join(pages_folder, path)
-    if os.path.exists(page_path):
-        response = send_from_directory(pages_folder, path)
-        if path.endswith('.html'):
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        elif path.endswith('.js'):
-            response.headers['Content-Type'] = 'application/javascript; charset=utf-8'
-        elif path.endswith('.css'):
-            response.headers['Content-Type'] = 'text/css; charset=utf-8'
-        return response
+        print(f"[ERROR] Games file not found: {path}")
+        return jsonify({'error': 'File not found'}), 404
     
     return jsonify({'error': 'Page not found'}), 404
 
@@ -1321,34 +1183,51 @@ def serve_page(path):
 
 if __name__ == '__main__':
     # Import Three Stones game server (after logging functions are defined)
-    # Use relative import since we're running from api/ directory
-    import sys
-    import os
-    # Add parent directory to path for imports
-    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from api.games.three_stones_server import (
         initialize as init_three_stones,
-        load_active_rooms_from_db,
-        cleanup_empty_rooms
+        create_game_state_view,
+        migrate_game_states_in_db,
+        load_lobby_index_from_db,
+        cleanup_empty_rooms,
+        shutdown as shutdown_three_stones,
+        get_game_stats,
+        get_timer_stats,
+        get_lobby_stats
     )
     
+    # Game metrics are read from the game module at scrape time; get_game_stats() walks every room, so it runs once per scrape
+    game_stats = metrics.snapshot(get_game_stats)
+    metrics.gauge('three_stones_rooms', 'Rooms held in memory', lambda: game_stats()['rooms'])
+    metrics.gauge('three_stones_rooms_started', 'Rooms with a game in progress', lambda: game_stats()['rooms_started'])
+    metrics.gauge('three_stones_players', 'Connected players in rooms', lambda: game_stats()['players'])
+    metrics.gauge('three_stones_disconnect_timers', 'Players inside the reconnect grace period', lambda: game_stats()['disconnect_timers'])
+    metrics.gauge('three_stones_pending_timers', 'Tasks waiting on the timer wheel', lambda: get_timer_stats()['pending'])
+    metrics.gauge('three_stones_lobby_subscribers', 'Sockets subscribed to lobby updates', lambda: get_lobby_stats()['subscribers'])
+    metrics.gauge('three_stones_persister_queue_depth', 'Rooms with unsaved game state',
+                  lambda: (game_stats()['persister'] or {}).get('queue_depth', 0))
+    metrics.counter_value('three_stones_room_cache_evictions_total', 'Idle rooms written out and dropped from memory',
+                          lambda: game_stats()['room_cache']['evictions'])
+    metrics.gauge('three_stones_room_cache_hit_rate', 'Room lookups served from memory',
+                  lambda: game_stats()['room_cache']['hit_rate'])
+    metrics.gauge('three_stones_sweep_seconds', 'Duration of the last expired-room sweep',
+                  lambda: (game_stats()['lifecycle'] or {}).get('last_sweep_seconds', 0))
+    metrics.counter_value('three_stones_rooms_archived_total', 'Rooms archived since start',
+                          lambda: sum((game_stats()['lifecycle'] or {}).get('archived', {}).values()))
+    
     init_db_pool()
     if db_pool:
         # Initialize Three Stones game server
-        init_three_stones(socketio, db_pool, (log_info, log_error, log_debug, log_warning))
-        
-        # Load active rooms from database on server start
-        load_active_rooms_from_db()
-        
-        # Start room cleanup timer
-        import threading
-        def cleanup_timer():
-            while True:
-                time.sleep(60)  # Check every minute
-                cleanup_empty_rooms()
-        
-        cleanup_thread = threading.Thread(target=cleanup_timer, daemon=True)
-        cleanup_thread.start()
+        init_three_stones(socketio, db_pool, (log_info, log_error, log_debug, log_warning),
+                          event_observer=lambda event, seconds: socket_latency.observe(seconds, event))
+        
+        # JSON view of packed game states for ad-hoc queries (three_stones_rooms_state)
+        create_game_state_view()
+        # Rewrite game states saved before the current schema version (no-op once done)
+        migrate_game_states_in_db()
+        # Archive rooms that expired while the server was down (the sweeper thread takes it from here)
+        cleanup_empty_rooms()
+        # Lobby metadata (with creator usernames) for every listed room; rooms are hydrated on first use
+        load_lobby_index_from_db()
         
         port = int(os.environ.get('PORT', 5000))
         # Production mühitində URL-i environment variable-dan al
@@ -1379,8 +1258,16 @@ if __name__ == '__main__':
             browser_thread.daemon = True
             browser_thread.start()
         
+        # Turn SIGTERM (platform restarts/deploys) into a normal exit so pending
+        # game state writes are flushed before the process goes away
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        
         # Use threading mode explicitly to avoid werkzeug compatibility issues
-        socketio.run(app, host='0.0.0.0', port=port, debug=debug_mode, allow_unsafe_werkzeug=True, use_reloader=False)
+        try:
+            socketio.run(app, host='0.0.0.0', port=port, debug=debug_mode, allow_unsafe_werkzeug=True, use_reloader=False)
+        finally:
+            shutdown_three_stones()
     else:
         log_error("Failed to initialize database pool")
 
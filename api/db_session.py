@@ -0,0 +1,256 @@
+"""
+Database Session Layer
+Thread-safe blocking connection pool with request-scoped sessions and leak detection
+"""
+
+import os
+import time
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+
+from psycopg2 import pool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(pool.PoolError):
+    """Raised when no connection becomes free within the wait timeout"""
+
+
+class DatabasePool:
+    """Blocking wrapper around psycopg2's ThreadedConnectionPool.
+
+    Callers wait up to ``wait_timeout`` seconds for a free slot instead of
+    failing instantly when all connections are in use. A thread holds at most
+    one connection at a time: nested ``session()`` calls reuse it, and inside
+    a ``scope()`` the connection stays pinned until the scope ends.
+    """
+
+    def __init__(self, minconn, maxconn, wait_timeout=10.0, leak_timeout=60.0, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.wait_timeout = wait_timeout
+        self.leak_timeout = leak_timeout
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, **connect_kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._checked_out = {}  # {id(conn): {'conn', 'thread', 'since', 'stack', 'reported'}}
+        self._listeners = []  # [callable(wait_seconds, hold_seconds)]
+        self._monitor = None
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'leaks_reported': 0,
+            'leaks_reclaimed': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+            'hold_total': 0.0,
+            'hold_max': 0.0
+        }
+
+    @classmethod
+    def from_env(cls, **connect_kwargs):
+        """Create a pool sized from DB_POOL_* environment variables"""
+        return cls(
+            int(os.environ.get('DB_POOL_MIN', '1')),
+            int(os.environ.get('DB_POOL_MAX', '10')),
+            wait_timeout=float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            leak_timeout=float(os.environ.get('DB_POOL_LEAK_SECONDS', '60')),
+            **connect_kwargs
+        )
+
+    def add_listener(self, callback):
+        """Register callback(wait_seconds, hold_seconds) called after every checkout"""
+        self._listeners.append(callback)
+
+    # --- Checkout / return ---
+
+    def _acquire(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            self.check_leaks()
+            raise PoolTimeout(f"No database connection available after {self.wait_timeout}s")
+        try:
+            conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+        now = time.monotonic()
+        with self._lock:
+            self._checked_out[id(conn)] = {
+                'conn': conn,
+                'thread': threading.current_thread(),
+                'since': now,
+                'stack': ''.join(traceback.format_stack(limit=10)[:-3]),
+                'reported': False
+            }
+        return conn, now - started, now
+
+    def _release(self, conn, failed, wait, acquired_at):
+        hold = time.monotonic() - acquired_at
+        with self._lock:
+            entry = self._checked_out.pop(id(conn), None)
+            if entry is None:
+                # Already reclaimed by the leak monitor
+                return
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['wait_total'] += wait
+            stats['wait_max'] = max(stats['wait_max'], wait)
+            stats['hold_total'] += hold
+            stats['hold_max'] = max(stats['hold_max'], hold)
+        try:
+            if failed and not conn.closed:
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"Rollback failed while returning connection: {e}")
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+        for callback in self._listeners:
+            try:
+                callback(wait, hold)
+            except Exception:
+                logger.exception("Database pool listener failed")
+
+    # --- Public API ---
+
+    @contextmanager
+    def session(self):
+        """Yield the connection owned by the current thread, checking one out if needed.
+
+        The connection goes back to the pool when the outermost session ends,
+        unless the thread is inside a scope(), in which case it is kept until
+        the scope ends. An exception escaping the session rolls back.
+        """
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            local.depth += 1
+            try:
+                yield local.conn
+            except Exception:
+                local.failed = True
+                raise
+            finally:
+                local.depth -= 1
+            return
+
+        conn, wait, acquired_at = self._acquire()
+        local.conn, local.depth, local.failed = conn, 1, False
+        local.wait, local.acquired_at = wait, acquired_at
+        try:
+            yield conn
+        except Exception:
+            local.failed = True
+            raise
+        finally:
+            local.depth = 0
+            if not getattr(local, 'scoped', False):
+                self._release_local()
+            elif local.failed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                local.failed = False
+
+    def _release_local(self):
+        local = self._local
+        conn = local.conn
+        local.conn = None
+        self._release(conn, local.failed, local.wait, local.acquired_at)
+
+    def begin_scope(self):
+        """Start a request/event scope on the current thread (no connection is taken yet)"""
+        self._local.scoped = True
+
+    def end_scope(self):
+        """End the current scope and return its connection, if one was taken"""
+        local = self._local
+        local.scoped = False
+        if getattr(local, 'conn', None) is not None and not local.depth:
+            self._release_local()
+
+    @contextmanager
+    def scope(self):
+        """Share one lazily acquired connection across everything run inside the block"""
+        if getattr(self._local, 'scoped', False):
+            yield
+            return
+        self.begin_scope()
+        try:
+            yield
+        finally:
+            self.end_scope()
+
+    # --- Leak detection ---
+
+    def check_leaks(self):
+        """Report connections held past leak_timeout and reclaim ones whose thread has exited"""
+        now = time.monotonic()
+        reclaim = []
+        with self._lock:
+            for key, entry in list(self._checked_out.items()):
+                held = now - entry['since']
+                owner_alive = entry['thread'].is_alive()
+                if not owner_alive:
+                    reclaim.append(self._checked_out.pop(key))
+                    self._stats['leaks_reclaimed'] += 1
+                elif held > self.leak_timeout and not entry['reported']:
+                    entry['reported'] = True
+                    self._stats['leaks_reported'] += 1
+                    logger.warning(
+                        f"Database connection held for {held:.1f}s by thread "
+                        f"{entry['thread'].name} (possible leak), checked out at:\n{entry['stack']}"
+                    )
+        for entry in reclaim:
+            logger.warning(
+                f"Reclaiming database connection leaked by exited thread "
+                f"{entry['thread'].name}, checked out at:\n{entry['stack']}"
+            )
+            conn = entry['conn']
+            try:
+                if not conn.closed:
+                    conn.rollback()
+                self._pool.putconn(conn, close=bool(conn.closed))
+            except Exception as e:
+                logger.warning(f"Failed to reclaim leaked connection: {e}")
+            finally:
+                self._slots.release()
+        return len(reclaim)
+
+    def start_leak_monitor(self, interval=15.0):
+        """Run check_leaks() periodically on a daemon thread"""
+        if self._monitor is not None:
+            return
+
+        def monitor():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.check_leaks()
+                except Exception:
+                    logger.exception("Database leak monitor failed")
+
+        self._monitor = threading.Thread(target=monitor, name='db-leak-monitor', daemon=True)
+        self._monitor.start()
+
+    def stats(self):
+        """Snapshot of pool usage and checkout timings"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['in_use'] = len(self._checked_out)
+        snapshot['max_conn'] = self.maxconn
+        checkouts = snapshot['checkouts'] or 1
+        snapshot['wait_avg'] = snapshot['wait_total'] / checkouts
+        snapshot['hold_avg'] = snapshot['hold_total'] / checkouts
+        return snapshot
+
+    def closeall(self):
+        self._pool.closeall()
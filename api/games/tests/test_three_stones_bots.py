@@ -0,0 +1,83 @@
+"""
+Three Stones Bots tests
+The inline BotRunner queue runs every submitted action, whichever thread submits it
+"""
+
+import threading
+from collections import deque
+
+from ..three_stones_bots import BotRunner
+
+
+def test_inline_runner_runs_actions_submitted_from_other_threads():
+    runner = BotRunner()
+    ran = []
+    lock = threading.Lock()
+
+    def action(n):
+        with lock:
+            ran.append(n)
+        if n % 100 == 0:
+            # Like a bot move, queue a follow-up while the queue is being drained
+            runner.submit(action, n + 1)
+
+    def submitter(base):
+        for n in range(base, base + 2000, 2):
+            runner.submit(action, n)
+
+    threads = [threading.Thread(target=submitter, args=(i * 10000,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(ran) == 8 * (1000 + 20)
+    assert runner.stats()['inline_queue'] == 0
+    assert runner.errors == 0
+
+
+def test_failing_action_does_not_stop_the_queue():
+    runner = BotRunner()
+    ran = []
+
+    def fail():
+        runner.submit(ran.append, 'after')
+        raise RuntimeError('boom')
+
+    runner.submit(fail)
+    assert ran == ['after']
+    assert runner.errors == 1
+
+
+class RacingQueue(deque):
+    """Inline queue that, the first time it is found empty, lets another thread submit an action"""
+
+    def __init__(self, on_empty):
+        super().__init__()
+        self.on_empty = on_empty
+
+    def __len__(self):
+        length = super().__len__()
+        if length == 0 and self.on_empty:
+            on_empty, self.on_empty = self.on_empty, None
+            on_empty()
+        return length
+
+
+def test_action_submitted_as_a_drain_ends_still_runs():
+    runner = BotRunner()
+    ran = []
+
+    def submit_from_another_thread():
+        thread = threading.Thread(target=runner.submit, args=(ran.append, 'late'))
+        thread.start()
+        # The runner holds its lock here, so the other thread waits for the drain to end
+        thread.join(0.2)
+        threads.append(thread)
+
+    threads = []
+    runner._inline = RacingQueue(submit_from_another_thread)
+    runner.submit(ran.append, 'first')
+    for thread in threads:
+        thread.join(1)
+    assert ran == ['first', 'late']
+    assert runner.stats()['inline_queue'] == 0
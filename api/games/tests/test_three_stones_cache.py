@@ -0,0 +1,37 @@
+"""
+Three Stones Room Cache tests
+Idle rooms are evicted least recently used first, but never one a handler looked up while it was being written out
+"""
+
+from ..three_stones_cache import RoomCache
+
+
+def test_idle_rooms_are_evicted_least_recently_used_first():
+    written = []
+    cache = RoomCache(capacity=2, can_evict=lambda code, room: True,
+                      evict=lambda code, room: written.append(code))
+    for code in ('A', 'B', 'C'):
+        cache[code] = {'name': code}
+    cache.touch('A')
+    assert cache.shrink() == 1
+    assert written == ['B']
+    assert list(cache) == ['C', 'A']
+
+
+def test_room_looked_up_while_it_is_written_out_stays():
+    cache = RoomCache(capacity=None, can_evict=lambda code, room: True)
+    looked_up = []
+
+    def evict(code, room):
+        # A handler on another thread gets the room while the eviction writes it out
+        looked_up.append(cache.lookup(code))
+
+    cache.evict = evict
+    cache['A'] = {'name': 'A', 'active_at': 0}
+    assert cache.evict_idle(before=100) == 0
+    assert looked_up[0] is cache.get('A')
+    assert cache.stats()['evictions'] == 0
+    # Untouched on the next pass, it goes
+    cache.evict = lambda code, room: None
+    assert cache.evict_idle(before=100) == 1
+    assert 'A' not in cache
@@ -0,0 +1,68 @@
+"""
+Three Stones Rules Engine tests
+check_move() and legal_moves() against the set-based rules the server used before the bitboard engine
+"""
+
+from itertools import combinations
+
+from ..three_stones_engine import NOT_OWN_STONE, NOT_NEIGHBOR, OCCUPIED, BLOCKS_OPPONENT
+from ..three_stones_server import BOARD_NODES, LEGACY_NODE_IDS, rules
+
+
+def legacy_check(own, other, from_node, to_node):
+    """The old make_move checks on sets of node IDs, plus the own-stone rule"""
+    if from_node not in own:
+        return NOT_OWN_STONE
+    if to_node not in BOARD_NODES[from_node]['neighbors']:
+        return NOT_NEIGHBOR
+    if to_node in own | other:
+        return OCCUPIED
+    occupied = (own - {from_node}) | {to_node} | other
+    if not any(neighbor not in occupied for node in other for neighbor in BOARD_NODES[node]['neighbors']):
+        return BLOCKS_OPPONENT
+    return None
+
+
+def positions():
+    """Every (own, other) pair of disjoint 3-stone node sets"""
+    for own in combinations(BOARD_NODES, 3):
+        rest = [node for node in BOARD_NODES if node not in own]
+        for other in combinations(rest, 3):
+            yield set(own), set(other)
+
+
+def test_check_move_matches_legacy_rules():
+    for own, other in positions():
+        own_mask, other_mask = rules.mask(own), rules.mask(other)
+        for from_node in BOARD_NODES:
+            for to_node in BOARD_NODES:
+                expected = legacy_check(own, other, from_node, to_node)
+                got = rules.check_move(own_mask, other_mask, rules.bit(from_node), rules.bit(to_node))
+                assert got == expected, (sorted(own), sorted(other), from_node, to_node)
+
+
+def test_legal_moves_are_the_moves_check_move_allows():
+    for own, other in positions():
+        own_mask, other_mask = rules.mask(own), rules.mask(other)
+        expected = {
+            (rules.bit(from_node), rules.bit(to_node))
+            for from_node in own for to_node in BOARD_NODES
+            if legacy_check(own, other, from_node, to_node) is None
+        }
+        assert set(rules.legal_moves(own_mask, other_mask)) == expected
+
+
+def test_check_move_rejects_stones_that_are_not_own():
+    orange, blue = rules.mask(['10', '9', '8']), rules.mask(['5', '6', '7'])
+    assert rules.check_move(orange, blue, rules.bit('6'), rules.bit('1')) == NOT_OWN_STONE
+    assert rules.check_move(orange, blue, rules.bit('4'), rules.bit('1')) == NOT_OWN_STONE
+    assert rules.check_move(orange, blue, 0, rules.bit('4')) == NOT_OWN_STONE
+    assert rules.check_move(orange, blue, rules.bit('9'), rules.bit('4')) is None
+
+
+def test_legacy_node_ids_map_to_the_same_bits():
+    for old_id, node_id in LEGACY_NODE_IDS.items():
+        assert rules.bit(old_id) == rules.bit(node_id)
+    assert rules.bit(9) == rules.bit('9')
+    assert rules.bit('nowhere') == 0
+    assert rules.bit(None) == 0
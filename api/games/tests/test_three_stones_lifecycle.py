@@ -0,0 +1,89 @@
+"""
+Three Stones Room Lifecycle tests
+Which TTL a room gets, including stored states whose gameOver is not a boolean
+"""
+
+import os
+import json
+from contextlib import contextmanager
+
+import pytest
+
+from ..three_stones_lifecycle import RoomLifecycle, room_reason, EMPTY, ABANDONED, FINISHED, REASONS
+from ..three_stones_packed import pack_game_state
+from ..three_stones_server import rules
+
+# The sweep query only runs against a real server; it works on a temporary table, never on stored rooms
+TEST_DATABASE_URL = os.environ.get('THREE_STONES_TEST_DATABASE_URL')
+
+
+def test_room_reason_counts_only_a_boolean_game_over():
+    assert room_reason({'gameOver': True}, True) == FINISHED
+    assert room_reason({'gameOver': False}, True) == ABANDONED
+    assert room_reason({'gameOver': 'x'}, True) == ABANDONED
+    assert room_reason({'gameOver': 1}, False) == EMPTY
+    assert room_reason(None, False) == EMPTY
+
+
+class SessionPool:
+    """db_pool stand-in that hands out one connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def session(self):
+        yield self.conn
+
+
+@pytest.fixture
+def db_pool():
+    if not TEST_DATABASE_URL:
+        pytest.skip('THREE_STONES_TEST_DATABASE_URL is not set')
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            # Shadows any real three_stones_rooms for this session only
+            cursor.execute("""
+                CREATE TEMP TABLE three_stones_rooms (
+                    room_code VARCHAR(10) PRIMARY KEY,
+                    game_state JSONB,
+                    game_state_packed BIGINT,
+                    started BOOLEAN DEFAULT FALSE,
+                    created_at TIMESTAMP NOT NULL,
+                    last_active_at TIMESTAMP
+                )
+            """)
+        yield SessionPool(conn)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def test_sweep_query_survives_a_malformed_game_over(db_pool):
+    finished = rules.to_game_state(rules.mask(['5', '6', '7']), rules.mask(['10', '4', '3']), 'blue', 'orange')
+    rows = [
+        ('BADSTR', {'gameOver': 'x'}, None, True),
+        ('BADNUM', {'gameOver': 1}, None, False),
+        ('DONE', {'gameOver': True}, None, True),
+        ('PACKED', None, pack_game_state(finished), True),
+        ('PLAYED', {'gameOver': False}, None, True),
+        ('NEW', None, None, False),
+    ]
+    with db_pool.conn.cursor() as cursor:
+        for room_code, game_state, packed, started in rows:
+            cursor.execute("""
+                INSERT INTO three_stones_rooms (room_code, game_state, game_state_packed, started, created_at)
+                VALUES (%s, %s::jsonb, %s, %s, NOW() - INTERVAL '1 day')
+            """, (room_code, json.dumps(game_state) if game_state is not None else None, packed, started))
+    lifecycle = RoomLifecycle(db_pool, {reason: 60 for reason in REASONS})
+    expired = dict(lifecycle.expired_in_db([], limit=10))
+    assert expired == {
+        'BADSTR': ABANDONED,
+        'BADNUM': EMPTY,
+        'DONE': FINISHED,
+        'PACKED': FINISHED,
+        'PLAYED': ABANDONED,
+        'NEW': EMPTY,
+    }
@@ -0,0 +1,96 @@
+"""
+Three Stones Move Log tests
+Replaying the logged moves onto the stored snapshot rebuilds the live game, winner included
+"""
+
+import copy
+import json
+
+import pytest
+from flask import Flask
+from flask_socketio import SocketIO
+
+from .. import three_stones_server as server
+from ..three_stones_bots import Bot, BotRunner
+from ..three_stones_moves import replay_moves
+
+
+class RecordingPersister:
+    """Persister stand-in that keeps what would have been written"""
+
+    def __init__(self):
+        self.snapshots = []  # (room_code, seq, game_state as stored)
+        self.moves = []  # three_stones_moves rows
+
+    def mark_dirty(self, room_code, game_state, seq=None, **columns):
+        self.snapshots.append((room_code, seq, json.loads(json.dumps(game_state))))
+
+    def append_move(self, row):
+        self.moves.append(row)
+
+    def flush(self, room_codes=None):
+        pass
+
+    def pending(self, room_code):
+        return False
+
+    def discard(self, room_code, moves=False):
+        pass
+
+    def stats(self):
+        return {}
+
+    def stop(self):
+        pass
+
+
+@pytest.fixture
+def played():
+    noop = lambda *a, **k: None
+    server.initialize(SocketIO(Flask(__name__), async_mode='threading'), None, (noop, noop, noop, noop))
+    runner, server.bot_runner = server.bot_runner, BotRunner(None, 0, max_plies=200)
+    server.persister = RecordingPersister()
+    try:
+        yield server.persister
+    finally:
+        server.persister = None
+        server.bot_runner = runner
+        server.shutdown()
+
+
+def lying_choose_move(choose_move):
+    """Bot moves sent the way a tampered client would: wrong goal flag, claiming a win for the other side"""
+    def choose(self, *args):
+        move = choose_move(self, *args)
+        if move is not None:
+            move.update(reachedGoal=not move['reachedGoal'], gameOver=True, winner='nobody')
+        return move
+    return choose
+
+
+@pytest.mark.parametrize('lying', [False, True])
+def test_replayed_moves_rebuild_the_live_game(played, monkeypatch, lying):
+    if lying:
+        monkeypatch.setattr(Bot, 'choose_move', lying_choose_move(Bot.choose_move))
+    finished = 0
+    for _ in range(20):
+        room_code = server.open_bot_room(levels=('easy', 'normal'))
+        live = copy.deepcopy(server.rooms[room_code]['game_state'])
+        server.close_bot_room(room_code)
+        # The first snapshot is the one written when the dice decide who starts
+        seq, stored = next((seq, state) for code, seq, state in played.snapshots if code == room_code)
+        moves = [(row[1], row[2], row[4], row[5]) for row in played.moves if row[0] == room_code and row[1] > seq]
+        assert moves
+        assert replay_moves(stored, moves) == moves[-1][0]
+        assert stored == live
+        # ...and both follow from the board, whatever the client claimed
+        rules = server.rules
+        for color in ('orange', 'blue'):
+            for stone in live[f'{color}Stones']:
+                assert stone['reachedGoal'] == bool(rules.in_goal(color, rules.bit(stone['nodeId'])))
+        if live['gameOver']:
+            assert rules.is_win(live['winner'], rules.sides(live, live['winner'])[0])
+        finished += live['gameOver']
+        if finished:
+            break
+    assert finished, 'no game reached game over'
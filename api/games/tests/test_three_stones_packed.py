@@ -0,0 +1,102 @@
+"""
+Three Stones Packed Game State tests
+pack_game_state() / unpack_game_state() round trips and the states that must stay JSON
+"""
+
+import copy
+from itertools import combinations
+
+import pytest
+
+from ..three_stones_packed import (
+    pack_game_state, unpack_game_state, PACKED_NODES, PACKED_VERSION, NODE_SHIFT, WINNER_SHIFT
+)
+from ..three_stones_schema import SCHEMA_VERSION
+from ..three_stones_server import rules
+
+
+def canonical_states():
+    """A gameState for every stone placement, turn and outcome the packed form holds"""
+    for orange in combinations(PACKED_NODES, 3):
+        rest = [node for node in PACKED_NODES if node not in orange]
+        for blue in combinations(rest, 3):
+            for turn, winner in (('orange', None), ('blue', None), ('blue', 'orange'), ('orange', 'blue')):
+                state = rules.to_game_state(rules.mask(orange), rules.mask(blue), turn, winner)
+                state['schemaVersion'] = SCHEMA_VERSION
+                yield state
+
+
+def opening_state():
+    return {
+        'schemaVersion': SCHEMA_VERSION,
+        'orangeStones': [
+            {'id': 'orange-1', 'nodeId': '10', 'reachedGoal': False, 'number': 1},
+            {'id': 'orange-2', 'nodeId': '9', 'reachedGoal': False, 'number': 2},
+            {'id': 'orange-3', 'nodeId': '8', 'reachedGoal': False, 'number': 3}
+        ],
+        'blueStones': [
+            {'id': 'blue-1', 'nodeId': '5', 'reachedGoal': False, 'number': 1},
+            {'id': 'blue-2', 'nodeId': '6', 'reachedGoal': False, 'number': 2},
+            {'id': 'blue-3', 'nodeId': '7', 'reachedGoal': False, 'number': 3}
+        ],
+        'currentTurn': 'orange',
+        'gameOver': False,
+        'winner': None
+    }
+
+
+def test_round_trip_every_canonical_state():
+    seen = set()
+    for state in canonical_states():
+        packed = pack_game_state(state)
+        assert packed is not None
+        assert 0 <= packed < 1 << 63
+        assert unpack_game_state(packed) == state
+        seen.add(packed)
+    assert len(seen) == 120 * 35 * 4
+
+
+def test_reached_goal_flags_are_kept_as_sent():
+    state = opening_state()
+    state['orangeStones'][1]['reachedGoal'] = True
+    assert unpack_game_state(pack_game_state(state)) == state
+
+
+def test_stone_pixel_positions_are_dropped():
+    state = opening_state()
+    state['blueStones'][0].update(x=120.5, y=40)
+    expected = opening_state()
+    assert unpack_game_state(pack_game_state(state)) == expected
+
+
+def test_state_without_schema_version_unpacks_at_current_version():
+    state = opening_state()
+    del state['schemaVersion']
+    assert unpack_game_state(pack_game_state(state)) == opening_state()
+
+
+@pytest.mark.parametrize('change', [
+    lambda s: s.update(extra=1),
+    lambda s: s.update(currentTurn='green'),
+    lambda s: s.update(gameOver=1),
+    lambda s: s.update(winner='draw'),
+    lambda s: s['orangeStones'].pop(),
+    lambda s: s['orangeStones'].reverse(),
+    lambda s: s['blueStones'][0].update(nodeId='LT'),
+    lambda s: s['blueStones'][0].update(reachedGoal=None),
+    lambda s: s['blueStones'][0].update(label='a'),
+])
+def test_non_canonical_states_stay_json(change):
+    state = opening_state()
+    change(state)
+    assert pack_game_state(copy.deepcopy(state)) is None
+
+
+def test_unpack_rejects_unknown_formats():
+    packed = pack_game_state(opening_state())
+    with pytest.raises(ValueError):
+        unpack_game_state(packed & ~0xF | (PACKED_VERSION + 1))
+    with pytest.raises(ValueError):
+        unpack_game_state(packed | 3 << WINNER_SHIFT)
+    with pytest.raises(ValueError):
+        unpack_game_state(packed | 0xF << NODE_SHIFT)
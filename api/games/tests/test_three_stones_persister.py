@@ -0,0 +1,54 @@
+"""
+Three Stones Write-Behind Persister tests
+A flush stamps last_active_at with the write time, unless the room's own active_at was passed (eviction)
+"""
+
+from contextlib import contextmanager
+
+from .. import three_stones_persister
+from ..three_stones_persister import GameStatePersister
+
+
+class Connection:
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def commit(self):
+        pass
+
+
+class SessionPool:
+    """db_pool stand-in whose connections accept anything"""
+
+    @contextmanager
+    def session(self):
+        yield Connection()
+
+
+def flushed_rows(monkeypatch, marks):
+    rows = []
+    monkeypatch.setattr(three_stones_persister, 'execute_values',
+                        lambda cursor, sql, batch, template: rows.extend(batch))
+    persister = GameStatePersister(SessionPool())
+    for room_code, active_at in marks:
+        persister.mark_dirty(room_code, {'gameOver': False}, seq=1, active_at=active_at)
+    persister.flush()
+    return {row[0]: row[-1] for row in rows}
+
+
+def test_flush_keeps_an_evicted_rooms_idle_clock(monkeypatch):
+    assert flushed_rows(monkeypatch, [('PLAYED', None), ('EVICTED', 1700000000.0)]) == {
+        'PLAYED': None,  # NOW() in FLUSH_SQL
+        'EVICTED': 1700000000.0,
+    }
+
+
+def test_latest_mark_decides_last_active_at(monkeypatch):
+    assert flushed_rows(monkeypatch, [('ROOM', 1700000000.0), ('ROOM', None)]) == {'ROOM': None}
+    assert flushed_rows(monkeypatch, [('ROOM', None), ('ROOM', 1700000000.0)]) == {'ROOM': 1700000000.0}
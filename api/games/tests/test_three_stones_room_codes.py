@@ -0,0 +1,66 @@
+"""
+Three Stones Room Codes tests
+CodePermutation is a bijection between sequence numbers and codes, and the allocator never repeats a code
+"""
+
+import random
+
+import pytest
+
+from ..three_stones_room_codes import CodePermutation, RoomCodeAllocator, ALPHABET, CODE_LENGTH, CODE_SPACE
+
+
+def sample_numbers():
+    rng = random.Random(2026)
+    numbers = set(range(20000))
+    numbers.update(range(CODE_SPACE - 20000, CODE_SPACE))
+    numbers.update(rng.randrange(CODE_SPACE) for _ in range(20000))
+    return numbers
+
+
+def test_encode_decode_is_a_bijection():
+    permutation = CodePermutation('test-key')
+    codes = {}
+    for number in sample_numbers():
+        code = permutation.encode(number)
+        assert len(code) == CODE_LENGTH and set(code) <= set(ALPHABET)
+        assert permutation.decode(code) == number
+        assert codes.setdefault(code, number) == number
+    rng = random.Random(7)
+    for _ in range(20000):
+        code = ''.join(rng.choice(ALPHABET) for _ in range(CODE_LENGTH))
+        assert permutation.encode(permutation.decode(code)) == code
+
+
+def test_decode_accepts_lower_case():
+    permutation = CodePermutation('test-key')
+    code = permutation.encode(12345)
+    assert permutation.decode(code.lower()) == 12345
+
+
+def test_keys_give_different_codes():
+    first, second = CodePermutation('one'), CodePermutation(b'two')
+    assert [first.encode(n) for n in range(100)] != [second.encode(n) for n in range(100)]
+
+
+@pytest.mark.parametrize('number', [-1, CODE_SPACE])
+def test_encode_rejects_numbers_outside_the_space(number):
+    with pytest.raises(ValueError):
+        CodePermutation('test-key').encode(number)
+
+
+@pytest.mark.parametrize('code', ['ABC', 'ABCDEFG', 'ABC-EF', 'ABCDEÇ'])
+def test_decode_rejects_malformed_codes(code):
+    with pytest.raises(ValueError):
+        CodePermutation('test-key').decode(code)
+
+
+def test_allocator_never_repeats_a_code():
+    leased = iter(range(1000))
+    allocator = RoomCodeAllocator(CodePermutation('test-key'),
+                                  lease=lambda count: [next(leased) for _ in range(count)],
+                                  block_size=8, low_water=0)
+    codes = [allocator.next_code() for _ in range(200)]
+    assert len(set(codes)) == 200
+    # Blocks leased in the background may leave gaps, never repeats
+    assert all(allocator.permutation.decode(code) < 1000 for code in codes)
@@ -0,0 +1,54 @@
+"""
+Three Stones Timer Wheel tests
+Due tasks fire, cancelled ones do not, and a slow callback does not hold back the timers behind it
+"""
+
+import time
+import threading
+
+import pytest
+
+from ..three_stones_scheduler import TimerWheel
+
+
+@pytest.fixture
+def wheel():
+    wheel = TimerWheel(tick=0.01, workers=2)
+    wheel.start()
+    yield wheel
+    wheel.stop()
+
+
+def test_due_tasks_fire_and_cancelled_ones_do_not(wheel):
+    fired = threading.Event()
+    cancelled = threading.Event()
+    wheel.schedule(0.02, fired.set)
+    task = wheel.schedule(0.05, cancelled.set)
+    assert task.cancel()
+    assert fired.wait(1)
+    assert not cancelled.wait(0.1)
+    assert not task.cancel()
+    stats = wheel.stats()
+    assert stats['fired'] == 1 and stats['cancelled'] == 1 and stats['pending'] == 0
+
+
+def test_slow_callback_does_not_delay_later_timers(wheel):
+    release = threading.Event()
+    fired = threading.Event()
+    wheel.schedule(0.01, release.wait, 2)
+    wheel.schedule(0.03, fired.set)
+    try:
+        assert fired.wait(0.5)
+    finally:
+        release.set()
+
+
+def test_failing_callback_is_counted(wheel):
+    def fail():
+        raise RuntimeError('boom')
+
+    wheel.schedule(0.01, fail)
+    deadline = time.monotonic() + 1
+    while wheel.stats()['errors'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert wheel.stats()['errors'] == 1
@@ -0,0 +1,64 @@
+"""
+Three Stones Solver tests
+Spot values of the solved position table and the consistency of its best moves
+"""
+
+import pytest
+
+from ..three_stones_engine import COLORS
+from ..three_stones_server import rules
+from ..three_stones_solver import PositionTable, WIN, LOSS, DRAW
+
+
+@pytest.fixture(scope='module')
+def table():
+    return PositionTable(rules).solve()
+
+
+def test_opening_is_a_draw(table):
+    orange, blue = rules.mask(['10', '9', '8']), rules.mask(['5', '6', '7'])
+    for turn in COLORS:
+        assert table.lookup(orange, blue, turn)['result'] == 'draw'
+
+
+def test_win_in_one_is_found(table):
+    # Orange has 5 and 7; 1 -> 6 fills the goal
+    orange, blue = rules.mask(['5', '7', '1']), rules.mask(['10', '3', '2'])
+    hint = table.lookup(orange, blue, 'orange')
+    assert hint['result'] == 'win'
+    assert hint['distance'] == 1
+    assert hint['bestMove'] == {'fromNodeId': '1', 'toNodeId': '6'}
+    assert rules.is_win('orange', rules.move(orange, rules.bit('1'), rules.bit('6')))
+
+
+def test_side_to_move_has_lost_once_the_other_side_is_home(table):
+    orange, blue = rules.mask(['5', '6', '7']), rules.mask(['10', '4', '3'])
+    hint = table.lookup(orange, blue, 'blue')
+    assert hint['result'] == 'loss'
+    assert hint['distance'] == 0
+
+
+def test_best_moves_keep_the_result(table):
+    for turn in COLORS:
+        for orange in table.masks:
+            for blue in table.masks:
+                if orange & blue:
+                    continue
+                slot = table.index(orange, blue, turn)
+                result = table.results[slot]
+                own, other = table._sides(orange, blue, turn)
+                if result == LOSS or not rules.legal_moves(own, other):
+                    continue
+                from_bit = 1 << table.best[2 * slot]
+                to_bit = 1 << table.best[2 * slot + 1]
+                child = table._child(own, other, turn, from_bit, to_bit)
+                if result == WIN:
+                    assert table.results[child] == LOSS
+                    assert table.distances[child] == table.distances[slot] - 1
+                else:
+                    assert result == DRAW and table.results[child] == DRAW
+
+
+def test_unknown_positions_have_no_entry(table):
+    assert table.lookup(rules.mask(['10', '9']), rules.mask(['5', '6', '7']), 'orange') is None
+    assert table.lookup(rules.mask(['10', '9', '8']), rules.mask(['8', '6', '7']), 'orange') is None
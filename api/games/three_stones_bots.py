@@ -0,0 +1,140 @@
+"""
+Three Stones Bots
+Server-side opponents that pick moves from the solved position table
+"""
+
+import random
+import logging
+import threading
+from collections import deque
+
+from .three_stones_engine import OPPONENT
+
+logger = logging.getLogger(__name__)
+
+# Player IDs of bots start with this (never a Socket.IO sid)
+BOT_PREFIX = 'bot:'
+
+# Chance of consulting the solved table (take a forced win, never step into a lost position)
+# instead of picking from every legal move
+LEVELS = {'easy': 0.3, 'normal': 0.7, 'hard': 1.0}
+DEFAULT_LEVEL = 'normal'
+
+# Chance of heading for the goal among the candidate moves rather than picking one at random. Most
+# positions are draws, so a bot that only follows the table shuffles forever; always heading for the
+# goal jams the corridor just as well. A mix lets games between imperfect bots finish.
+GOAL_DRIVE = 0.6
+
+
+class Bot:
+    """One seated bot; choose_move() is a table lookup plus a stone search"""
+
+    __slots__ = ('player_id', 'level', 'rng', 'plies')
+
+    def __init__(self, player_id, level=DEFAULT_LEVEL, seed=None):
+        self.player_id = player_id
+        self.level = level if level in LEVELS else DEFAULT_LEVEL
+        self.rng = random.Random(seed)
+        self.plies = 0
+
+    def choose_move(self, rules, table, game_state, color):
+        """make_move payload for ``color`` in ``game_state``, or None if there is no legal move"""
+        own, other = rules.sides(game_state, color)
+        moves = rules.legal_moves(own, other)
+        if not moves:
+            return None
+        candidates = moves
+        if table is not None and self.rng.random() < LEVELS[self.level]:
+            candidates = self._table_moves(rules, table, own, other, color, moves)
+        if len(candidates) > 1 and self.rng.random() < GOAL_DRIVE:
+            distances = [rules.goal_distance(color, rules.move(own, *move)) for move in candidates]
+            nearest = min(distances)
+            candidates = [move for move, distance in zip(candidates, distances) if distance == nearest]
+        from_bit, to_bit = self.rng.choice(candidates)
+        stone = next(s for s in game_state[f'{color}Stones'] if rules.bit(s.get('nodeId')) == from_bit)
+        return {
+            'stoneId': stone['id'],
+            'fromNodeId': rules.node_id(from_bit),
+            'toNodeId': rules.node_id(to_bit),
+            'reachedGoal': bool(rules.in_goal(color, to_bit))
+        }
+
+    @staticmethod
+    def _table_moves(rules, table, own, other, color, moves):
+        """The solved best move when it wins (or the position is lost), else every move that keeps the draw"""
+        orange, blue = (own, other) if color == 'orange' else (other, own)
+        hint = table.lookup(orange, blue, color)
+        if not hint or not hint['bestMove']:
+            return moves
+        if hint['result'] != 'draw':
+            return [(rules.bit(hint['bestMove']['fromNodeId']), rules.bit(hint['bestMove']['toNodeId']))]
+        opponent = OPPONENT[color]
+        safe = []
+        for from_bit, to_bit in moves:
+            moved = rules.move(own, from_bit, to_bit)
+            child = table.lookup(moved, other, opponent) if color == 'orange' else table.lookup(other, moved, opponent)
+            if child and child['result'] != 'win':
+                safe.append((from_bit, to_bit))
+        return safe or moves
+
+
+class BotRunner:
+    """Runs bot actions for every room from one place.
+
+    With a scheduler and a think time, actions are delayed tasks on the shared
+    timer wheel (no thread per bot); they run, database writes included, on
+    the wheel's worker threads, never on the thread that keeps time. Without
+    them (headless soak runs, THREE_STONES_BOT_THINK=0) actions run inline
+    on the caller's thread: an action submitted while another is running,
+    from any thread, is queued behind it and run by the thread already
+    draining the queue, so a whole bot-vs-bot game plays out in one loop
+    instead of recursing move by move.
+    """
+
+    def __init__(self, scheduler=None, think_seconds=0.0, max_plies=400):
+        self.scheduler = scheduler
+        self.think_seconds = think_seconds
+        # A bot stops moving after this many plies when no human is seated (0 = unlimited)
+        self.max_plies = max_plies
+        self._inline = deque()
+        self._draining = False
+        self._lock = threading.Lock()  # guards _inline and _draining
+        self.submitted = 0
+        self.errors = 0
+
+    def submit(self, callback, *args):
+        self.submitted += 1
+        if self.scheduler is not None and self.think_seconds > 0:
+            return self.scheduler.schedule(self.think_seconds, callback, *args)
+        with self._lock:
+            self._inline.append((callback, args))
+            if self._draining:
+                return None
+            self._draining = True
+        try:
+            while True:
+                # Checking for more work and giving up the drain happen under one lock, so an action
+                # queued by another thread is either seen here or drained by that thread itself
+                with self._lock:
+                    if not self._inline:
+                        self._draining = False
+                        break
+                    callback, args = self._inline.popleft()
+                try:
+                    callback(*args)
+                except Exception:
+                    self.errors += 1
+                    logger.exception("Bot action failed")
+        except BaseException:
+            with self._lock:
+                self._draining = False
+            raise
+        return None
+
+    def stats(self):
+        return {
+            'think_seconds': self.think_seconds,
+            'submitted': self.submitted,
+            'errors': self.errors,
+            'inline_queue': len(self._inline)
+        }
@@ -0,0 +1,200 @@
+"""
+Three Stones Room Cache
+Bounded in-memory room dict: least recently used idle rooms are written out and dropped, and reloaded on next access
+"""
+
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+logger = logging.getLogger(__name__)
+
+
+class RoomCache(MutableMapping):
+    """The server's ``rooms`` dict, kept to ``capacity`` rooms in use order.
+
+    Plain reads (``rooms[code]``, ``rooms.get(code)``) do not change the
+    order; touch() marks a room as just used and lookup() does the same
+    while counting a hit or a miss. A room used while an eviction is writing
+    it out stays in the cache, so a handler that got it from lookup() never
+    changes a room that is already gone. An insert that takes the cache over
+    ``capacity`` only wakes the eviction thread (start()), so handlers never
+    wait on the database; that thread evicts rooms least recently used
+    first, skipping any that ``can_evict(code, room)`` refuses (players
+    inside, bots seated). ``evict(code, room)`` writes a room out before it
+    leaves, so load_room_from_db() finds it as it was. In-use rooms can hold
+    the cache over capacity for a while; they are evicted once they go
+    idle. A ``capacity`` of None never evicts on insert.
+    """
+
+    def __init__(self, capacity=None, can_evict=None, evict=None):
+        self.capacity = capacity
+        self.can_evict = can_evict or (lambda room_code, room: False)
+        self.evict = evict or (lambda room_code, room: None)
+        self._rooms = OrderedDict()  # {room_code: room}, least recently used first
+        self._uses = {}  # {room_code: number of the last touch() or lookup() hit}
+        self._use_clock = 0
+        self._lock = threading.RLock()
+        self._evicting = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'evict_errors': 0}
+
+    # --- dict interface ---
+
+    def __getitem__(self, room_code):
+        return self._rooms[room_code]
+
+    def get(self, room_code, default=None):
+        return self._rooms.get(room_code, default)
+
+    def __contains__(self, room_code):
+        return room_code in self._rooms
+
+    def __setitem__(self, room_code, room):
+        with self._lock:
+            self._rooms[room_code] = room
+            self._mark_used(room_code)
+            over = self.capacity is not None and len(self._rooms) > self.capacity
+        if over:
+            self._wakeup.set()
+
+    def __delitem__(self, room_code):
+        with self._lock:
+            del self._rooms[room_code]
+            self._uses.pop(room_code, None)
+
+    def pop(self, room_code, *default):
+        with self._lock:
+            self._uses.pop(room_code, None)
+            return self._rooms.pop(room_code, *default)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._uses.clear()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def __iter__(self):
+        # Snapshot: handlers on other threads may add or drop rooms while the caller iterates
+        with self._lock:
+            return iter(list(self._rooms))
+
+    def items(self):
+        with self._lock:
+            return list(self._rooms.items())
+
+    def values(self):
+        with self._lock:
+            return list(self._rooms.values())
+
+    # --- use order and eviction ---
+
+    def start(self):
+        """Evict on a background thread whenever an insert takes the cache over capacity"""
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                if self._stopped:
+                    break
+                try:
+                    self.shrink()
+                except Exception:
+                    logger.exception("Room cache eviction failed")
+
+        self._thread = threading.Thread(target=run, name='three-stones-room-cache', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._stopped or self._thread is None:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _mark_used(self, room_code):
+        # Caller holds self._lock
+        self._rooms.move_to_end(room_code)
+        self._use_clock += 1
+        self._uses[room_code] = self._use_clock
+
+    def touch(self, room_code):
+        """Mark a room as just used"""
+        with self._lock:
+            if room_code in self._rooms:
+                self._mark_used(room_code)
+
+    def lookup(self, room_code):
+        """The room if it is in memory (a hit, which also touches it), else None (a miss)"""
+        with self._lock:
+            room = self._rooms.get(room_code)
+            if room is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            self._mark_used(room_code)
+            return room
+
+    def shrink(self):
+        """Evict least recently used idle rooms until the cache is back within capacity"""
+        with self._evicting:
+            with self._lock:
+                if self.capacity is None:
+                    return 0
+                excess = len(self._rooms) - self.capacity
+                candidates = [(code, room, self._uses.get(code)) for code, room in self._rooms.items()]
+            return self._evict_from(candidates, excess) if excess > 0 else 0
+
+    def evict_idle(self, before):
+        """Evict every idle room whose ``active_at`` is older than ``before`` (epoch seconds)"""
+        with self._evicting:
+            with self._lock:
+                candidates = [(code, room, self._uses.get(code)) for code, room in self._rooms.items()
+                              if room.get('active_at', before) < before]
+            return self._evict_from(candidates, len(candidates))
+
+    def _evict_from(self, candidates, count):
+        evicted = 0
+        for room_code, room, used in candidates:
+            if evicted >= count:
+                break
+            if not self.can_evict(room_code, room):
+                continue
+            try:
+                self.evict(room_code, room)
+            except Exception:
+                # Keep the room rather than lose state that never reached the database
+                logger.exception("Evicting room %s failed", room_code)
+                with self._lock:
+                    self._stats['evict_errors'] += 1
+                continue
+            with self._lock:
+                # Written out before it leaves; skip it if it was replaced, looked up or used meanwhile
+                if (self._rooms.get(room_code) is not room or self._uses.get(room_code) != used
+                        or not self.can_evict(room_code, room)):
+                    continue
+                del self._rooms[room_code]
+                del self._uses[room_code]
+                self._stats['evictions'] += 1
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._rooms)
+        snapshot['capacity'] = self.capacity
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = snapshot['hits'] / lookups if lookups else 0.0
+        return snapshot
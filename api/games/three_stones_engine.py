@@ -0,0 +1,182 @@
+"""
+Three Stones Rules Engine
+Bitboard legality checks, move generation and stalemate/win detection compiled from the board graph
+"""
+
+COLORS = ('orange', 'blue')
+OPPONENT = {'orange': 'blue', 'blue': 'orange'}
+
+# Reasons check_move() gives for an illegal move
+NOT_OWN_STONE = 'not_own_stone'
+NOT_NEIGHBOR = 'not_neighbor'
+OCCUPIED = 'occupied'
+BLOCKS_OPPONENT = 'blocks_opponent'
+
+
+class RulesEngine:
+    """Three Stones rules on integer bitboards.
+
+    Node ``node_ids[i]`` is bit ``1 << i`` and each side's stones are one int
+    with a bit per occupied node. The board graph is compiled once into a
+    neighbor mask per node and, for every set of nodes, the union of their
+    neighbors (``reach``), so whether a side can move at all is one table
+    lookup and a mask test instead of a scan over stone dicts.
+    """
+
+    def __init__(self, board_nodes, goals, legacy_ids=None):
+        self.node_ids = tuple(board_nodes)
+        self.bits = {node_id: 1 << i for i, node_id in enumerate(self.node_ids)}
+        # Old saved states still use named node IDs (LT, RM, ...)
+        for old_id, node_id in (legacy_ids or {}).items():
+            if node_id in self.bits:
+                self.bits.setdefault(old_id, self.bits[node_id])
+        self.neighbor_masks = tuple(self.mask(board_nodes[node_id]['neighbors']) for node_id in self.node_ids)
+        size = 1 << len(self.node_ids)
+        reach = [0] * size
+        for nodes in range(1, size):
+            lowest = nodes & -nodes
+            reach[nodes] = reach[nodes ^ lowest] | self.neighbor_masks[lowest.bit_length() - 1]
+        self.reach = tuple(reach)
+        self.goal_masks = {color: self.mask(goals[color]) for color in COLORS}
+        # Steps from each node (by index) to the nearest goal node of each color
+        self.goal_steps = {color: self._steps_from(self.goal_masks[color]) for color in COLORS}
+
+    def _steps_from(self, nodes):
+        steps = [None] * len(self.node_ids)
+        frontier, seen, distance = nodes, nodes, 0
+        while frontier:
+            reached = frontier
+            while reached:
+                bit = reached & -reached
+                reached ^= bit
+                steps[bit.bit_length() - 1] = distance
+            frontier = self.reach[frontier] & ~seen
+            seen |= frontier
+            distance += 1
+        return tuple(steps)
+
+    # Node IDs <-> bits
+
+    def bit(self, node_id):
+        """Bit for a node ID (current or legacy), 0 if it is not on the board"""
+        bit = self.bits.get(node_id)
+        if bit is None:
+            # Numeric IDs sent as numbers
+            return self.bits.get(str(node_id), 0) if node_id is not None else 0
+        return bit
+
+    def mask(self, node_ids):
+        result = 0
+        for node_id in node_ids:
+            result |= self.bit(node_id)
+        return result
+
+    def node_id(self, bit):
+        return self.node_ids[bit.bit_length() - 1]
+
+    def node_list(self, nodes):
+        """Node IDs of the set bits, in board order"""
+        return [node_id for i, node_id in enumerate(self.node_ids) if nodes >> i & 1]
+
+    # Rules
+
+    def has_moves(self, own, other):
+        """True if a side with stones on ``own`` has at least one empty neighbor to move to"""
+        return bool(self.reach[own] & ~(own | other))
+
+    def check_move(self, own, other, from_bit, to_bit):
+        """None if moving ``from_bit`` -> ``to_bit`` is legal for the side on ``own``, else the reason"""
+        if not from_bit & own:
+            return NOT_OWN_STONE
+        if not self.neighbor_masks[from_bit.bit_length() - 1] & to_bit:
+            return NOT_NEIGHBOR
+        if to_bit & (own | other):
+            return OCCUPIED
+        # A move may never leave the opponent without a move
+        if not self.has_moves(other, (own & ~from_bit) | to_bit):
+            return BLOCKS_OPPONENT
+        return None
+
+    @staticmethod
+    def move(own, from_bit, to_bit):
+        return (own & ~from_bit) | to_bit
+
+    def legal_moves(self, own, other):
+        """[(from_bit, to_bit)] for every legal move of the side on ``own``"""
+        moves = []
+        empty = ~(own | other)
+        stones = own
+        while stones:
+            from_bit = stones & -stones
+            stones ^= from_bit
+            targets = self.neighbor_masks[from_bit.bit_length() - 1] & empty
+            while targets:
+                to_bit = targets & -targets
+                targets ^= to_bit
+                if self.has_moves(other, (own & ~from_bit) | to_bit):
+                    moves.append((from_bit, to_bit))
+        return moves
+
+    def is_stalemate(self, own, other):
+        """True if the side to move (on ``own``) has no legal move"""
+        return not self.legal_moves(own, other)
+
+    def in_goal(self, color, nodes):
+        return nodes & self.goal_masks[color]
+
+    def goal_distance(self, color, own):
+        """Total steps the stones of ``color`` on ``own`` are from their goal (0 once it has won)"""
+        steps = self.goal_steps[color]
+        total = 0
+        while own:
+            bit = own & -own
+            own ^= bit
+            total += steps[bit.bit_length() - 1]
+        return total
+
+    def is_win(self, color, own):
+        """True if every stone of ``color`` stands on one of its goal nodes"""
+        return bool(own) and not own & ~self.goal_masks[color]
+
+    # gameState JSON <-> bitboards
+
+    def stones_mask(self, stones):
+        bit = self.bit
+        result = 0
+        for stone in stones:
+            result |= bit(stone.get('nodeId'))
+        return result
+
+    def position(self, game_state):
+        """(orange, blue) bitboards of a gameState dict"""
+        return (self.stones_mask(game_state.get('orangeStones', [])),
+                self.stones_mask(game_state.get('blueStones', [])))
+
+    def sides(self, game_state, color):
+        """(own, other) bitboards from the point of view of ``color``"""
+        orange, blue = self.position(game_state)
+        return (orange, blue) if color == 'orange' else (blue, orange)
+
+    def to_game_state(self, orange, blue, current_turn, winner=None):
+        """New gameState dict for a position; stones are numbered in board order"""
+        state = {'currentTurn': current_turn, 'gameOver': winner is not None, 'winner': winner}
+        for color, nodes in (('orange', orange), ('blue', blue)):
+            state[f'{color}Stones'] = [
+                {
+                    'id': f'{color}-{number}',
+                    'nodeId': node_id,
+                    'reachedGoal': bool(self.bit(node_id) & self.goal_masks[color]),
+                    'number': number
+                }
+                for number, node_id in enumerate(self.node_list(nodes), start=1)
+            ]
+        return state
+
+    def apply_to_game_state(self, game_state, color, from_bit, to_bit):
+        """Move the stone of ``color`` standing on ``from_bit`` in a gameState dict; returns the stone or None"""
+        for stone in game_state.get(f'{color}Stones', []):
+            if self.bit(stone.get('nodeId')) == from_bit:
+                stone['nodeId'] = self.node_id(to_bit)
+                stone['reachedGoal'] = bool(to_bit & self.goal_masks[color])
+                return stone
+        return None
@@ -0,0 +1,187 @@
+"""
+Three Stones Room Lifecycle
+TTLs for empty, abandoned and finished rooms, and a background sweeper that archives expired rooms in bounded batches
+"""
+
+import atexit
+import logging
+import threading
+
+from psycopg2.extras import execute_values
+
+from .three_stones_packed import GAME_OVER_SHIFT
+
+logger = logging.getLogger(__name__)
+
+# Why a room expired (three_stones_rooms_archive.archive_reason)
+EMPTY = 'empty'          # no game started
+ABANDONED = 'abandoned'  # game started but nobody finished it
+FINISHED = 'finished'    # game over
+REASONS = (EMPTY, ABANDONED, FINISHED)
+
+# Rooms only the database knows about, idle past their TTL, oldest first. gameOver is only cast when it is a
+# JSON boolean, so one malformed stored state cannot make every sweep fail
+EXPIRED_ROOMS_SQL = f"""
+    SELECT room_code, reason
+    FROM (
+        SELECT room_code, COALESCE(last_active_at, created_at) AS active_at,
+               CASE
+                   WHEN COALESCE(CASE WHEN jsonb_typeof(game_state->'gameOver') = 'boolean'
+                                      THEN (game_state->>'gameOver')::boolean
+                                 END,
+                                 game_state_packed >> {GAME_OVER_SHIFT} & 1 = 1, FALSE) THEN '{FINISHED}'
+                   WHEN started THEN '{ABANDONED}'
+                   ELSE '{EMPTY}'
+               END AS reason
+        FROM three_stones_rooms
+        WHERE COALESCE(last_active_at, created_at) < NOW() - %(min_ttl)s * INTERVAL '1 second'
+    ) r
+    WHERE active_at < NOW() - CASE reason
+                                 WHEN '{FINISHED}' THEN %({FINISHED})s
+                                 WHEN '{ABANDONED}' THEN %({ABANDONED})s
+                                 ELSE %({EMPTY})s
+                             END * INTERVAL '1 second'
+    AND room_code <> ALL(%(skip)s)
+    ORDER BY active_at
+    LIMIT %(limit)s
+"""
+
+# One statement per batch: the rooms leave three_stones_rooms (their moves go with them through the
+# foreign key) and land, with their moves, in the archive tables
+ARCHIVE_SQL = """
+    WITH expired(room_code, reason) AS (VALUES %s),
+    archived AS (
+        DELETE FROM three_stones_rooms r
+        USING expired e
+        WHERE r.room_code = e.room_code
+        RETURNING r.id, r.room_code, r.room_name, r.creator_user_id, r.orange_player_id, r.blue_player_id,
+                  r.game_state, r.game_state_packed, r.game_state_seq, r.started, r.created_at, r.started_at,
+                  COALESCE(r.last_active_at, r.created_at) AS last_active_at, e.reason
+    ),
+    archived_moves AS (
+        INSERT INTO three_stones_moves_archive (room_id, seq, stone_id, from_node, to_node, flags, created_at)
+        SELECT a.id, m.seq, m.stone_id, m.from_node, m.to_node, m.flags, m.created_at
+        FROM three_stones_moves m
+        JOIN archived a ON a.room_code = m.room_code
+    )
+    INSERT INTO three_stones_rooms_archive
+        (id, room_code, room_name, creator_user_id, orange_player_id, blue_player_id, game_state,
+         game_state_packed, game_state_seq, started, created_at, started_at, last_active_at, archive_reason)
+    SELECT id, room_code, room_name, creator_user_id, orange_player_id, blue_player_id, game_state,
+           game_state_packed, game_state_seq, started, created_at, started_at, last_active_at, reason
+    FROM archived
+    RETURNING room_code, archive_reason
+"""
+
+
+def room_reason(game_state, started):
+    """Which TTL applies to a room nobody is in"""
+    if game_state and game_state.get('gameOver') is True:
+        return FINISHED
+    return ABANDONED if started else EMPTY
+
+
+class RoomLifecycle:
+    """Archives rooms nobody uses once they have been idle longer than their TTL.
+
+    The caller's ``sweep`` decides which in-memory rooms have expired (memory
+    knows who is connected) and asks expired_in_db() for rooms that exist
+    only in the database; archive() moves a batch of either kind to the
+    history tables in one transaction. Without a database only memory is
+    swept. A background thread runs ``sweep``
+    every ``interval`` seconds, and the timings and counts of every pass
+    are kept for the metrics endpoint.
+    """
+
+    def __init__(self, db_pool, ttls, batch_size=200, max_batches=10):
+        self.db_pool = db_pool
+        self.ttls = dict(ttls)  # {reason: seconds}
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # per sweep, so one pass never runs unbounded
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._stats = {
+            'sweeps': 0,
+            'errors': 0,
+            'archived': {reason: 0 for reason in REASONS},
+            'last_archived': 0,
+            'last_sweep_seconds': 0.0,
+            'max_sweep_seconds': 0.0,
+            'total_sweep_seconds': 0.0
+        }
+
+    def expired(self, reason, idle_seconds):
+        return idle_seconds >= self.ttls[reason]
+
+    def start(self, sweep, interval=60.0):
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stopped:
+                self._wakeup.wait(interval)
+                if self._stopped:
+                    break
+                try:
+                    sweep()
+                except Exception:
+                    logger.exception("Room sweep failed")
+                    with self._lock:
+                        self._stats['errors'] += 1
+
+        self._thread = threading.Thread(target=run, name='three-stones-sweeper', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def expired_in_db(self, skip_codes, limit):
+        """[(room_code, reason)] of database rooms past their TTL, skipping the codes memory decides"""
+        if not self.db_pool:
+            return []
+        params = {reason: self.ttls[reason] for reason in REASONS}
+        params.update(min_ttl=min(self.ttls.values()), skip=list(skip_codes), limit=limit)
+        with self.db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute(EXPIRED_ROOMS_SQL, params)
+            return cursor.fetchall()
+
+    def archive(self, expired):
+        """Move [(room_code, reason)] to the archive tables; returns the (room_code, reason) rows archived"""
+        if not expired:
+            return []
+        if not self.db_pool:
+            # Memory-only server: dropping the rooms from memory was all there was to do
+            return list(expired)
+        with self.db_pool.session() as conn:
+            with conn.cursor() as cursor:
+                archived = execute_values(cursor, ARCHIVE_SQL, expired, page_size=len(expired), fetch=True)
+            conn.commit()
+        return archived
+
+    def record(self, archived, seconds):
+        """Count one finished sweep: [(room_code, reason)] archived and how long it took"""
+        with self._lock:
+            stats = self._stats
+            stats['sweeps'] += 1
+            for _, reason in archived:
+                stats['archived'][reason] = stats['archived'].get(reason, 0) + 1
+            stats['last_archived'] = len(archived)
+            stats['last_sweep_seconds'] = seconds
+            stats['max_sweep_seconds'] = max(stats['max_sweep_seconds'], seconds)
+            stats['total_sweep_seconds'] += seconds
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['archived'] = dict(self._stats['archived'])
+        snapshot['ttls'] = dict(self.ttls)
+        snapshot['avg_sweep_seconds'] = snapshot['total_sweep_seconds'] / (snapshot['sweeps'] or 1)
+        return snapshot
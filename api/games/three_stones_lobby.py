@@ -0,0 +1,256 @@
+"""
+Three Stones Lobby Index
+In-memory metadata for every listed room so the lobby is built without database queries,
+plus a versioned broadcaster that sends coalesced lobby deltas to lobby subscribers
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Socket.IO room holding every client that is looking at the lobby
+LOBBY_ROOM = 'lobby'
+
+LOBBY_INDEX_SQL = """
+    SELECT r.room_code, r.room_name, r.password_hash IS NOT NULL, r.started,
+           r.creator_socket_id, r.creator_user_id, u.username
+    FROM three_stones_rooms r
+    LEFT JOIN users u ON u.id = r.creator_user_id
+    WHERE r.game_over = FALSE
+    ORDER BY r.created_at ASC
+"""
+# Rows per round trip when LOBBY_INDEX_SQL is read through a server-side cursor at boot
+LOBBY_INDEX_ITERSIZE = 2000
+
+
+class LobbyIndex:
+    """Room metadata keyed by room code, kept in creation order.
+
+    Entries hold what the lobby shows about a room that does not change with
+    every player action (name, password flag, creator); live values such as
+    player counts are read from the in-memory room when one exists.
+    """
+
+    FIELDS = ('name', 'hasPassword', 'started', 'creatorSocketId', 'creatorUserId', 'creatorUsername')
+
+    def __init__(self):
+        self._entries = {}  # {room_code: {field: value}}, oldest first
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        """Replace the index with rows from LOBBY_INDEX_SQL (any iterable, e.g. a server-side cursor); returns the count"""
+        entries = {}
+        for room_code, name, has_password, started, creator_socket_id, creator_user_id, creator_username in rows:
+            entries[room_code] = {
+                'name': name or room_code,
+                'hasPassword': bool(has_password),
+                'started': bool(started),
+                'creatorSocketId': creator_socket_id,
+                'creatorUserId': creator_user_id,
+                'creatorUsername': creator_username
+            }
+        with self._lock:
+            self._entries = entries
+        return len(entries)
+
+    def add(self, room_code, name, has_password, creator_socket_id,
+            creator_user_id=None, creator_username=None, started=False):
+        """Add a room (or replace its metadata) as the newest entry"""
+        with self._lock:
+            self._entries.pop(room_code, None)
+            self._entries[room_code] = {
+                'name': name or room_code,
+                'hasPassword': bool(has_password),
+                'started': bool(started),
+                'creatorSocketId': creator_socket_id,
+                'creatorUserId': creator_user_id,
+                'creatorUsername': creator_username
+            }
+
+    def ensure(self, room_code, **fields):
+        """Add a room with the given metadata unless it is already indexed"""
+        with self._lock:
+            if room_code in self._entries:
+                return
+        self.add(
+            room_code,
+            fields.get('name'),
+            fields.get('hasPassword'),
+            fields.get('creatorSocketId'),
+            fields.get('creatorUserId'),
+            fields.get('creatorUsername'),
+            fields.get('started', False)
+        )
+
+    def update(self, room_code, **fields):
+        with self._lock:
+            entry = self._entries.get(room_code)
+            if entry is not None:
+                entry.update((k, v) for k, v in fields.items() if k in self.FIELDS)
+
+    def remove(self, room_code):
+        with self._lock:
+            return self._entries.pop(room_code, None) is not None
+
+    def get(self, room_code):
+        with self._lock:
+            entry = self._entries.get(room_code)
+            return dict(entry) if entry is not None else None
+
+    def newest_first(self):
+        """[(room_code, entry), ...] ordered newest room first"""
+        with self._lock:
+            return [(code, self._entries[code]) for code in reversed(self._entries)]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, room_code):
+        return room_code in self._entries
+
+
+class LobbyBroadcaster:
+    """Single thread that turns lobby changes into versioned ``lobby_delta`` events.
+
+    Handlers call touch(room_code); changes arriving within ``window`` seconds
+    are merged into one delta listing added rows, updated rows and removed
+    codes. Every delta bumps ``version`` by one, so a client that sees a jump
+    knows it missed something and asks for a full snapshot instead.
+    """
+
+    def __init__(self, index, build_row, emit, window=0.1):
+        self.index = index
+        self.build_row = build_row  # callable(room_code, entry) -> row dict
+        self.emit = emit  # callable(event, payload)
+        self.window = window
+        self.version = 0
+        self._rows = {}  # {room_code: row} as last announced
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {'deltas': 0, 'changes': 0, 'snapshots': 0}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='three-stones-lobby', daemon=True)
+        self._thread.start()
+
+    def prime(self):
+        """Record the current rows as already announced (after loading the index)"""
+        with self._cond:
+            self._rows = {code: self.build_row(code, entry) for code, entry in self.index.newest_first()}
+
+    def touch(self, room_code):
+        """Note that a room's lobby row may have changed"""
+        with self._cond:
+            self._pending.add(room_code)
+            self._cond.notify()
+
+    def snapshot(self, build_rooms):
+        """Full room list tagged with the last announced version.
+
+        The version is read before the rows are built, so the rows are never
+        older than the version; a later delta re-applying a change the
+        snapshot already contains is harmless because deltas are upserts.
+        """
+        with self._cond:
+            self._stats['snapshots'] += 1
+            version = self.version
+        return {'rooms': build_rooms(), 'version': version}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Let a burst of changes accumulate before diffing
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Lobby delta broadcast failed")
+
+    def flush(self):
+        """Diff pending rooms against what was last announced and emit one delta"""
+        with self._cond:
+            codes, self._pending = self._pending, set()
+            added, updated, removed = [], [], []
+            for room_code in codes:
+                entry = self.index.get(room_code)
+                row = self.build_row(room_code, entry) if entry is not None else None
+                previous = self._rows.get(room_code)
+                if row is None:
+                    if previous is not None:
+                        del self._rows[room_code]
+                        removed.append(room_code)
+                    continue
+                if previous is None:
+                    added.append(row)
+                elif row != previous:
+                    updated.append(row)
+                else:
+                    continue
+                self._rows[room_code] = row
+            if not (added or updated or removed):
+                return None
+            self.version += 1
+            payload = {
+                'version': self.version,
+                'added': added,
+                'updated': updated,
+                'removed': removed
+            }
+            self._stats['deltas'] += 1
+            self._stats['changes'] += len(added) + len(updated) + len(removed)
+        self.emit('lobby_delta', payload)
+        return payload
+
+    def stats(self):
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['version'] = self.version
+            snapshot['pending'] = len(self._pending)
+        return snapshot
+
+
+class LobbySubscribers:
+    """Socket ids currently subscribed to the lobby room, with join/leave counters"""
+
+    def __init__(self):
+        self._sids = set()
+        self._lock = threading.Lock()
+        self._stats = {'subscribes': 0, 'unsubscribes': 0, 'peak': 0}
+
+    def add(self, sid):
+        """Record a subscription; returns False if the socket was already subscribed"""
+        with self._lock:
+            if sid in self._sids:
+                return False
+            self._sids.add(sid)
+            self._stats['subscribes'] += 1
+            self._stats['peak'] = max(self._stats['peak'], len(self._sids))
+            return True
+
+    def discard(self, sid):
+        """Forget a subscription; returns False if the socket was not subscribed"""
+        with self._lock:
+            if sid not in self._sids:
+                return False
+            self._sids.remove(sid)
+            self._stats['unsubscribes'] += 1
+            return True
+
+    def __len__(self):
+        return len(self._sids)
+
+    def __contains__(self, sid):
+        return sid in self._sids
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['subscribers'] = len(self._sids)
+        return snapshot
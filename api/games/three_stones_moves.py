@@ -0,0 +1,101 @@
+"""
+Three Stones Move Log
+Append-only three_stones_moves rows: batched inserts, state rebuilt from snapshot plus moves, and paged match replay
+"""
+
+from psycopg2.extras import execute_values
+
+from .three_stones_protocol import FLAG_REACHED_GOAL, FLAG_GAME_OVER
+
+# Rows for rooms that are already gone are dropped, and a batch retried after an error never duplicates a move
+INSERT_MOVES_SQL = """
+    INSERT INTO three_stones_moves (room_code, seq, stone_id, from_node, to_node, flags, created_at)
+    SELECT v.room_code, v.seq, v.stone_id, v.from_node, v.to_node, v.flags, v.created_at
+    FROM (VALUES %s) AS v(room_code, seq, stone_id, from_node, to_node, flags, created_at)
+    WHERE EXISTS (SELECT 1 FROM three_stones_rooms r WHERE r.room_code = v.room_code)
+    ON CONFLICT (room_code, seq) DO NOTHING
+"""
+INSERT_MOVES_TEMPLATE = "(%s, %s::int, %s, %s, %s, %s::smallint, %s::timestamp)"
+
+MOVES_AFTER_SQL = """
+    SELECT seq, stone_id, to_node, flags
+    FROM three_stones_moves
+    WHERE room_code = %s AND seq > %s
+    ORDER BY seq
+"""
+
+MOVES_PAGE_SQL = """
+    SELECT seq, stone_id, from_node, to_node, flags, created_at
+    FROM three_stones_moves
+    WHERE room_code = %s AND seq > %s
+    ORDER BY seq
+    LIMIT %s
+"""
+
+# Largest page the replay endpoint hands out
+MAX_PAGE_SIZE = 1000
+
+
+def move_row(room_code, delta, created_at):
+    """three_stones_moves row for a move_made payload that record_event() has given its seq"""
+    return (room_code, delta['seq'], delta['stoneId'], delta['from'], delta['to'], delta['flags'], created_at)
+
+
+def insert_moves(cursor, rows, page_size=500):
+    execute_values(cursor, INSERT_MOVES_SQL, rows, template=INSERT_MOVES_TEMPLATE, page_size=page_size)
+
+
+def apply_move(game_state, stone_id, to_node, flags):
+    """Replay one logged move onto a gameState dict.
+
+    Every field is set, never toggled, so replaying moves onto a snapshot
+    that already includes some of them still ends in the same position.
+    """
+    color = stone_id.split('-', 1)[0]
+    for stone in game_state.get(f'{color}Stones') or ():
+        if stone.get('id') == stone_id:
+            stone['nodeId'] = to_node
+            stone['reachedGoal'] = bool(flags & FLAG_REACHED_GOAL)
+            break
+    if flags & FLAG_GAME_OVER:
+        # Only the side that just moved can end the game
+        game_state['gameOver'] = True
+        game_state['winner'] = color
+    else:
+        game_state['currentTurn'] = 'blue' if color == 'orange' else 'orange'
+
+
+def replay_moves(game_state, moves):
+    """Apply (seq, stone_id, to_node, flags) rows in seq order; returns the last seq, or None if there were none"""
+    seq = None
+    for seq, stone_id, to_node, flags in moves:
+        if game_state is not None:
+            apply_move(game_state, stone_id, to_node, flags)
+    return seq
+
+
+def iter_move_pages(db_pool, room_code, after=0, page_size=500):
+    """Yield a match's moves page by page (keyset on seq), each page on a connection held only while it is read"""
+    while True:
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute(MOVES_PAGE_SQL, (room_code, after, page_size))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+        if len(rows) < page_size:
+            return
+
+
+def move_record(row):
+    """JSON-ready dict of a MOVES_PAGE_SQL row, keyed like a move_made payload"""
+    seq, stone_id, from_node, to_node, flags, created_at = row
+    return {
+        'seq': seq,
+        'stoneId': stone_id,
+        'from': from_node,
+        'to': to_node,
+        'flags': flags,
+        'at': created_at.isoformat() if created_at else None
+    }
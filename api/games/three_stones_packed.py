@@ -0,0 +1,133 @@
+"""
+Three Stones Packed Game State
+Canonical gameState packed into one integer for three_stones_rooms.game_state_packed, and its SQL JSON view
+"""
+
+from .three_stones_schema import SCHEMA_VERSION
+
+# Format of the packed integer, in its low 4 bits
+PACKED_VERSION = 1
+
+# Node index -> node ID. Stored rows depend on this order: never reorder, only append
+PACKED_NODES = ('1', '2', '3', '4', '5', '6', '7', '8', '9', '10')
+NODE_INDEX = {node_id: i for i, node_id in enumerate(PACKED_NODES)}
+
+COLORS = ('orange', 'blue')
+STONES_PER_SIDE = 3
+WINNERS = (None, 'orange', 'blue')
+
+# Bit layout (bit 0 = least significant), 38 bits so it fits a signed BIGINT:
+#   0-3    PACKED_VERSION
+#   4-27   node index of orange-1..3 then blue-1..3, 4 bits each
+#   28-33  reachedGoal of the same six stones
+#   34     currentTurn (0 orange, 1 blue)
+#   35     gameOver
+#   36-37  winner (index into WINNERS)
+NODE_SHIFT = 4
+GOAL_SHIFT = 28
+TURN_SHIFT = 34
+GAME_OVER_SHIFT = 35
+WINNER_SHIFT = 36
+
+# Anything else in a gameState (or a stone) has no place in the packed form, so such states stay JSON.
+# Stone x/y are client pixel positions; clients place stones from nodeId.
+STATE_KEYS = frozenset(('schemaVersion', 'orangeStones', 'blueStones', 'currentTurn', 'gameOver', 'winner'))
+STONE_KEYS = frozenset(('id', 'nodeId', 'reachedGoal', 'number', 'x', 'y'))
+
+# (stones key, ((slot, stone id, number), ...)) per side, in packed slot order
+SIDES = tuple(
+    (f'{color}Stones', tuple((side * STONES_PER_SIDE + number - 1, f'{color}-{number}', number)
+                             for number in range(1, STONES_PER_SIDE + 1)))
+    for side, color in enumerate(COLORS)
+)
+TURN_BITS = {color: i << TURN_SHIFT for i, color in enumerate(COLORS)}
+WINNER_BITS = {winner: i << WINNER_SHIFT for i, winner in enumerate(WINNERS)}
+
+
+def pack_game_state(game_state):
+    """The gameState as one int, or None if it is not in the canonical shape the packed form holds"""
+    if not isinstance(game_state, dict) or not STATE_KEYS.issuperset(game_state):
+        return None
+    turn = TURN_BITS.get(game_state.get('currentTurn'))
+    winner = WINNER_BITS.get(game_state.get('winner'))
+    game_over = game_state.get('gameOver')
+    if turn is None or winner is None or game_over is not True and game_over is not False:
+        return None
+    packed = PACKED_VERSION | turn | winner | game_over << GAME_OVER_SHIFT
+    for key, slots in SIDES:
+        stones = game_state.get(key)
+        if type(stones) is not list or len(stones) != STONES_PER_SIDE:
+            return None
+        for stone, (slot, stone_id, number) in zip(stones, slots):
+            if (type(stone) is not dict or stone.get('id') != stone_id or stone.get('number') != number
+                    or not STONE_KEYS.issuperset(stone)):
+                return None
+            index = NODE_INDEX.get(stone.get('nodeId'))
+            reached_goal = stone.get('reachedGoal')
+            if index is None or reached_goal is not True and reached_goal is not False:
+                return None
+            packed |= index << (NODE_SHIFT + 4 * slot) | reached_goal << (GOAL_SHIFT + slot)
+    return packed
+
+
+def unpack_game_state(packed):
+    """gameState dict of a packed int; raises ValueError for a format this server does not read"""
+    if packed & 0xF != PACKED_VERSION:
+        raise ValueError(f'unknown packed game state version {packed & 0xF}')
+    winner = packed >> WINNER_SHIFT & 3
+    if winner >= len(WINNERS):
+        raise ValueError(f'unknown winner {winner}')
+    state = {'schemaVersion': SCHEMA_VERSION}
+    for key, slots in SIDES:
+        stones = state[key] = []
+        for slot, stone_id, number in slots:
+            index = packed >> (NODE_SHIFT + 4 * slot) & 0xF
+            if index >= len(PACKED_NODES):
+                raise ValueError(f'node index {index} is not on the board')
+            stones.append({
+                'id': stone_id,
+                'nodeId': PACKED_NODES[index],
+                'reachedGoal': bool(packed >> (GOAL_SHIFT + slot) & 1),
+                'number': number
+            })
+    state['currentTurn'] = COLORS[packed >> TURN_SHIFT & 1]
+    state['gameOver'] = bool(packed >> GAME_OVER_SHIFT & 1)
+    state['winner'] = WINNERS[winner]
+    return state
+
+
+def _sql_stones(color, first_slot):
+    nodes = ', '.join(f"'{node_id}'" for node_id in PACKED_NODES)
+    return f"""(
+                SELECT jsonb_agg(jsonb_build_object(
+                    'id', '{color}-' || n,
+                    'nodeId', (ARRAY[{nodes}])[(packed >> ({NODE_SHIFT + 4 * (first_slot - 1)} + 4 * n) & 15)::int + 1],
+                    'reachedGoal', (packed >> ({GOAL_SHIFT + first_slot - 1} + n) & 1) = 1,
+                    'number', n
+                ) ORDER BY n)
+                FROM generate_series(1, {STONES_PER_SIDE}) AS n
+            )"""
+
+
+# SQL twin of unpack_game_state() for ad-hoc queries and tooling; three_stones_rooms_state shows every
+# row's gameState as JSON whichever column holds it
+PACKED_STATE_SQL = f"""
+    CREATE OR REPLACE FUNCTION three_stones_unpack_state(packed BIGINT) RETURNS JSONB
+    LANGUAGE SQL IMMUTABLE STRICT AS $$
+        SELECT jsonb_build_object(
+            'schemaVersion', {SCHEMA_VERSION},
+            'orangeStones', {_sql_stones('orange', 0)},
+            'blueStones', {_sql_stones('blue', STONES_PER_SIDE)},
+            'currentTurn', CASE WHEN packed >> {TURN_SHIFT} & 1 = 1 THEN 'blue' ELSE 'orange' END,
+            'gameOver', packed >> {GAME_OVER_SHIFT} & 1 = 1,
+            'winner', (ARRAY[NULL, 'orange', 'blue'])[(packed >> {WINNER_SHIFT} & 3)::int + 1]
+        )
+        WHERE packed & 15 = {PACKED_VERSION}
+    $$;
+
+    CREATE OR REPLACE VIEW three_stones_rooms_state AS
+    SELECT id, room_code, room_name,
+           COALESCE(three_stones_unpack_state(game_state_packed), game_state) AS game_state,
+           started, game_over, winner, created_at, started_at, ended_at
+    FROM three_stones_rooms;
+"""
@@ -0,0 +1,258 @@
+"""
+Three Stones Write-Behind Persister
+Coalesces game_state updates per room and flushes them, with the queued move log rows, to the database in batches
+"""
+
+import json
+import time
+import atexit
+import logging
+import threading
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from .three_stones_moves import insert_moves
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SQL = """
+    UPDATE three_stones_rooms AS r
+    SET game_state = v.game_state,
+        game_state_packed = v.game_state_packed,
+        game_state_seq = COALESCE(v.game_state_seq, r.game_state_seq),
+        started = COALESCE(v.started, r.started),
+        started_at = COALESCE(v.started_at, r.started_at),
+        last_active_at = COALESCE(v.last_active_at, NOW())
+    FROM (VALUES %s) AS v(room_code, game_state, game_state_packed, game_state_seq, started, started_at,
+                          last_active_at)
+    WHERE r.room_code = v.room_code
+"""
+FLUSH_TEMPLATE = "(%s, %s::jsonb, %s::bigint, %s::int, %s::boolean, %s::timestamp, to_timestamp(%s::float8))"
+
+
+class GameStatePersister:
+    """Write-behind queue for three_stones_rooms.game_state.
+
+    Handlers call mark_dirty() and return immediately; a background thread
+    flushes every dirty room once per interval with a single batched UPDATE.
+    Repeated updates to the same room between flushes collapse into one row.
+    States that ``pack`` turns into an int are stored in game_state_packed
+    with game_state NULL; the rest are written as JSON. Either way the state
+    is serialized in mark_dirty(), on the handler's thread, so the flush
+    thread never reads a dict that handlers are still changing. A flush
+    stamps last_active_at with the time of the write unless the last
+    mark_dirty() passed the room's own ``active_at`` (an eviction writing
+    out an idle room, whose TTL clock must keep running).
+
+    Moves queued with append_move() are inserted into three_stones_moves in
+    the same transaction, before the snapshots, so a stored snapshot never
+    refers to a seq whose moves are missing.
+
+    A lost connection puts the whole batch back as it was. Any other error
+    is blamed on the rows: the batch is retried room by room, and a room
+    whose rows fail ``max_attempts`` flushes in a row is dropped and
+    logged, so one bad room never holds back everyone else's writes.
+    """
+
+    def __init__(self, db_pool, interval=0.5, batch_size=500, pack=None, max_attempts=3):
+        self.db_pool = db_pool
+        self.pack = pack
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._attempts = {}  # {room_code: failed flushes in a row}
+        self._dirty = {}  # {room_code: {'payload': str, 'packed': int, 'seq': int, 'started': bool, 'started_at': datetime, 'active_at': float}}
+        self._moves = []  # three_stones_moves rows in the order they were made
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._stats = {
+            'marked': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'rows_packed': 0,
+            'moves_flushed': 0,
+            'errors': 0,
+            'rows_dropped': 0,
+            'moves_dropped': 0,
+            'last_flush_seconds': 0.0,
+            'max_flush_seconds': 0.0,
+            'total_flush_seconds': 0.0
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='three-stones-persister', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop the background thread and flush everything still pending"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def mark_dirty(self, room_code, game_state, seq=None, started=None, started_at=None, active_at=None):
+        """Queue the room's current game_state (and optional started columns) for writing.
+
+        ``seq`` is the room's sequence number when the state is queued. The
+        state is packed or JSON-encoded here, so what gets written is exactly
+        the state at ``seq``. ``active_at`` (epoch seconds) is written as
+        last_active_at; None means the time of the flush.
+        """
+        packed = self.pack(game_state) if self.pack and game_state is not None else None
+        payload = None
+        if packed is None and game_state is not None:
+            try:
+                payload = json.dumps(game_state)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Skipping unserializable game state for room {room_code}: {e}")
+                return
+        with self._lock:
+            entry = self._dirty.get(room_code)
+            if entry is None:
+                entry = self._dirty[room_code] = {
+                    'payload': None, 'packed': None, 'seq': None, 'started': None, 'started_at': None,
+                    'active_at': None
+                }
+            entry['payload'] = payload
+            entry['packed'] = packed
+            entry['seq'] = seq
+            entry['active_at'] = active_at
+            if started is not None:
+                entry['started'] = started
+            if started_at is not None:
+                entry['started_at'] = started_at
+            self._stats['marked'] += 1
+
+    def append_move(self, row):
+        """Queue one three_stones_moves row (see three_stones_moves.move_row)"""
+        with self._lock:
+            self._moves.append(row)
+
+    def discard(self, room_code, moves=False):
+        """Drop a pending write (and the room's queued moves if ``moves``), waiting for any in-flight flush"""
+        with self._flush_lock:
+            with self._lock:
+                self._dirty.pop(room_code, None)
+                if moves:
+                    self._moves = [row for row in self._moves if row[0] != room_code]
+
+    def pending(self, room_code):
+        """True while a snapshot or move of the room is still waiting to be written"""
+        with self._lock:
+            return room_code in self._dirty or any(row[0] == room_code for row in self._moves)
+
+    def flush(self, room_codes=None):
+        """Synchronously write pending rooms (all of them, or only ``room_codes``)"""
+        with self._flush_lock:
+            with self._lock:
+                if room_codes is None:
+                    batch, self._dirty = self._dirty, {}
+                    moves, self._moves = self._moves, []
+                else:
+                    batch = {code: self._dirty.pop(code) for code in room_codes if code in self._dirty}
+                    moves = [row for row in self._moves if row[0] in room_codes]
+                    if moves:
+                        self._moves = [row for row in self._moves if row[0] not in room_codes]
+            if batch or moves:
+                self._write(batch, moves)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.interval)
+            if self._stopped:
+                break
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Game state flush failed")
+
+    def _write(self, batch, moves):
+        started = time.monotonic()
+        rows = [(room_code, entry['payload'], entry['packed'], entry['seq'], entry['started'], entry['started_at'],
+                 entry['active_at'])
+                for room_code, entry in batch.items()]
+        packed_rows = sum(1 for entry in batch.values() if entry['packed'] is not None)
+        try:
+            with self.db_pool.session() as conn:
+                with conn.cursor() as cursor:
+                    if moves:
+                        insert_moves(cursor, moves, page_size=self.batch_size)
+                    for i in range(0, len(rows), self.batch_size):
+                        execute_values(cursor, FLUSH_SQL, rows[i:i + self.batch_size], template=FLUSH_TEMPLATE)
+                conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            # The database, not the rows: try the same batch again next interval
+            logger.error(f"Error flushing {len(rows)} game states and {len(moves)} moves: {e}")
+            self._requeue(batch, moves)
+            return
+        except Exception as e:
+            room_codes = set(batch) | {row[0] for row in moves}
+            if len(room_codes) > 1:
+                logger.warning(f"Flushing {len(room_codes)} rooms failed ({e}); retrying room by room")
+                for room_code in room_codes:
+                    self._write({room_code: batch[room_code]} if room_code in batch else {},
+                                [row for row in moves if row[0] == room_code])
+                return
+            self._reject(room_codes.pop(), batch, moves, e)
+            return
+        elapsed = time.monotonic() - started
+        with self._lock:
+            for room_code in batch:
+                self._attempts.pop(room_code, None)
+            for row in moves:
+                self._attempts.pop(row[0], None)
+            stats = self._stats
+            stats['flushes'] += 1
+            stats['rows_flushed'] += len(rows)
+            stats['rows_packed'] += packed_rows
+            stats['moves_flushed'] += len(moves)
+            stats['last_flush_seconds'] = elapsed
+            stats['max_flush_seconds'] = max(stats['max_flush_seconds'], elapsed)
+            stats['total_flush_seconds'] += elapsed
+
+    def _requeue(self, batch, moves):
+        with self._lock:
+            self._stats['errors'] += 1
+            self._moves[:0] = moves
+            # Put entries back, keeping any newer state that arrived meanwhile
+            for room_code, entry in batch.items():
+                newer = self._dirty.setdefault(room_code, entry)
+                for column in ('seq', 'started', 'started_at'):
+                    if newer[column] is None:
+                        newer[column] = entry[column]
+
+    def _reject(self, room_code, batch, moves, error):
+        """One room's rows failed on their own: retry them, up to max_attempts flushes, then drop them"""
+        with self._lock:
+            attempts = self._attempts[room_code] = self._attempts.get(room_code, 0) + 1
+        if attempts < self.max_attempts:
+            logger.error(f"Error flushing room {room_code} (attempt {attempts}/{self.max_attempts}): {error}")
+            self._requeue(batch, moves)
+            return
+        logger.error(f"Dropping {len(batch)} game states and {len(moves)} moves of room {room_code} "
+                     f"after {attempts} failed flushes: {error}")
+        with self._lock:
+            self._attempts.pop(room_code, None)
+            self._stats['errors'] += 1
+            self._stats['rows_dropped'] += len(batch)
+            self._stats['moves_dropped'] += len(moves)
+
+    def stats(self):
+        """Queue depth and flush latency counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['queue_depth'] = len(self._dirty)
+            snapshot['moves_queued'] = len(self._moves)
+        flushes = snapshot['flushes'] or 1
+        snapshot['avg_flush_seconds'] = snapshot['total_flush_seconds'] / flushes
+        return snapshot
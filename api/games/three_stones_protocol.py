@@ -0,0 +1,93 @@
+"""
+Three Stones Protocol
+Per-room sequence numbers, compact move deltas, a ring buffer of recent room events
+and the full snapshots clients resync from
+"""
+
+from collections import deque
+
+# Bits of a move delta's 'flags'
+FLAG_REACHED_GOAL = 1
+FLAG_GAME_OVER = 2
+
+# Sequenced events kept per room for replay to reconnecting clients
+EVENT_LOG_SIZE = 64
+
+
+class EventLog:
+    """The last ``capacity`` sequenced events of one room.
+
+    A client that reconnects with the last sequence number it saw gets
+    exactly the events after it, as long as none of them has been pushed
+    out of the buffer yet; otherwise it needs a snapshot.
+    """
+
+    def __init__(self, capacity=EVENT_LOG_SIZE):
+        self._events = deque(maxlen=capacity)  # (seq, event, payload)
+
+    def append(self, seq, event, payload):
+        self._events.append((seq, event, payload))
+
+    def since(self, seq, current):
+        """[(event, payload)] after ``seq`` up to ``current``, or None if the buffer cannot cover them"""
+        if not isinstance(seq, int) or seq > current:
+            return None
+        if seq == current:
+            return []
+        events = list(self._events)
+        if not events or events[0][0] > seq + 1:
+            return None
+        return [(event, payload) for event_seq, event, payload in events if event_seq > seq]
+
+    def __len__(self):
+        return len(self._events)
+
+
+def current_seq(room):
+    return room.get('seq', 0)
+
+
+def next_seq(room):
+    """Advance the room's sequence number; every change clients must apply gets one"""
+    room['seq'] = room.get('seq', 0) + 1
+    return room['seq']
+
+
+def record_event(room, event, payload):
+    """Give a room event the next sequence number and keep it for replay; returns the payload"""
+    payload['seq'] = next_seq(room)
+    log = room.get('events')
+    if log is None:
+        log = room['events'] = EventLog()
+    log.append(payload['seq'], event, payload)
+    return payload
+
+
+def move_delta(stone, from_node_id, game_state):
+    """move_made payload: what changed with one move instead of the whole gameState.
+
+    Clients move ``stoneId`` to ``to``, set the side to move to ``turn`` and
+    read the flags. record_event() adds the ``seq``; a delta whose ``seq`` is
+    not exactly one past the last one seen means something was missed, and
+    the client asks for a snapshot.
+    """
+    flags = 0
+    if stone.get('reachedGoal'):
+        flags |= FLAG_REACHED_GOAL
+    if game_state.get('gameOver'):
+        flags |= FLAG_GAME_OVER
+    delta = {
+        'stoneId': stone['id'],
+        'from': from_node_id,
+        'to': stone['nodeId'],
+        'turn': game_state.get('currentTurn'),
+        'flags': flags
+    }
+    if flags & FLAG_GAME_OVER:
+        delta['winner'] = game_state.get('winner')
+    return delta
+
+
+def snapshot(room):
+    """Full game state of a room with the sequence number it is current as of"""
+    return {'seq': current_seq(room), 'gameState': room.get('game_state')}
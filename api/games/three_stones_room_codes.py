@@ -0,0 +1,131 @@
+"""
+Three Stones Room Codes
+Collision-free 6-character room codes: a database sequence leased in blocks, mapped through a keyed Feistel permutation
+"""
+
+import hashlib
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+CODE_LENGTH = 6
+HALF_SPACE = len(ALPHABET) ** (CODE_LENGTH // 2)  # 36^3: each Feistel half is three characters
+CODE_SPACE = HALF_SPACE * HALF_SPACE  # 36^6 codes, the sequence's MAXVALUE + 1
+
+LEASE_SQL = "SELECT nextval('three_stones_room_code_seq') FROM generate_series(1, %s)"
+
+
+class CodePermutation:
+    """Keyed bijection of [0, 36^6) onto 6-character base36 codes.
+
+    A balanced Feistel network over two base-36^3 halves (addition mod
+    36^3), so every number maps to a distinct code with no cycle walking.
+    Consecutive sequence numbers give unrelated-looking codes; the key must
+    never change once codes have been handed out, or new codes may repeat
+    old ones.
+    """
+
+    def __init__(self, key, rounds=4):
+        self.key = key if isinstance(key, bytes) else key.encode('utf-8')
+        self.rounds = rounds
+
+    def _round(self, i, half):
+        digest = hashlib.blake2b(half.to_bytes(2, 'big') + bytes((i,)), digest_size=4, key=self.key).digest()
+        return int.from_bytes(digest, 'big') % HALF_SPACE
+
+    def encode(self, number):
+        if not 0 <= number < CODE_SPACE:
+            raise ValueError(f'{number} is outside the room code space')
+        left, right = divmod(number, HALF_SPACE)
+        for i in range(self.rounds):
+            left, right = right, (left + self._round(i, right)) % HALF_SPACE
+        value = left * HALF_SPACE + right
+        chars = []
+        for _ in range(CODE_LENGTH):
+            value, digit = divmod(value, len(ALPHABET))
+            chars.append(ALPHABET[digit])
+        return ''.join(reversed(chars))
+
+    def decode(self, code):
+        """Sequence number of a code this permutation produced (ValueError for anything else)"""
+        if len(code) != CODE_LENGTH:
+            raise ValueError(f'room codes are {CODE_LENGTH} characters')
+        value = 0
+        for char in code.upper():
+            digit = ALPHABET.find(char)
+            if digit < 0:
+                raise ValueError(f'{char!r} is not a room code character')
+            value = value * len(ALPHABET) + digit
+        left, right = divmod(value, HALF_SPACE)
+        for i in reversed(range(self.rounds)):
+            left, right = (right - self._round(i, left)) % HALF_SPACE, left
+        return left * HALF_SPACE + right
+
+
+class RoomCodeAllocator:
+    """Room codes from sequence numbers leased a block at a time.
+
+    ``lease(count)`` reserves ``count`` sequence numbers in one round trip
+    (None: a process-local counter, for memory-only servers). The next
+    block is leased on a background thread once the current one runs low,
+    so next_code() normally never touches the database. Numbers are never
+    handed out twice, so codes are unique without a lookup; a lease that
+    is not used up before a restart only leaves a gap.
+    """
+
+    def __init__(self, permutation, lease=None, block_size=64, low_water=16):
+        self.permutation = permutation
+        self.lease = lease
+        self.block_size = block_size
+        self.low_water = low_water
+        self._numbers = []
+        self._counter = itertools.count() if lease is None else None
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._stats = {'allocated': 0, 'leases': 0, 'sync_leases': 0, 'lease_errors': 0}
+
+    def next_code(self):
+        """A room code no other call (in any process sharing the sequence) has returned"""
+        with self._lock:
+            if self._counter is not None:
+                number = next(self._counter)
+            else:
+                if not self._numbers:
+                    # Background refill did not make it in time: lease while holding the lock
+                    self._stats['sync_leases'] += 1
+                    self._numbers = self._lease()
+                number = self._numbers.pop()
+                if len(self._numbers) <= self.low_water and not self._refilling:
+                    self._refilling = True
+                    threading.Thread(target=self._refill, name='three-stones-room-codes', daemon=True).start()
+            self._stats['allocated'] += 1
+        return self.permutation.encode(number)
+
+    def _lease(self):
+        numbers = self.lease(self.block_size)
+        self._stats['leases'] += 1
+        # pop() takes from the end: hand the block out in sequence order
+        return sorted(numbers, reverse=True)
+
+    def _refill(self):
+        try:
+            numbers = self.lease(self.block_size)
+        except Exception:
+            logger.exception("Leasing room code block failed")
+            with self._lock:
+                self._stats['lease_errors'] += 1
+                self._refilling = False
+            return
+        with self._lock:
+            self._stats['leases'] += 1
+            self._numbers = sorted(numbers, reverse=True) + self._numbers
+            self._refilling = False
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['leased_remaining'] = len(self._numbers)
+        return snapshot
@@ -0,0 +1,151 @@
+"""
+Three Stones Timer Wheel
+Timer wheel for delayed room work such as disconnect grace periods; callbacks run on a small worker pool
+"""
+
+import math
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTask:
+    """Handle returned by TimerWheel.schedule()"""
+
+    __slots__ = ('wheel', 'callback', 'args', 'deadline', 'slot', 'rounds', 'done')
+
+    def __init__(self, wheel, callback, args, deadline, slot, rounds):
+        self.wheel = wheel
+        self.callback = callback
+        self.args = args
+        self.deadline = deadline
+        self.slot = slot
+        self.rounds = rounds
+        self.done = False
+
+    def cancel(self):
+        """Cancel the task; returns False if it already ran or was cancelled"""
+        return self.wheel.cancel(self)
+
+
+class TimerWheel:
+    """Hashed timing wheel driven by one daemon thread.
+
+    Tasks are placed in the slot their deadline falls into (plus a round
+    count for deadlines further out than one revolution), so schedule() and
+    cancel() are O(1) and the thread count stays fixed however many timers
+    are pending. Deadlines are rounded up to the next ``tick``. The wheel
+    thread only finds due tasks; callbacks run on a pool of ``workers``
+    threads, so one that waits on the database never delays the timers
+    behind it.
+    """
+
+    def __init__(self, tick=0.1, slots=512, workers=4):
+        self.tick = tick
+        self.workers = workers
+        self._executor = None
+        self._slots = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._stats = {
+            'scheduled': 0,
+            'cancelled': 0,
+            'fired': 0,
+            'errors': 0,
+            'max_lateness_seconds': 0.0
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='three-stones-timer-worker')
+        self._thread = threading.Thread(target=self._run, name='three-stones-timers', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._executor is not None:
+            # Callbacks already running finish; ones not yet picked up are dropped like pending timers
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def schedule(self, delay, callback, *args):
+        """Run callback(*args) after ``delay`` seconds; returns a ScheduledTask"""
+        ticks = max(1, math.ceil(delay / self.tick))
+        size = len(self._slots)
+        with self._lock:
+            slot = (self._cursor + ticks) % size
+            task = ScheduledTask(self, callback, args, time.monotonic() + delay, slot, (ticks - 1) // size)
+            self._slots[slot].add(task)
+            self._pending += 1
+            self._stats['scheduled'] += 1
+        return task
+
+    def cancel(self, task):
+        with self._lock:
+            if task.done:
+                return False
+            task.done = True
+            self._slots[task.slot].discard(task)
+            self._pending -= 1
+            self._stats['cancelled'] += 1
+            return True
+
+    def pending(self):
+        return self._pending
+
+    def _advance(self):
+        """Move the cursor one slot and collect the tasks that are due"""
+        due = []
+        with self._lock:
+            self._cursor = (self._cursor + 1) % len(self._slots)
+            bucket = self._slots[self._cursor]
+            for task in list(bucket):
+                if task.rounds:
+                    task.rounds -= 1
+                    continue
+                bucket.remove(task)
+                task.done = True
+                due.append(task)
+            self._pending -= len(due)
+        return due
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick
+        while not self._stopped.is_set():
+            delay = next_tick - time.monotonic()
+            if delay > 0 and self._stopped.wait(delay):
+                break
+            next_tick += self.tick
+            for task in self._advance():
+                try:
+                    self._executor.submit(self._fire, task)
+                except RuntimeError:
+                    # Executor shut down under us: the wheel is stopping
+                    return
+
+    def _fire(self, task):
+        lateness = max(0.0, time.monotonic() - task.deadline)
+        try:
+            task.callback(*task.args)
+        except Exception:
+            logger.exception("Scheduled task failed")
+            with self._lock:
+                self._stats['errors'] += 1
+        with self._lock:
+            self._stats['fired'] += 1
+            self._stats['max_lateness_seconds'] = max(self._stats['max_lateness_seconds'], lateness)
+
+    def stats(self):
+        """Pending timer count and scheduling counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = self._pending
+        return snapshot
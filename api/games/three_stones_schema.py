@@ -0,0 +1,97 @@
+"""
+Three Stones Game State Schema
+Versioned gameState documents and the one-time batch migration of legacy rows in three_stones_rooms
+"""
+
+import re
+import json
+import logging
+
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Version of the gameState document written by this server
+#   0 (no schemaVersion field): stones may still use the first board's named node IDs (LT, C_UL, ...)
+#   1: numeric node IDs only
+SCHEMA_VERSION = 1
+
+STONE_LISTS = ('orangeStones', 'blueStones')
+
+# A stored schemaVersion counts only if its text is a plain non-negative integer; anything else is 0.
+# LEGACY_ROWS_SQL applies the same rule, so a junk value is migrated instead of aborting the migration.
+VERSION_TEXT = re.compile(r'[0-9]{1,9}')
+
+LEGACY_ROWS_SQL = """
+    SELECT id, game_state
+    FROM three_stones_rooms
+    WHERE game_state IS NOT NULL
+    AND jsonb_typeof(game_state) = 'object'
+    AND CASE WHEN game_state->>'schemaVersion' ~ '^[0-9]{1,9}$'
+             THEN (game_state->>'schemaVersion')::int
+             ELSE 0
+        END < %s
+    AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+MIGRATE_SQL = """
+    UPDATE three_stones_rooms AS r
+    SET game_state = v.game_state
+    FROM (VALUES %s) AS v(id, game_state)
+    WHERE r.id = v.id
+"""
+MIGRATE_TEMPLATE = "(%s, %s::jsonb)"
+
+
+def schema_version(game_state):
+    version = game_state.get('schemaVersion')
+    if isinstance(version, bool) or not isinstance(version, (int, str)):
+        return 0
+    text = str(version)
+    return int(text) if VERSION_TEXT.fullmatch(text) else 0
+
+
+def upgrade_game_state(game_state, legacy_ids):
+    """Bring a gameState dict up to SCHEMA_VERSION in place; returns True if it was older"""
+    if not isinstance(game_state, dict) or schema_version(game_state) >= SCHEMA_VERSION:
+        return False
+    for key in STONE_LISTS:
+        for stone in game_state.get(key) or ():
+            node_id = stone.get('nodeId') if isinstance(stone, dict) else None
+            if isinstance(node_id, str) and node_id in legacy_ids:
+                stone['nodeId'] = legacy_ids[node_id]
+    game_state['schemaVersion'] = SCHEMA_VERSION
+    return True
+
+
+def migrate_stored_game_states(db_pool, legacy_ids, batch_size=500):
+    """Rewrite every stored game_state below SCHEMA_VERSION, one batch per transaction.
+
+    Rows are walked in id order, so the migration can be interrupted and
+    simply run again; rows that are already current are never selected.
+    Returns the number of rows rewritten.
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        with db_pool.session() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(LEGACY_ROWS_SQL, (SCHEMA_VERSION, last_id, batch_size))
+                rows = cursor.fetchall()
+                updates = []
+                for row_id, game_state in rows:
+                    if isinstance(game_state, str):
+                        game_state = json.loads(game_state)
+                    upgrade_game_state(game_state, legacy_ids)
+                    updates.append((row_id, json.dumps(game_state)))
+                if updates:
+                    execute_values(cursor, MIGRATE_SQL, updates, template=MIGRATE_TEMPLATE)
+            conn.commit()
+        if not rows:
+            break
+        migrated += len(rows)
+        last_id = rows[-1][0]
+        if len(rows) < batch_size:
+            break
+    return migrated
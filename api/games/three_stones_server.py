@@ -13,8 +13,23 @@ import json
 import time
 import string
 import random
-import threading
 import logging
+import functools
+import copy
+
+from .three_stones_persister import GameStatePersister
+from .three_stones_scheduler import TimerWheel
+from .three_stones_lobby import LobbyIndex, LobbyBroadcaster, LobbySubscribers, LOBBY_INDEX_SQL, LOBBY_INDEX_ITERSIZE, LOBBY_ROOM
+from .three_stones_engine import RulesEngine, NOT_OWN_STONE, NOT_NEIGHBOR, OCCUPIED, BLOCKS_OPPONENT
+from .three_stones_solver import PositionTable
+from .three_stones_bots import Bot, BotRunner, BOT_PREFIX, DEFAULT_LEVEL
+from .three_stones_protocol import current_seq, record_event, move_delta, snapshot
+from .three_stones_schema import SCHEMA_VERSION, upgrade_game_state, migrate_stored_game_states
+from .three_stones_packed import pack_game_state, unpack_game_state, PACKED_STATE_SQL
+from .three_stones_moves import MOVES_AFTER_SQL, move_row, replay_moves
+from .three_stones_room_codes import CodePermutation, RoomCodeAllocator, LEASE_SQL
+from .three_stones_lifecycle import RoomLifecycle, room_reason, EMPTY, ABANDONED, FINISHED
+from .three_stones_cache import RoomCache
 
 # Global references to be set by main server
 socketio = None
@@ -23,15 +38,48 @@ log_info = None
 log_error = None
 log_debug = None
 log_warning = None
+observe_event = None  # callable(event_name, seconds) for handler latency metrics
+
+# Write-behind queue for game_state and the move log (created in initialize when a database is available)
+persister = None
+
+# Moves are logged one row each; the full game_state snapshot is rewritten only every this many moves
+SNAPSHOT_EVERY = int(os.environ.get('THREE_STONES_SNAPSHOT_EVERY', '20'))
+
+# Room codes: three_stones_room_code_seq numbers through a keyed permutation (the key must never change)
+room_code_permutation = CodePermutation(os.environ.get('THREE_STONES_ROOM_CODE_KEY', 'three-stones-room-codes'))
+room_codes = RoomCodeAllocator(room_code_permutation)  # replaced in initialize when a database is available
+
+# Idle rooms are archived after these many seconds nobody is in them (created in initialize)
+lifecycle = None
+
+# Coalesces lobby changes into versioned lobby_delta events (created in initialize)
+lobby_broadcaster = None
 
 # Game rooms storage
-rooms = {}  # {room_code: {name: str, password_hash: str, players: {orange: player_id, blue: player_id}, game_state: {...}, started: bool, created_at: datetime, creator: player_id}}
+# Bounded once a database is available (initialize): idle rooms past THREE_STONES_ROOM_CACHE, or idle for
+# THREE_STONES_ROOM_IDLE_EVICT seconds, are written out and dropped, and load_room_from_db() brings them back
+ROOM_IDLE_EVICT = float(os.environ.get('THREE_STONES_ROOM_IDLE_EVICT', '300'))
+rooms = RoomCache(
+    can_evict=lambda room_code, room: room_evictable(room_code, room),
+    evict=lambda room_code, room: evict_room(room_code, room)
+)  # {room_code: {name: str, password_hash: str, players: {orange: player_id, blue: player_id}, game_state: {...}, started: bool, created_at: datetime, creator: player_id, active_at: epoch seconds}}
 
 # Player sessions
 players = {}  # {player_id: {username, room_code, color}}
 
 # Disconnect timers - give players time to reconnect before removing them
-disconnect_timers = {}  # {player_id: timer}
+disconnect_timers = {}  # {player_id: ScheduledTask}
+DISCONNECT_GRACE_SECONDS = float(os.environ.get('THREE_STONES_DISCONNECT_GRACE', '10'))
+
+# One thread times every delayed room task (disconnect grace periods, bot moves etc.); a few workers run them
+scheduler = TimerWheel(workers=int(os.environ.get('THREE_STONES_TIMER_WORKERS', '4')))
+
+# Lobby metadata for every listed room (in memory or not), kept up to date by the handlers
+lobby_index = LobbyIndex()
+
+# Sockets in the lobby room - the only ones that receive lobby_delta broadcasts
+lobby_subscribers = LobbySubscribers()
 
 # Board graph (nodes and edges for 10-node layout)
 # 10-node board structure:
@@ -53,188 +101,340 @@ BOARD_NODES = {
     '2': {'id': '2', 'neighbors': ['1']}
 }
 
-def initialize(sio, pool, logging_funcs):
+# Orange goal: 5, 6, 7 (right side) | Blue goal: 10, 9, 8 (left side)
+GOAL_NODES = {'orange': ['5', '6', '7'], 'blue': ['10', '9', '8']}
+
+# Named node IDs used by older clients and saved states
+LEGACY_NODE_IDS = {'LT': '10', 'LM': '9', 'LB': '8', 'RT': '5', 'RM': '6', 'RB': '7', 'C_UL': '3', 'C_DR': '2'}
+
+# Board graph compiled to bitboards for move validation
+rules = RulesEngine(BOARD_NODES, GOAL_NODES, LEGACY_NODE_IDS)
+
+# Solved result and best move for every position (built in initialize)
+position_table = None
+
+# Seated bots and the runner that schedules their dice rolls and moves on the timer wheel
+bots = {}  # {player_id: Bot}
+BOT_THINK_SECONDS = float(os.environ.get('THREE_STONES_BOT_THINK', '0.6'))
+bot_runner = BotRunner(scheduler, BOT_THINK_SECONDS)
+
+def initialize(sio, pool, logging_funcs, event_observer=None):
     """Initialize the Three Stones game server with dependencies"""
-    global socketio, db_pool, log_info, log_error, log_debug, log_warning
+    global socketio, db_pool, log_info, log_error, log_debug, log_warning, persister, lobby_broadcaster, observe_event
+    global position_table, room_codes, lifecycle
     socketio = sio
     db_pool = pool
+    observe_event = event_observer
     if logging_funcs and len(logging_funcs) == 4:
         log_info, log_error, log_debug, log_warning = logging_funcs
+    if db_pool:
+        persister = GameStatePersister(
+            db_pool,
+            interval=float(os.environ.get('THREE_STONES_FLUSH_INTERVAL', '0.5')),
+            pack=pack_game_state
+        )
+        persister.start()
+        room_codes = RoomCodeAllocator(
+            room_code_permutation,
+            lease=lease_room_codes,
+            block_size=int(os.environ.get('THREE_STONES_ROOM_CODE_BLOCK', '64'))
+        )
+        rooms.capacity = int(os.environ.get('THREE_STONES_ROOM_CACHE', '1000'))
+        rooms.start()
+    lobby_broadcaster = LobbyBroadcaster(
+        lobby_index,
+        build_lobby_row,
+        lambda event, payload: socketio.emit(event, payload, room=LOBBY_ROOM),
+        window=float(os.environ.get('THREE_STONES_LOBBY_WINDOW', '0.1'))
+    )
+    lobby_broadcaster.start()
+    lifecycle = RoomLifecycle(
+        db_pool,
+        {
+            EMPTY: int(os.environ.get('THREE_STONES_EMPTY_TTL', '1800')),
+            ABANDONED: int(os.environ.get('THREE_STONES_ABANDONED_TTL', '7200')),
+            FINISHED: int(os.environ.get('THREE_STONES_FINISHED_TTL', '600'))
+        },
+        batch_size=int(os.environ.get('THREE_STONES_SWEEP_BATCH', '200'))
+    )
+    lifecycle.start(db_scoped(sweep_rooms), interval=float(os.environ.get('THREE_STONES_SWEEP_INTERVAL', '60')))
+    scheduler.start()
+    position_table = PositionTable(rules).solve()
+    log_info("Three Stones positions solved", position_table.stats())
     register_handlers()
 
+def shutdown():
+    """Stop the timer and sweeper threads and flush pending game state writes (called on server shutdown)"""
+    scheduler.stop()
+    if lifecycle:
+        lifecycle.stop()
+    rooms.stop()
+    if persister:
+        persister.stop()
+
+def db_scoped(handler):
+    """Run an event handler with at most one pooled database connection"""
+    @functools.wraps(handler)
+    def wrapper(*args):
+        if not db_pool:
+            return handler(*args)
+        with db_pool.scope():
+            return handler(*args)
+    return wrapper
+
+def timed(event, handler):
+    """Report a handler's run time (including its database scope) to observe_event"""
+    if not observe_event:
+        return handler
+    @functools.wraps(handler)
+    def wrapper(*args):
+        started = time.perf_counter()
+        try:
+            return handler(*args)
+        finally:
+            observe_event(event, time.perf_counter() - started)
+    return wrapper
+
 def register_handlers():
     """Register all WebSocket event handlers"""
-    socketio.on_event('connect', handle_connect)
-    socketio.on_event('disconnect', handle_disconnect)
-    socketio.on_event('leave_room', handle_leave_room)
-    socketio.on_event('delete_room', handle_delete_room)
-    socketio.on_event('create_room', handle_create_room)
-    socketio.on_event('join_room', handle_join_room)
-    socketio.on_event('rejoin_room', handle_rejoin_room)
-    socketio.on_event('get_lobby_list', handle_get_lobby_list)
-    socketio.on_event('start_game', handle_start_game)
-    socketio.on_event('make_move', handle_make_move)
-    # Dice roll to decide who starts
-    socketio.on_event('roll_dice', handle_roll_dice)
-    socketio.on_event('request_roll', handle_request_roll)
+    handlers = {
+        'connect': handle_connect,
+        'disconnect': handle_disconnect,
+        'leave_room': handle_leave_room,
+        'delete_room': handle_delete_room,
+        'create_room': handle_create_room,
+        'join_room': handle_join_room,
+        'rejoin_room': handle_rejoin_room,
+        'get_lobby_list': handle_get_lobby_list,
+        'lobby_subscribe': handle_lobby_subscribe,
+        'lobby_unsubscribe': handle_lobby_unsubscribe,
+        'start_game': handle_start_game,
+        'make_move': handle_make_move,
+        # Dice roll to decide who starts
+        'roll_dice': handle_roll_dice,
+        'request_roll': handle_request_roll,
+        'request_hint': handle_request_hint,
+        'request_sync': handle_request_sync,
+        'add_bot': handle_add_bot
+    }
+    for event, handler in handlers.items():
+        socketio.on_event(event, timed(event, db_scoped(handler)))
 
 def generate_room_code():
     """Generate a random 6-character room code"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+def lease_room_codes(count):
+    """Reserve ``count`` numbers of three_stones_room_code_seq in one round trip"""
+    with db_pool.session() as conn, conn.cursor() as cursor:
+        cursor.execute(LEASE_SQL, (count,))
+        numbers = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    return numbers
+
+def allocate_room_code():
+    """Next unused room code, not in memory; random only if no block of sequence numbers can be leased"""
+    while True:
+        try:
+            room_code = room_codes.next_code()
+        except Exception as e:
+            # save_room_to_db still refuses a code that is taken
+            log_error("Error allocating room code", e)
+            room_code = generate_room_code()
+        # Rooms restored from before the allocator keep their random codes
+        if room_code not in rooms:
+            return room_code
+
 def get_user_id_from_username(username):
     """Get user ID from username"""
     if not db_pool or not username:
         return None
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        result = cursor.fetchone()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+            result = cursor.fetchone()
         return result[0] if result else None
     except Exception as e:
         log_error("Error getting user ID", e, {'username': username})
         return None
 
 def save_room_to_db(room_code, room_name, password_hash, creator_socket_id, creator_username):
-    """Save room to database"""
+    """Save room to database; returns (True if saved, False if the code is already taken or
+    None if the write failed, the creator's user ID or None)"""
     if not db_pool:
-        return
+        return True, None
+    creator_user_id = None
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        creator_user_id = get_user_id_from_username(creator_username) if creator_username else None
-        
-        cursor.execute("""
-            INSERT INTO three_stones_rooms 
-            (room_code, room_name, password_hash, creator_user_id, creator_socket_id, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            ON CONFLICT (room_code) DO UPDATE SET
-                room_name = EXCLUDED.room_name,
-                password_hash = EXCLUDED.password_hash,
-                creator_user_id = EXCLUDED.creator_user_id,
-                creator_socket_id = EXCLUDED.creator_socket_id
-        """, (room_code, room_name, password_hash, creator_user_id, creator_socket_id, datetime.now(UTC)))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
-        log_debug("Room saved to database", {'room_code': room_code, 'room_name': room_name})
+        with db_pool.session() as conn:
+            creator_user_id = get_user_id_from_username(creator_username) if creator_username else None
+            
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO three_stones_rooms 
+                    (room_code, room_name, password_hash, creator_user_id, creator_socket_id, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (room_code) DO NOTHING
+                    RETURNING id
+                """, (room_code, room_name, password_hash, creator_user_id, creator_socket_id, datetime.now(UTC)))
+                # Allocated codes never repeat; only a random code from before the allocator can be taken
+                inserted = cursor.fetchone() is not None
+            
+            conn.commit()
+        log_debug("Room saved to database", {'room_code': room_code, 'room_name': room_name, 'inserted': inserted})
     except Exception as e:
         log_error("Error saving room to database", e, {'room_code': room_code, 'room_name': room_name})
-        if conn:
-            db_pool.putconn(conn)
+        return None, None
+    return inserted, creator_user_id
 
 def update_room_player_in_db(room_code, player_color, player_socket_id, player_username):
     """Update player in room in database"""
     if not db_pool:
         return
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        player_user_id = get_user_id_from_username(player_username) if player_username else None
-        
-        if player_color == 'orange':
-            cursor.execute("""
-                UPDATE three_stones_rooms 
-                SET orange_player_id = %s, orange_socket_id = %s
-                WHERE room_code = %s
-            """, (player_user_id, player_socket_id, room_code))
-        elif player_color == 'blue':
+        with db_pool.session() as conn:
+            player_user_id = get_user_id_from_username(player_username) if player_username else None
+            
+            with conn.cursor() as cursor:
+                if player_color == 'orange':
+                    cursor.execute("""
+                        UPDATE three_stones_rooms 
+                        SET orange_player_id = %s, orange_socket_id = %s, last_active_at = NOW()
+                        WHERE room_code = %s
+                    """, (player_user_id, player_socket_id, room_code))
+                elif player_color == 'blue':
+                    cursor.execute("""
+                        UPDATE three_stones_rooms 
+                        SET blue_player_id = %s, blue_socket_id = %s, last_active_at = NOW()
+                        WHERE room_code = %s
+                    """, (player_user_id, player_socket_id, room_code))
+            
+            conn.commit()
+        log_debug("Room player updated in database", {'room_code': room_code, 'player_color': player_color, 'username': player_username})
+    except Exception as e:
+        log_error("Error updating room player in database", e, {'room_code': room_code, 'player_color': player_color})
+
+def queue_game_state_save(room_code, started=None, started_at=None, active_at=None):
+    """Queue a snapshot of the room's game_state for the write-behind persister (last_active_at: active_at or now)"""
+    room = rooms.get(room_code)
+    if persister and room is not None:
+        room['snapshot_seq'] = current_seq(room)
+        persister.mark_dirty(room_code, room.get('game_state'), seq=room['snapshot_seq'],
+                             started=started, started_at=started_at, active_at=active_at)
+
+def queue_move_save(room_code, delta):
+    """Log a move_made payload to three_stones_moves, with a fresh snapshot every SNAPSHOT_EVERY moves"""
+    touch_room(room_code)
+    room = rooms.get(room_code)
+    if not persister or room is None:
+        return
+    persister.append_move(move_row(room_code, delta, datetime.now(UTC)))
+    if delta['seq'] - room.get('snapshot_seq', 0) >= SNAPSHOT_EVERY:
+        queue_game_state_save(room_code)
+
+def restore_room_seq(room, snapshot_seq, moves):
+    """Replay the moves logged after a room's stored snapshot and carry on its sequence numbers from them"""
+    last_seq = replay_moves(room.get('game_state'), moves)
+    room['snapshot_seq'] = snapshot_seq or 0
+    room['seq'] = last_seq if last_seq is not None else room['snapshot_seq']
+
+def reset_game_in_db(room_code):
+    """Mark game as not started and clear its stored state"""
+    if not db_pool:
+        return
+    if persister:
+        persister.discard(room_code)
+    room = rooms.get(room_code)
+    try:
+        with db_pool.session() as conn, conn.cursor() as cursor:
             cursor.execute("""
                 UPDATE three_stones_rooms 
-                SET blue_player_id = %s, blue_socket_id = %s
+                SET started = FALSE, game_state = NULL, game_state_packed = NULL, started_at = NULL,
+                    game_state_seq = COALESCE(%s, game_state_seq)
                 WHERE room_code = %s
-            """, (player_user_id, player_socket_id, room_code))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
-        log_debug("Room player updated in database", {'room_code': room_code, 'player_color': player_color, 'username': player_username})
+            """, (current_seq(room) if room else None, room_code))
+            conn.commit()
+        log_debug("Game state reset in database", {'room_code': room_code})
     except Exception as e:
-        log_error("Error updating room player in database", e, {'room_code': room_code, 'player_color': player_color})
-        if conn:
-            db_pool.putconn(conn)
+        log_error("Error resetting game", e, {'room_code': room_code})
 
 def start_game_in_db(room_code):
     """Mark game as started in database"""
     if not db_pool:
         return
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE three_stones_rooms 
-            SET started = TRUE, started_at = %s
-            WHERE room_code = %s
-        """, (datetime.now(UTC), room_code))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE three_stones_rooms 
+                SET started = TRUE, started_at = %s
+                WHERE room_code = %s
+            """, (datetime.now(UTC), room_code))
+            conn.commit()
         log_debug("Game marked as started in database", {'room_code': room_code})
     except Exception as e:
         log_error("Error starting game in database", e, {'room_code': room_code})
-        if conn:
-            db_pool.putconn(conn)
 
 def delete_room_from_db(room_code):
     """Delete room from database"""
     if not db_pool:
         return
+    if persister:
+        persister.discard(room_code, moves=True)
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM three_stones_rooms WHERE room_code = %s", (room_code,))
-        
-        conn.commit()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM three_stones_rooms WHERE room_code = %s", (room_code,))
+            conn.commit()
         log_info("Room deleted from database", {'room_code': room_code})
     except Exception as e:
         log_error("Error deleting room from database", e, {'room_code': room_code})
-        if conn:
-            db_pool.putconn(conn)
+
+def parse_stored_game_state(game_state_db, game_state_packed=None):
+    """gameState dict from a three_stones_rooms row, upgraded to the current schema version"""
+    if game_state_packed is not None:
+        try:
+            return unpack_game_state(game_state_packed)
+        except ValueError as e:
+            log_warning("Unreadable packed game state, falling back to JSON", {'error': str(e)})
+    if not game_state_db:
+        return None
+    try:
+        game_state = json.loads(game_state_db) if isinstance(game_state_db, str) else game_state_db
+    except (TypeError, ValueError):
+        return None
+    if upgrade_game_state(game_state, LEGACY_NODE_IDS):
+        # Only rows the startup migration has not reached yet get here
+        log_debug("Upgraded stored game state on load", {'schema_version': SCHEMA_VERSION})
+    return game_state
 
 def load_room_from_db(room_code):
-    """Load room from database if not in memory"""
-    if room_code in rooms:
-        return rooms[room_code]
+    """Hydrate a room from the database on first access (join, rejoin, delete); rooms are never bulk-loaded"""
+    room = rooms.lookup(room_code)
+    if room is not None:
+        return room
     
     if not db_pool:
         return None
     
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT room_code, room_name, password_hash, creator_socket_id, 
-                   orange_socket_id, blue_socket_id, game_state, started, 
-                   created_at
-            FROM three_stones_rooms
-            WHERE room_code = %s
-        """, (room_code,))
-        result = cursor.fetchone()
-        cursor.close()
-        db_pool.putconn(conn)
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT room_code, room_name, password_hash, creator_socket_id, 
+                       orange_socket_id, blue_socket_id, game_state, game_state_packed, game_state_seq,
+                       started, created_at
+                FROM three_stones_rooms
+                WHERE room_code = %s
+            """, (room_code,))
+            result = cursor.fetchone()
+            moves = []
+            if result:
+                cursor.execute(MOVES_AFTER_SQL, (room_code, result[8] or 0))
+                moves = cursor.fetchall()
         
         if result:
             room_code_db, room_name, password_hash, creator_socket_id, \
-            orange_socket_id, blue_socket_id, game_state_db, started, created_at = result
+            orange_socket_id, blue_socket_id, game_state_db, game_state_packed, game_state_seq, \
+            started, created_at = result
             
-            # Parse game_state if it's a string
-            game_state = None
-            if game_state_db:
-                try:
-                    game_state = json.loads(game_state_db) if isinstance(game_state_db, str) else game_state_db
-                except:
-                    game_state = None
+            game_state = parse_stored_game_state(game_state_db, game_state_packed)
             
             # Ensure created_at is timezone-aware
             if created_at:
@@ -258,219 +458,296 @@ def load_room_from_db(room_code):
             if blue_socket_id:
                 room['players']['blue'] = blue_socket_id
             
+            restore_room_seq(room, game_state_seq, moves)
+            
             # Add to memory
             rooms[room_code] = room
+            index_room(room_code, room)
             log_info("Room loaded from database", {'room_code': room_code, 'name': room_name})
             return room
         
         return None
     except Exception as e:
         log_error("Error loading room from database", e, {'room_code': room_code})
-        if conn:
-            db_pool.putconn(conn)
         return None
 
-def load_active_rooms_from_db():
-    """Load all active rooms from database on server start"""
+def create_game_state_view():
+    """(Re)create the SQL function and view that show packed game states as JSON"""
     if not db_pool:
         return
-    
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Load rooms that are not game_over and created within last 24 hours
-        cursor.execute("""
-            SELECT room_code, room_name, password_hash, creator_socket_id, 
-                   orange_socket_id, blue_socket_id, game_state, started, 
-                   created_at
-            FROM three_stones_rooms
-            WHERE game_over = FALSE 
-            AND created_at > NOW() - INTERVAL '24 hours'
-            ORDER BY created_at DESC
-        """)
-        
-        results = cursor.fetchall()
-        cursor.close()
-        db_pool.putconn(conn)
-        
-        for result in results:
-            room_code_db, room_name, password_hash, creator_socket_id, \
-            orange_socket_id, blue_socket_id, game_state_db, started, created_at = result
-            
-            # Parse game_state if it's a string
-            game_state = None
-            if game_state_db:
-                try:
-                    game_state = json.loads(game_state_db) if isinstance(game_state_db, str) else game_state_db
-                except:
-                    game_state = None
-            
-            # Ensure created_at is timezone-aware
-            if created_at:
-                if created_at.tzinfo is None:
-                    created_at = created_at.replace(tzinfo=UTC)
-            
-            # Create room structure
-            room = {
-                'name': room_name,
-                'password_hash': password_hash,
-                'players': {},  # Players will be empty initially (socket IDs might be stale)
-                'game_state': game_state,
-                'started': started or False,
-                'created_at': created_at or datetime.now(UTC),
-                'creator': creator_socket_id
-            }
-            
-            # Add to memory (but don't add players as their socket connections are stale)
-            rooms[room_code_db] = room
-        
-        log_info("Loaded active rooms from database", {'count': len(results)})
+        with db_pool.session() as conn, conn.cursor() as cursor:
+            cursor.execute(PACKED_STATE_SQL)
+            conn.commit()
+    except Exception as e:
+        log_error("Error creating game state view", e)
+
+def migrate_game_states_in_db():
+    """One-time batch upgrade of stored game states written before the current schema version"""
+    if not db_pool:
+        return 0
+    started = time.perf_counter()
+    try:
+        migrated = migrate_stored_game_states(db_pool, LEGACY_NODE_IDS)
     except Exception as e:
-        log_error("Error loading active rooms from database", e)
-        if conn:
-            db_pool.putconn(conn)
+        log_error("Error migrating stored game states", e, {'schema_version': SCHEMA_VERSION})
+        return 0
+    if migrated:
+        log_info("Migrated stored game states", {
+            'rows': migrated,
+            'schema_version': SCHEMA_VERSION,
+            'seconds': round(time.perf_counter() - started, 3)
+        })
+    return migrated
 
 def cleanup_empty_rooms():
-    """Remove empty rooms - DISABLED: Rooms are now persistent and only deleted by creator"""
-    # Rooms are now persistent and only deleted when creator explicitly deletes them
-    # This function is kept for compatibility but does nothing
-    log_debug("cleanup_empty_rooms called but disabled - rooms are now persistent", {
-        'total_rooms_in_memory': len(rooms)
-    })
-    pass
+    """One sweep on demand (at boot, before the lobby index is loaded, so expired rooms are never listed)"""
+    if lifecycle:
+        sweep_rooms()
 
-def get_lobby_list():
-    """Get list of available rooms for lobby - includes rooms from database"""
-    lobby_rooms = []
-    
-    log_debug("Getting lobby list", {
-        'total_rooms_in_memory': len(rooms)
-    })
-    
-    # Get all active rooms from database (not game_over)
-    db_room_codes = set()
-    if db_pool:
+def get_room(room_code):
+    """The room a handler is about to change, or None.
+
+    One rooms.lookup() under the cache lock, falling back to the database;
+    the lookup marks the room as used, so an eviction already writing it
+    out keeps it in memory instead of dropping it under the handler.
+    """
+    if not room_code:
+        return None
+    return load_room_from_db(room_code)
+
+def touch_room(room_code):
+    """Restart a room's idle clock and mark it as just used in the room cache"""
+    room = rooms.get(room_code)
+    if room is not None:
+        room['active_at'] = time.time()
+        rooms.touch(room_code)
+
+def set_room_started(room_code, room, started):
+    """Set a room's started flag; its lobby entry is what the lobby shows once the room leaves memory"""
+    room['started'] = started
+    lobby_index.update(room_code, started=started)
+    lobby_changed(room_code)
+
+def room_in_use(room_code, room):
+    """A human is seated and connected, or inside the reconnect grace period"""
+    if room.get('away'):
+        return True
+    for pid in list(room.get('players', {}).values()):
+        if pid not in bots and players.get(pid, {}).get('room_code') == room_code:
+            return True
+    return False
+
+def sweep_rooms():
+    """Archive rooms idle past their TTL: memory decides for hydrated rooms, the database for the rest.
+
+    At most lifecycle.max_batches batches of lifecycle.batch_size rooms per pass;
+    anything left over is picked up by the next sweep.
+    """
+    started = time.perf_counter()
+    now = time.time()
+    expired = []
+    for room_code, room in list(rooms.items()):
+        if room_in_use(room_code, room):
+            # The idle clock starts when the last player leaves
+            room['active_at'] = now
+            continue
+        reason = room_reason(room.get('game_state'), room.get('started'))
+        if lifecycle.expired(reason, now - room.setdefault('active_at', now)):
+            expired.append((room_code, reason))
+
+    size = lifecycle.batch_size
+    archived = []
+    batches = 0
+    while expired and batches < lifecycle.max_batches:
+        batch, expired = expired[:size], expired[size:]
+        archived += archive_rooms(batch)
+        batches += 1
+    while batches < lifecycle.max_batches:
         try:
-            conn = db_pool.getconn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT room_code, room_name, password_hash, creator_user_id, creator_socket_id,
-                       orange_socket_id, blue_socket_id, started, game_over
-                FROM three_stones_rooms
-                WHERE game_over = FALSE
-                ORDER BY created_at DESC
-            """)
-            results = cursor.fetchall()
-            cursor.close()
-            db_pool.putconn(conn)
-            
-            for result in results:
-                room_code_db, room_name, password_hash, creator_user_id, creator_socket_id, \
-                orange_socket_id, blue_socket_id, started, game_over = result
-                
-                db_room_codes.add(room_code_db)
-                
-                # Load room from memory if exists, otherwise create from DB
-                if room_code_db in rooms:
-                    room = rooms[room_code_db]
-                else:
-                    # Load room from database
-                    room = load_room_from_db(room_code_db)
-                    if not room:
-                        continue
-                
-                # Count active players (players that are still connected)
-                # Check both memory and database - use memory as source of truth for active players
-                active_players_count = 0
-                if room_code_db in rooms:
-                    # Use memory room if exists (most up-to-date)
-                    memory_room = rooms[room_code_db]
-                    if memory_room.get('players'):
-                        for color, pid in memory_room['players'].items():
-                            if pid in players and players[pid].get('room_code') == room_code_db:
-                                active_players_count += 1
-                elif room.get('players'):
-                    # Fallback to loaded room if not in memory
-                    for color, pid in room['players'].items():
-                        if pid in players and players[pid].get('room_code') == room_code_db:
-                            active_players_count += 1
-                else:
-                    # Check database socket IDs - but only count if they're actually connected
-                    if orange_socket_id and orange_socket_id in players:
-                        if players[orange_socket_id].get('room_code') == room_code_db:
-                            active_players_count += 1
-                    if blue_socket_id and blue_socket_id in players:
-                        if players[blue_socket_id].get('room_code') == room_code_db:
-                            active_players_count += 1
-                
-                # Get creator username if available
-                creator_username = None
-                if creator_user_id and db_pool:
-                    try:
-                        conn = db_pool.getconn()
-                        cursor = conn.cursor()
-                        cursor.execute("SELECT username FROM users WHERE id = %s", (creator_user_id,))
-                        user_result = cursor.fetchone()
-                        if user_result:
-                            creator_username = user_result[0]
-                        cursor.close()
-                        db_pool.putconn(conn)
-                    except:
-                        if conn:
-                            db_pool.putconn(conn)
-                
-                lobby_rooms.append({
-                    'code': room_code_db,
-                    'name': room_name or room_code_db,
-                    'players': active_players_count,
-                    'maxPlayers': 2,
-                    'hasPassword': password_hash is not None,
-                    'started': started or False,
-                    'creatorSocketId': creator_socket_id,
-                    'creatorUserId': creator_user_id,
-                    'creatorUsername': creator_username
-                })
-            
-            log_debug("Loaded rooms from database", {
-                'db_rooms_count': len(results),
-                'lobby_rooms_count': len(lobby_rooms)
-            })
+            batch = lifecycle.expired_in_db(list(rooms), size)
         except Exception as e:
-            log_error("Error loading rooms from database for lobby list", e)
-            if conn:
-                db_pool.putconn(conn)
-    
-    # Also include rooms from memory that might not be in database yet
-    for room_code, room in rooms.items():
-        if room_code not in db_room_codes:
-            # Count active players (only connected players)
-            active_players_count = 0
-            if room.get('players'):
-                for color, pid in room['players'].items():
-                    # Only count if player is actually connected and in this room
-                    if pid in players and players[pid].get('room_code') == room_code:
-                        active_players_count += 1
-            
-            lobby_rooms.append({
-                'code': room_code,
-                'name': room.get('name', room_code),
-                'players': active_players_count,
-                'maxPlayers': 2,
-                'hasPassword': room.get('password_hash') is not None,
-                'started': room.get('started', False),
-                'creatorSocketId': room.get('creator'),
-                'creatorUserId': None,
-                'creatorUsername': None
-            })
-    
-    log_debug("Lobby list generated", {
-        'total_lobby_rooms': len(lobby_rooms),
-        'rooms_from_db': len(db_room_codes),
-        'rooms_from_memory_only': len(rooms) - len(db_room_codes)
-    })
-    
-    return lobby_rooms
+            log_error("Error finding expired rooms in database", e)
+            break
+        if batch:
+            archived += archive_rooms(batch)
+        batches += 1
+        if len(batch) < size:
+            break
+
+    # Rooms still worth keeping, but idle: the database holds them until someone comes back
+    evicted = rooms.evict_idle(now - ROOM_IDLE_EVICT)
+
+    seconds = time.perf_counter() - started
+    lifecycle.record(archived, seconds)
+    if archived or evicted:
+        log_info("Expired rooms archived", {
+            'archived': len(archived),
+            'evicted': evicted,
+            'batches': batches,
+            'seconds': round(seconds, 3),
+            'rooms_in_memory': len(rooms)
+        })
+    return archived
+
+def room_evictable(room_code, room):
+    """Only rooms the database can give back, with nobody in them and no bot seated, leave the cache"""
+    return persister is not None and not room_in_use(room_code, room) and not seated_bots(room)
+
+def evict_room(room_code, room):
+    """Write an idle room out (fresh snapshot, queued moves) before the cache drops it"""
+    # Leaving memory is not activity: last_active_at keeps the room's own idle clock
+    queue_game_state_save(room_code, active_at=room.get('active_at'))
+    persister.flush([room_code])
+    if persister.pending(room_code):
+        raise RuntimeError(f"state of room {room_code} was not written")
+    lobby_index.update(room_code, started=room.get('started', False))
+    if lobby_broadcaster:
+        # Not lobby_changed(): touching the room would count as a use and keep it in memory
+        lobby_broadcaster.touch(room_code)
+    log_debug("Room evicted from memory", {'room_code': room_code})
+
+def archive_rooms(expired):
+    """Drop [(room_code, reason)] from memory and the lobby, then move them to the archive tables"""
+    codes = {room_code for room_code, _ in expired}
+    for room_code in codes:
+        release_bots(room_code)
+        rooms.pop(room_code, None)
+        lobby_index.remove(room_code)
+        lobby_changed(room_code)
+    if persister:
+        # Queued snapshots and moves land before the rows move to the archive
+        persister.flush(codes)
+    try:
+        return lifecycle.archive(expired)
+    except Exception as e:
+        # The rows stay in three_stones_rooms; the next sweep finds them in the database
+        log_error("Error archiving expired rooms", e, {'count': len(expired)})
+        return []
+
+def load_lobby_index_from_db():
+    """Load lobby metadata for all listed rooms with a single query.
+
+    This is all the boot reads: rows stream through a server-side cursor
+    LOBBY_INDEX_ITERSIZE at a time, and rooms themselves are hydrated by
+    load_room_from_db() when a player first touches them.
+    """
+    if not db_pool:
+        return
+    started = time.perf_counter()
+    try:
+        with db_pool.session() as conn:
+            with conn.cursor(name='three_stones_lobby_index') as cursor:
+                cursor.itersize = LOBBY_INDEX_ITERSIZE
+                cursor.execute(LOBBY_INDEX_SQL)
+                count = lobby_index.load(cursor)
+            conn.commit()  # close the transaction the named cursor ran in
+        # Rooms already hydrated in memory keep their entries
+        for room_code, room in list(rooms.items()):
+            index_room(room_code, room)
+        if lobby_broadcaster:
+            lobby_broadcaster.prime()
+        log_info("Lobby index loaded from database", {
+            'count': count,
+            'seconds': round(time.perf_counter() - started, 3)
+        })
+    except Exception as e:
+        log_error("Error loading lobby index from database", e)
+
+def index_room(room_code, room, creator_user_id=None, creator_username=None):
+    """Make sure an in-memory room has a lobby index entry"""
+    lobby_index.ensure(
+        room_code,
+        name=room.get('name'),
+        hasPassword=room.get('password_hash') is not None,
+        started=room.get('started', False),
+        creatorSocketId=room.get('creator'),
+        creatorUserId=creator_user_id,
+        creatorUsername=creator_username
+    )
+
+def count_active_players(room_code, room):
+    """Count players in the room that are connected and still assigned to it"""
+    count = 0
+    for pid in list(room.get('players', {}).values()):
+        player = players.get(pid)
+        if player and player.get('room_code') == room_code:
+            count += 1
+    return count
+
+def build_lobby_row(room_code, entry):
+    """Lobby row for one room: indexed metadata plus live values from memory"""
+    room = rooms.get(room_code)
+    if room is not None:
+        active_players_count = count_active_players(room_code, room)
+        started = room.get('started', False)
+    else:
+        active_players_count = 0
+        started = entry['started']
+    return {
+        'code': room_code,
+        'name': entry['name'],
+        'players': active_players_count,
+        'maxPlayers': 2,
+        'hasPassword': entry['hasPassword'],
+        'started': started,
+        'creatorSocketId': entry['creatorSocketId'],
+        'creatorUserId': entry['creatorUserId'],
+        'creatorUsername': entry['creatorUsername']
+    }
+
+def get_lobby_list():
+    """Get list of available rooms for lobby (newest first) from the in-memory index"""
+    return [build_lobby_row(room_code, entry) for room_code, entry in lobby_index.newest_first()]
+
+def get_lobby_snapshot():
+    """Full lobby list tagged with the current lobby version"""
+    if lobby_broadcaster:
+        return lobby_broadcaster.snapshot(get_lobby_list)
+    return {'rooms': get_lobby_list(), 'version': 0}
+
+def lobby_changed(room_code):
+    """Announce that a room's lobby row may have changed (sent as a coalesced lobby_delta)"""
+    touch_room(room_code)
+    if lobby_broadcaster:
+        lobby_broadcaster.touch(room_code)
+
+def subscribe_to_lobby(sid):
+    """Put a socket in the lobby room so it receives lobby_delta broadcasts"""
+    if lobby_subscribers.add(sid):
+        join_room(LOBBY_ROOM, sid=sid)
+
+def unsubscribe_from_lobby(sid, disconnected=False):
+    """Take a socket out of the lobby room (entering a match, leaving the lobby screen, disconnect)"""
+    if lobby_subscribers.discard(sid) and not disconnected:
+        leave_room(LOBBY_ROOM, sid=sid)
+
+def get_game_stats():
+    """Room and player counts for the metrics endpoint"""
+    return {
+        'rooms': len(rooms),
+        'rooms_started': sum(1 for room in list(rooms.values()) if room.get('started')),
+        'players': len(players),
+        'disconnect_timers': len(disconnect_timers),
+        'bots': len(bots),
+        'persister': persister.stats() if persister else None,
+        'room_codes': room_codes.stats(),
+        'room_cache': rooms.stats(),
+        'lifecycle': lifecycle.stats() if lifecycle else None
+    }
+
+def get_timer_stats():
+    """Pending delayed room tasks and scheduler counters"""
+    stats = scheduler.stats()
+    stats['disconnect_timers'] = len(disconnect_timers)
+    return stats
+
+def get_lobby_stats():
+    """Lobby subscriber counts and broadcaster counters"""
+    stats = lobby_subscribers.stats()
+    if lobby_broadcaster:
+        stats.update(lobby_broadcaster.stats())
+    return stats
 
 # WebSocket Event Handlers
 def handle_connect():
@@ -490,6 +767,8 @@ def handle_disconnect():
         'current_players_count': len(players)
     })
     
+    unsubscribe_from_lobby(player_id, disconnected=True)
+    
     if player_id in players:
         player_info = players[player_id]
         room_code = player_info.get('room_code')
@@ -503,8 +782,8 @@ def handle_disconnect():
             'color': color
         })
         
-        if room_code and room_code in rooms:
-            room = rooms[room_code]
+        room = get_room(room_code)
+        if room is not None:
             
             # Cancel any existing disconnect timer for this player
             if player_id in disconnect_timers:
@@ -513,136 +792,25 @@ def handle_disconnect():
                 del disconnect_timers[player_id]
                 log_info("Cancelled existing disconnect timer", {'player_id': player_id, 'room_code': room_code})
             
-            # Set a timer to remove player after 10 seconds if they don't reconnect
-            # This gives time for page refresh/reconnection
-            def remove_player_after_timeout():
-                # Check if player still not reconnected (not in players dict with same room)
-                if player_id not in players or players[player_id].get('room_code') != room_code:
-                    log_info("Removing player after disconnect timeout", {
-                        'player_id': player_id,
-                        'username': username,
-                        'room_code': room_code,
-                        'color': color
-                    })
-                    
-                    # Remove player from room if still in room
-                    if room_code in rooms:
-                        room = rooms[room_code]
-                        if color in room['players']:
-                            # Check if this is still the disconnected player
-                            if room['players'][color] == player_id:
-                                del room['players'][color]
-                                
-                                log_info("Player removed from room after timeout", {
-                                    'player_id': player_id,
-                                    'room_code': room_code,
-                                    'color': color,
-                                    'room_players_after': list(room['players'].keys()),
-                                    'room_players_count_after': len(room['players']),
-                                    'room_is_empty': len(room['players']) == 0
-                                })
-                                
-                                # Get updated players list (only remaining players)
-                                players_info = {}
-                                for remaining_color, pid in room['players'].items():
-                                    if pid in players:
-                                        players_info[remaining_color] = players[pid]['username']
-                                
-                                # Notify remaining players
-                                socketio.emit('player_left', {
-                                    'color': color,
-                                    'players': players_info
-                                }, room=room_code)
-                                
-                                log_info("player_left event sent to remaining players (disconnect timeout)", {
-                                    'room_code': room_code,
-                                    'left_color': color,
-                                    'remaining_players_info': players_info,
-                                    'remaining_players_count': len(players_info)
-                                })
-                                
-                                # Reset game if started
-                                if room.get('started'):
-                                    room['started'] = False
-                                    room['game_state'] = None
-                                    if db_pool:
-                                        try:
-                                            conn = db_pool.getconn()
-                                            cursor = conn.cursor()
-                                            cursor.execute("""
-                                                UPDATE three_stones_rooms 
-                                                SET started = FALSE, game_state = NULL, started_at = NULL
-                                                WHERE room_code = %s
-                                            """, (room_code,))
-                                            conn.commit()
-                                            cursor.close()
-                                            db_pool.putconn(conn)
-                                        except Exception as e:
-                                            log_error("Error resetting game", e, {'room_code': room_code})
-                                            if conn:
-                                                db_pool.putconn(conn)
-                                
-                                # Update database
-                                if not room['players']:
-                                    log_info("Room is now empty but kept for creator to delete", {
-                                        'room_code': room_code,
-                                        'creator': room.get('creator')
-                                    })
-                                    socketio.emit('lobby_list', {'rooms': get_lobby_list()})
-                                else:
-                                    # Update room player in database (remove player)
-                                    if color == 'orange':
-                                        if db_pool:
-                                            try:
-                                                conn = db_pool.getconn()
-                                                cursor = conn.cursor()
-                                                cursor.execute("""
-                                                    UPDATE three_stones_rooms 
-                                                    SET orange_player_id = NULL, orange_socket_id = NULL
-                                                    WHERE room_code = %s
-                                                """, (room_code,))
-                                                conn.commit()
-                                                cursor.close()
-                                                db_pool.putconn(conn)
-                                            except Exception as e:
-                                                log_error("Error updating room player", e, {'room_code': room_code, 'color': 'orange'})
-                                                if conn:
-                                                    db_pool.putconn(conn)
-                                    elif color == 'blue':
-                                        if db_pool:
-                                            try:
-                                                conn = db_pool.getconn()
-                                                cursor = conn.cursor()
-                                                cursor.execute("""
-                                                    UPDATE three_stones_rooms 
-                                                    SET blue_player_id = NULL, blue_socket_id = NULL
-                                                    WHERE room_code = %s
-                                                """, (room_code,))
-                                                conn.commit()
-                                                cursor.close()
-                                                db_pool.putconn(conn)
-                                            except Exception as e:
-                                                log_error("Error updating room player", e, {'room_code': room_code, 'color': 'blue'})
-                                                if conn:
-                                                    db_pool.putconn(conn)
-                                    
-                                    # Broadcast lobby update
-                                    socketio.emit('lobby_list', {'rooms': get_lobby_list()})
-                    
-                    # Remove from disconnect timers
-                    if player_id in disconnect_timers:
-                        del disconnect_timers[player_id]
+            # Remember whose seat this is so a rejoin within the grace period needs no database lookup
+            if color:
+                room.setdefault('away', {})[color] = username
             
-            # Set timer for 10 seconds
-            timer = threading.Timer(10.0, remove_player_after_timeout)
-            disconnect_timers[player_id] = timer
-            timer.start()
+            # Remove player after the grace period if they don't reconnect
+            # This gives time for page refresh/reconnection
+            disconnect_timers[player_id] = scheduler.schedule(
+                DISCONNECT_GRACE_SECONDS,
+                db_scoped(remove_player_after_timeout),
+                player_id, username, room_code, color
+            )
             
-            log_info("Disconnect timer started - player will be removed after 10 seconds if not reconnected", {
+            log_info("Disconnect timer started - player will be removed after the grace period if not reconnected", {
                 'player_id': player_id,
                 'username': username,
                 'room_code': room_code,
-                'color': color
+                'color': color,
+                'grace_seconds': DISCONNECT_GRACE_SECONDS,
+                'pending_timers': scheduler.pending()
             })
             
             # Don't remove player immediately - keep them in room for potential reconnection
@@ -654,6 +822,10 @@ def handle_disconnect():
         # This prevents them from making moves but allows reconnection
         if player_id in players:
             del players[player_id]
+        
+        # Active player count in the lobby drops right away
+        if room_code:
+            lobby_changed(room_code)
     
     # Use debug level for disconnect logs unless player was in a room
     if room_code:
@@ -665,6 +837,79 @@ def handle_disconnect():
     else:
         log_debug("Client disconnected", {'socket_id': request.sid, 'player_id': player_id})
 
+def remove_player_after_timeout(player_id, username, room_code, color):
+    """Disconnect grace period expired: drop the player from the room unless they reconnected"""
+    # The task has fired, so it no longer needs cancelling
+    disconnect_timers.pop(player_id, None)
+    # Check if player still not reconnected (not in players dict with same room)
+    if player_id not in players or players[player_id].get('room_code') != room_code:
+        log_info("Removing player after disconnect timeout", {
+            'player_id': player_id,
+            'username': username,
+            'room_code': room_code,
+            'color': color
+        })
+        
+        # Remove player from room if still in room
+        room = rooms.lookup(room_code)
+        if room is not None:
+            if room.get('away', {}).get(color) == username:
+                del room['away'][color]
+            if color in room['players']:
+                # Check if this is still the disconnected player
+                if room['players'][color] == player_id:
+                    del room['players'][color]
+                    
+                    log_info("Player removed from room after timeout", {
+                        'player_id': player_id,
+                        'room_code': room_code,
+                        'color': color,
+                        'room_players_after': list(room['players'].keys()),
+                        'room_players_count_after': len(room['players']),
+                        'room_is_empty': len(room['players']) == 0
+                    })
+                    
+                    # Get updated players list (only remaining players)
+                    players_info = {}
+                    for remaining_color, pid in room['players'].items():
+                        if pid in players:
+                            players_info[remaining_color] = players[pid]['username']
+                    
+                    # Notify remaining players
+                    socketio.emit('player_left', {
+                        'color': color,
+                        'players': players_info
+                    }, room=room_code)
+                    
+                    log_info("player_left event sent to remaining players (disconnect timeout)", {
+                        'room_code': room_code,
+                        'left_color': color,
+                        'remaining_players_info': players_info,
+                        'remaining_players_count': len(players_info)
+                    })
+                    
+                    # Reset game if started
+                    if room.get('started'):
+                        set_room_started(room_code, room, False)
+                        room['game_state'] = None
+                        reset_game_in_db(room_code)
+                    
+                    # Update database
+                    if not room['players']:
+                        log_info("Room is now empty but kept for creator to delete", {
+                            'room_code': room_code,
+                            'creator': room.get('creator')
+                        })
+                    else:
+                        # Update room player in database (remove player)
+                        update_room_player_in_db(room_code, color, None, None)
+                    
+                    # Bots do not keep a room on their own
+                    release_bots(room_code)
+                    
+                    # Broadcast lobby update
+                    lobby_changed(room_code)
+
 def handle_leave_room(data):
     player_id = request.sid
     room_code = data.get('roomCode', '')
@@ -678,9 +923,9 @@ def handle_leave_room(data):
         'current_players_count': len(players)
     })
     
-    if player_id in players and room_code in rooms:
+    room = rooms.lookup(room_code) if player_id in players else None
+    if room is not None:
         player_info = players[player_id]
-        room = rooms[room_code]
         color = player_info.get('color')
         
         log_info("Player leaving room - before removal", {
@@ -755,66 +1000,15 @@ def handle_leave_room(data):
         
         # Reset game if started (so room can be reused)
         # Always reset game state when player leaves, even if game wasn't started yet
-        room['started'] = False
+        set_room_started(room_code, room, False)
         room['game_state'] = None
         room['dice'] = {}  # Reset dice state
         
         # Update database to mark game as not started and clear game state
-        if db_pool:
-            try:
-                conn = db_pool.getconn()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE three_stones_rooms 
-                    SET started = FALSE, game_state = NULL, started_at = NULL
-                    WHERE room_code = %s
-                """, (room_code,))
-                conn.commit()
-                cursor.close()
-                db_pool.putconn(conn)
-                log_info("Game state reset in database", {'room_code': room_code})
-            except Exception as e:
-                log_error("Error resetting game", e, {'room_code': room_code})
-                if conn:
-                    db_pool.putconn(conn)
+        reset_game_in_db(room_code)
         
         # Update room player in database (remove player) - ALWAYS update, even if room is empty
-        if color == 'orange':
-            if db_pool:
-                try:
-                    conn = db_pool.getconn()
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        UPDATE three_stones_rooms 
-                        SET orange_player_id = NULL, orange_socket_id = NULL
-                        WHERE room_code = %s
-                    """, (room_code,))
-                    conn.commit()
-                    cursor.close()
-                    db_pool.putconn(conn)
-                    log_info("Orange player removed from database", {'room_code': room_code})
-                except Exception as e:
-                    log_error("Error updating room player", e, {'room_code': room_code, 'color': 'orange'})
-                    if conn:
-                        db_pool.putconn(conn)
-        elif color == 'blue':
-            if db_pool:
-                try:
-                    conn = db_pool.getconn()
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        UPDATE three_stones_rooms 
-                        SET blue_player_id = NULL, blue_socket_id = NULL
-                        WHERE room_code = %s
-                    """, (room_code,))
-                    conn.commit()
-                    cursor.close()
-                    db_pool.putconn(conn)
-                    log_info("Blue player removed from database", {'room_code': room_code})
-                except Exception as e:
-                    log_error("Error updating room player", e, {'room_code': room_code, 'color': 'blue'})
-                    if conn:
-                        db_pool.putconn(conn)
+        update_room_player_in_db(room_code, color, None, None)
         
         # Rooms are now persistent - don't delete empty rooms automatically
         # Only creator can delete rooms explicitly
@@ -824,18 +1018,11 @@ def handle_leave_room(data):
                 'creator': room.get('creator')
             })
         
-        # ALWAYS broadcast lobby update to all clients (not just room)
-        # This ensures lobby list is updated immediately when player leaves
-        def broadcast_lobby_update():
-            time.sleep(0.1)  # Small delay to ensure database is updated
-            lobby_list = get_lobby_list()
-            socketio.emit('lobby_list', {'rooms': lobby_list})
-            log_info("Lobby list broadcasted after player left", {
-                'room_code': room_code,
-                'lobby_rooms_count': len(lobby_list)
-            })
+        # Bots do not keep a room on their own
+        release_bots(room_code)
         
-        threading.Thread(target=broadcast_lobby_update, daemon=True).start()
+        # ALWAYS broadcast lobby update to all clients (not just room)
+        lobby_changed(room_code)
         
         # Send confirmation to leaving player that they left successfully
         emit('room_left', {'roomCode': room_code})
@@ -870,8 +1057,8 @@ def handle_delete_room(data):
     room = None
     is_creator = False
     
-    if room_code in rooms:
-        room = rooms[room_code]
+    room = rooms.lookup(room_code)
+    if room is not None:
         # Check if player is the creator by socket ID
         if room.get('creator') == player_id:
             is_creator = True
@@ -886,36 +1073,32 @@ def handle_delete_room(data):
     # Check if player is creator by checking database
     if db_pool:
         try:
-            conn = db_pool.getconn()
-            cursor = conn.cursor()
-            # Get creator info from database
-            cursor.execute("""
-                SELECT creator_user_id, creator_socket_id
-                FROM three_stones_rooms
-                WHERE room_code = %s
-            """, (room_code,))
-            result = cursor.fetchone()
-            cursor.close()
-            db_pool.putconn(conn)
-            
-            if result:
-                creator_user_id, creator_socket_id = result
-                # Check by socket ID or user ID
-                if creator_socket_id == player_id:
-                    is_creator = True
-                elif creator_user_id:
-                    # Get user ID from username
-                    username = None
-                    if player_id in players:
-                        username = players[player_id].get('username')
-                    if username:
-                        user_id = get_user_id_from_username(username)
-                        if user_id == creator_user_id:
-                            is_creator = True
+            with db_pool.session() as conn:
+                with conn.cursor() as cursor:
+                    # Get creator info from database
+                    cursor.execute("""
+                        SELECT creator_user_id, creator_socket_id
+                        FROM three_stones_rooms
+                        WHERE room_code = %s
+                    """, (room_code,))
+                    result = cursor.fetchone()
+                
+                if result:
+                    creator_user_id, creator_socket_id = result
+                    # Check by socket ID or user ID
+                    if creator_socket_id == player_id:
+                        is_creator = True
+                    elif creator_user_id:
+                        # Get user ID from username (reuses this session's connection)
+                        username = None
+                        if player_id in players:
+                            username = players[player_id].get('username')
+                        if username:
+                            user_id = get_user_id_from_username(username)
+                            if user_id == creator_user_id:
+                                is_creator = True
         except Exception as e:
             log_error("Error checking creator in delete_room", e, {'room_code': room_code, 'player_id': player_id})
-            if conn:
-                db_pool.putconn(conn)
     
     if is_creator:
         log_info("Creator confirmed, deleting room", {
@@ -941,12 +1124,12 @@ def handle_delete_room(data):
         # Delete room from database
         delete_room_from_db(room_code)
         
-        # Remove room from memory
-        if room_code in rooms:
-            del rooms[room_code]
+        # Remove room from memory and lobby index
+        rooms.pop(room_code, None)
+        lobby_index.remove(room_code)
         
         # Broadcast lobby update
-        socketio.emit('lobby_list', {'rooms': get_lobby_list()})
+        lobby_changed(room_code)
         
         log_info("=== ROOM DELETED ===", {
             'room_code': room_code,
@@ -994,44 +1177,8 @@ def handle_create_room(data):
             leave_data = {'roomCode': current_room_code}
             handle_leave_room(leave_data)
     
-    # Generate room code - check both memory and database
-    room_code = generate_room_code()
-    max_attempts = 100
-    attempts = 0
-    while attempts < max_attempts:
-        # Check memory
-        if room_code in rooms:
-            room_code = generate_room_code()
-            attempts += 1
-            continue
-        
-        # Check database
-        if db_pool:
-            try:
-                conn = db_pool.getconn()
-                cursor = conn.cursor()
-                cursor.execute("SELECT room_code FROM three_stones_rooms WHERE room_code = %s", (room_code,))
-                if cursor.fetchone():
-                    cursor.close()
-                    db_pool.putconn(conn)
-                    room_code = generate_room_code()
-                    attempts += 1
-                    continue
-                cursor.close()
-                db_pool.putconn(conn)
-                break
-            except Exception as e:
-                log_error("Error checking room code in database", e, {'room_code': room_code, 'attempt': attempts})
-                if conn:
-                    db_pool.putconn(conn)
-                break
-        else:
-            break
-    
-    if attempts >= max_attempts:
-        log_error("Failed to generate unique room code", None, {'max_attempts': max_attempts})
-        emit('error', {'message': 'Otaq yaradıla bilmədi'})
-        return
+    # Allocate a room code (from a leased block - no database lookup)
+    room_code = allocate_room_code()
     
     # Hash password if provided
     password_hash = None
@@ -1066,11 +1213,36 @@ def handle_create_room(data):
         'creator_color': 'orange'
     })
     
-    # Save room to database
-    save_room_to_db(room_code, room_name, password_hash, player_id, username)
+    # Save room to database, with a new code in the rare case an old random code is already there.
+    # A failed write is not retried: the database is in trouble, and retrying at once only adds load
+    max_attempts = 5
+    for attempt in range(max_attempts):
+        inserted, creator_user_id = save_room_to_db(room_code, room_name, password_hash, player_id, username)
+        if inserted is not False:
+            break
+        log_warning("Room code already taken, allocating another", {'room_code': room_code, 'attempt': attempt})
+        room_code = allocate_room_code()
+        players[player_id]['room_code'] = room_code
+    if not inserted:
+        log_error("Failed to save room", None, {
+            'room_code': room_code,
+            'reason': 'database error' if inserted is None else 'no free code',
+            'attempts': attempt + 1
+        })
+        players.pop(player_id, None)
+        emit('error', {'message': 'Otaq yaradıla bilmədi'})
+        return
     
-    # Add room to memory
+    # Add room to memory and lobby index
     rooms[room_code] = room
+    lobby_index.add(
+        room_code,
+        room_name,
+        password_hash is not None,
+        player_id,
+        creator_user_id=creator_user_id,
+        creator_username=username if creator_user_id else None
+    )
     
     log_info("Room added to memory", {
         'room_code': room_code,
@@ -1078,8 +1250,9 @@ def handle_create_room(data):
         'room_players': list(room['players'].keys())
     })
     
-    # Join socket room
+    # Join socket room; lobby updates are not needed while in a match
     join_room(room_code)
+    unsubscribe_from_lobby(player_id)
     
     log_info("Player joined socket room", {
         'player_id': player_id,
@@ -1122,17 +1295,7 @@ def handle_create_room(data):
     })
     
     # Broadcast lobby update to all clients
-    def broadcast_lobby_update():
-        time.sleep(0.1)
-        lobby_list = get_lobby_list()
-        log_info("Broadcasting lobby list update", {
-            'room_code': room_code,
-            'lobby_rooms_count': len(lobby_list),
-            'lobby_rooms': lobby_list
-        })
-        socketio.emit('lobby_list', {'rooms': lobby_list})
-    
-    threading.Thread(target=broadcast_lobby_update, daemon=True).start()
+    lobby_changed(room_code)
     
     log_info("=== ROOM CREATED SUCCESSFULLY ===", {
         'room_code': room_code,
@@ -1174,8 +1337,9 @@ def handle_join_room(data):
             leave_data = {'roomCode': current_room_code}
             handle_leave_room(leave_data)
     
-    # Try to load room from database if not in memory
-    if room_code not in rooms:
+    # One lookup, so an eviction running meanwhile cannot drop the room; load it from the database if not in memory
+    room = rooms.lookup(room_code)
+    if room is None:
         log_info("Room not in memory, loading from database", {'room_code': room_code})
         room = load_room_from_db(room_code)
         if not room:
@@ -1189,7 +1353,6 @@ def handle_join_room(data):
             'started': room.get('started', False)
         })
     else:
-        room = rooms[room_code]
         log_info("Room found in memory", {
             'room_code': room_code,
             'room_name': room.get('name'),
@@ -1269,8 +1432,9 @@ def handle_join_room(data):
     # Update room player in database
     update_room_player_in_db(room_code, player_color, player_id, username)
     
-    # Join socket room
+    # Join socket room; lobby updates are not needed while in a match
     join_room(room_code)
+    unsubscribe_from_lobby(player_id)
     
     log_info("Player joined socket room", {
         'player_id': player_id,
@@ -1325,38 +1489,177 @@ def handle_join_room(data):
     # When second player joins, initialize game state but don't start yet
     # Wait for dice roll to determine who starts
     if len(room['players']) == 2:
-        # Initialize game state (stones will be placed after dice roll)
-        room['game_state'] = {
-            'orangeStones': [
-                {'id': 'orange-1', 'nodeId': 'LT', 'reachedGoal': False, 'number': 1},
-                {'id': 'orange-2', 'nodeId': 'LM', 'reachedGoal': False, 'number': 2},
-                {'id': 'orange-3', 'nodeId': 'LB', 'reachedGoal': False, 'number': 3}
-            ],
-            'blueStones': [
-                {'id': 'blue-1', 'nodeId': 'RT', 'reachedGoal': False, 'number': 1},
-                {'id': 'blue-2', 'nodeId': 'RM', 'reachedGoal': False, 'number': 2},
-                {'id': 'blue-3', 'nodeId': 'RB', 'reachedGoal': False, 'number': 3}
-            ],
-            'currentTurn': 'orange',  # Will be set after dice roll
-            'gameOver': False,
-            'winner': None
-        }
-        room['started'] = False  # Don't mark as started yet - wait for dice roll
-        room['dice'] = {}  # Initialize dice dict for rolls
-        
-        # Notify both players to show dice modal
-        socketio.emit('game_start', {
-            'gameState': room['game_state'],
-            'waitForDice': True  # Signal that dice roll is needed
-        }, room=room_code)
-        
-        log_info("Game state initialized, waiting for dice roll", {'room_code': room_code, 'players': len(room['players'])})
+        begin_dice_phase(room_code, room)
     
     # Broadcast lobby update to all clients
-    def broadcast_lobby_update():
-        time.sleep(0.1)
-        socketio.emit('lobby_list', {'rooms': get_lobby_list()})
-    threading.Thread(target=broadcast_lobby_update, daemon=True).start()
+    lobby_changed(room_code)
+
+def begin_dice_phase(room_code, room):
+    """Both seats are taken: set up the opening position and ask both players to roll"""
+    # Initialize game state (stones will be placed after dice roll)
+    room['game_state'] = {
+        'schemaVersion': SCHEMA_VERSION,
+        'orangeStones': [
+            {'id': 'orange-1', 'nodeId': '10', 'reachedGoal': False, 'number': 1},
+            {'id': 'orange-2', 'nodeId': '9', 'reachedGoal': False, 'number': 2},
+            {'id': 'orange-3', 'nodeId': '8', 'reachedGoal': False, 'number': 3}
+        ],
+        'blueStones': [
+            {'id': 'blue-1', 'nodeId': '5', 'reachedGoal': False, 'number': 1},
+            {'id': 'blue-2', 'nodeId': '6', 'reachedGoal': False, 'number': 2},
+            {'id': 'blue-3', 'nodeId': '7', 'reachedGoal': False, 'number': 3}
+        ],
+        'currentTurn': 'orange',  # Will be set after dice roll
+        'gameOver': False,
+        'winner': None
+    }
+    set_room_started(room_code, room, False)  # Don't mark as started yet - wait for dice roll
+    room['dice'] = {}  # Initialize dice dict for rolls
+    
+    # Notify both players to show dice modal
+    socketio.emit('game_start', record_event(room, 'game_start', {
+        'gameState': copy.deepcopy(room['game_state']),
+        'waitForDice': True  # Signal that dice roll is needed
+    }), room=room_code)
+    
+    log_info("Game state initialized, waiting for dice roll", {'room_code': room_code, 'players': len(room['players'])})
+    
+    for bot in seated_bots(room):
+        bot.plies = 0
+    schedule_bot_rolls(room_code)
+
+def seated_bots(room):
+    return [bots[pid] for pid in list(room.get('players', {}).values()) if pid in bots]
+
+def has_human_player(room):
+    """True while a human holds a seat (including one inside the reconnect grace period)"""
+    return any(pid not in bots for pid in list(room.get('players', {}).values()))
+
+def seat_bot(room_code, level=DEFAULT_LEVEL):
+    """Put a bot in the room's free seat; returns its color or None if the room is full or gone"""
+    room = get_room(room_code)
+    if room is None:
+        return None
+    color = next((c for c in ('orange', 'blue') if c not in room['players']), None)
+    if color is None:
+        return None
+    bot_id = f'{BOT_PREFIX}{room_code}:{color}'
+    bot = Bot(bot_id, level)
+    bots[bot_id] = bot
+    room['players'][color] = bot_id
+    players[bot_id] = {
+        'username': f'Bot ({bot.level})',
+        'room_code': room_code,
+        'color': color,
+        'bot': True
+    }
+    update_room_player_in_db(room_code, color, bot_id, None)
+    
+    log_info("Bot seated", {'room_code': room_code, 'bot_id': bot_id, 'color': color, 'level': bot.level})
+    
+    players_info = {c: players[pid]['username'] for c, pid in room['players'].items() if pid in players}
+    socketio.emit('player_joined', {'players': players_info}, room=room_code)
+    lobby_changed(room_code)
+    
+    if len(room['players']) == 2:
+        begin_dice_phase(room_code, room)
+    return color
+
+def release_bots(room_code):
+    """Unseat the room's bots once no human is left in it"""
+    room = rooms.get(room_code)
+    if room is None or has_human_player(room):
+        return
+    for color, pid in list(room['players'].items()):
+        if pid in bots:
+            del room['players'][color]
+            players.pop(pid, None)
+            del bots[pid]
+            update_room_player_in_db(room_code, color, None, None)
+            log_info("Bot released", {'room_code': room_code, 'bot_id': pid})
+
+def schedule_bot_rolls(room_code):
+    room = rooms.get(room_code)
+    if room is None:
+        return
+    for bot in seated_bots(room):
+        bot_runner.submit(db_scoped(roll_bot_dice), room_code, bot.player_id)
+
+def roll_bot_dice(room_code, bot_id):
+    """Bot's dice roll (runs on the timer thread, or inline when headless)"""
+    room = rooms.get(room_code)
+    bot = bots.get(bot_id)
+    if room is None or bot is None or players.get(bot_id, {}).get('room_code') != room_code:
+        return
+    if room.get('started') or bot_id in room.get('dice', {}):
+        return
+    roll_dice(bot_id, bot.rng.randint(1, 6))
+
+def schedule_bot_turn(room_code):
+    """Queue a move if the side to move is a bot"""
+    room = rooms.get(room_code)
+    game_state = room.get('game_state') if room else None
+    if not game_state or game_state.get('gameOver'):
+        return
+    bot_id = room['players'].get(game_state.get('currentTurn'))
+    if bot_id in bots:
+        bot_runner.submit(db_scoped(play_bot_turn), room_code, bot_id)
+
+def play_bot_turn(room_code, bot_id):
+    """Bot move through the same validation and broadcast path as a client's make_move"""
+    room = rooms.get(room_code)
+    bot = bots.get(bot_id)
+    player = players.get(bot_id)
+    if room is None or bot is None or not player or player.get('room_code') != room_code:
+        return
+    game_state = room.get('game_state')
+    color = player['color']
+    if not game_state or game_state.get('gameOver') or game_state.get('currentTurn') != color:
+        return
+    if bot_runner.max_plies and bot.plies >= bot_runner.max_plies and not has_human_player(room):
+        return
+    move = bot.choose_move(rules, position_table, game_state, color)
+    if move is None:
+        log_warning("Bot has no legal move", {'room_code': room_code, 'bot_id': bot_id})
+        return
+    bot.plies += 1
+    error = make_move(bot_id, move)
+    if error:
+        log_warning("Bot move rejected", {'room_code': room_code, 'bot_id': bot_id, 'move': move, 'error': error})
+
+def open_bot_room(name='Bot match', levels=(DEFAULT_LEVEL, DEFAULT_LEVEL)):
+    """Memory-only bot-vs-bot room for soak runs; with an inline bot runner the game is over when this returns"""
+    room_code = allocate_room_code()
+    rooms[room_code] = {
+        'name': name,
+        'password_hash': None,
+        'players': {},
+        'game_state': None,
+        'started': False,
+        'created_at': datetime.now(UTC),
+        'creator': None
+    }
+    lobby_index.add(room_code, name, False, None)
+    for level in levels:
+        seat_bot(room_code, level)
+    return room_code
+
+def close_bot_room(room_code):
+    release_bots(room_code)
+    rooms.pop(room_code, None)
+    lobby_index.remove(room_code)
+    lobby_changed(room_code)
+
+def handle_add_bot(data):
+    """A player in a room fills its empty seat with a bot"""
+    player_id = request.sid
+    data = data or {}
+    room_code = data.get('roomCode', '').upper()
+    if not room_code or players.get(player_id, {}).get('room_code') != room_code:
+        emit('error', {'message': 'Otaq uyğun deyil'})
+        return
+    if not seat_bot(room_code, data.get('level', DEFAULT_LEVEL)):
+        emit('error', {'message': 'Otaq doludur'})
 
 def handle_rejoin_room(data):
     """Handle reconnection to a room after page refresh"""
@@ -1373,8 +1676,9 @@ def handle_rejoin_room(data):
         'current_players_count': len(players)
     })
     
-    # Try to load room from database if not in memory
-    if room_code not in rooms:
+    # One lookup, so an eviction running meanwhile cannot drop the room; load it from the database if not in memory
+    room = rooms.lookup(room_code)
+    if room is None:
         log_info("Room not in memory, loading from database", {'room_code': room_code})
         room = load_room_from_db(room_code)
         if not room:
@@ -1388,7 +1692,6 @@ def handle_rejoin_room(data):
             'started': room.get('started', False)
         })
     else:
-        room = rooms[room_code]
         log_info("Room found in memory for rejoin", {
             'room_code': room_code,
             'room_name': room.get('name'),
@@ -1397,37 +1700,51 @@ def handle_rejoin_room(data):
             'started': room.get('started', False)
         })
     
-    # Check if player was in this room before (check database)
+    # Check if player was in this room before
     player_color = None
     is_creator = False
     
-    if db_pool:
+    # A player back within the disconnect grace period still has their seat in memory
+    for color, away_username in room.get('away', {}).items():
+        if away_username == username and color in room['players']:
+            player_color = color
+            break
+    
+    if player_color:
+        log_debug("Rejoining player matched from memory", {
+            'room_code': room_code,
+            'username': username,
+            'player_color': player_color
+        })
+    elif db_pool:
+        # Otherwise look the seat up in the database
         try:
-            conn = db_pool.getconn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT orange_player_id, blue_player_id, creator_user_id, game_state, started
-                FROM three_stones_rooms
-                WHERE room_code = %s
-            """, (room_code,))
-            result = cursor.fetchone()
-            cursor.close()
-            db_pool.putconn(conn)
-            
-            if result:
-                orange_player_id, blue_player_id, creator_user_id, db_game_state, started = result
+            with db_pool.session() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT orange_player_id, blue_player_id, creator_user_id, game_state, game_state_packed,
+                           game_state_seq, started
+                    FROM three_stones_rooms
+                    WHERE room_code = %s
+                """, (room_code,))
+                result = cursor.fetchone()
+                
+                # Moves after the stored snapshot, needed only if memory lost the game state
+                moves = []
+                if result and result[6] and not room.get('game_state'):
+                    cursor.execute(MOVES_AFTER_SQL, (room_code, result[5] or 0))
+                    moves = cursor.fetchall()
                 
-                # Get user ID from username
+                # Get user ID from username on the same connection
                 user_id = None
-                if username:
-                    conn = db_pool.getconn()
-                    cursor = conn.cursor()
+                if result and username:
                     cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
                     user_result = cursor.fetchone()
                     if user_result:
                         user_id = user_result[0]
-                    cursor.close()
-                    db_pool.putconn(conn)
+            
+            if result:
+                orange_player_id, blue_player_id, creator_user_id, db_game_state, db_game_state_packed, \
+                    db_game_state_seq, started = result
                 
                 # Determine player color based on user ID
                 if user_id:
@@ -1443,13 +1760,14 @@ def handle_rejoin_room(data):
                         # Player rejoins as regular player, not as creator
                         is_creator = False
                 
-                # Restore game state from database if available
-                if db_game_state and started:
-                    try:
-                        room['game_state'] = json.loads(db_game_state) if isinstance(db_game_state, str) else db_game_state
-                        room['started'] = started
-                    except:
-                        pass
+                # Restore game state from database only if memory has none
+                # (memory is authoritative; the database lags by the write-behind interval)
+                if (db_game_state or db_game_state_packed is not None) and started and not room.get('game_state'):
+                    game_state = parse_stored_game_state(db_game_state, db_game_state_packed)
+                    if game_state is not None:
+                        room['game_state'] = game_state
+                        set_room_started(room_code, room, started)
+                        restore_room_seq(room, db_game_state_seq, moves)
         except Exception as e:
             log_error("Error checking rejoin room", e, {'room_code': room_code, 'username': username})
     
@@ -1534,6 +1852,7 @@ def handle_rejoin_room(data):
     
     # Add player back to room
     room['players'][player_color] = player_id
+    room.get('away', {}).pop(player_color, None)
     players[player_id] = {
         'username': username,
         'room_code': room_code,
@@ -1553,8 +1872,9 @@ def handle_rejoin_room(data):
     # Update room player in database
     update_room_player_in_db(room_code, player_color, player_id, username)
     
-    # Join socket room
+    # Join socket room; lobby updates are not needed while in a match
     join_room(room_code)
+    unsubscribe_from_lobby(player_id)
     
     log_info("Player rejoined socket room", {
         'player_id': player_id,
@@ -1563,23 +1883,44 @@ def handle_rejoin_room(data):
         'socket_room': room_code
     })
     
+    # A client that sends the last sequence number it saw gets exactly the events it
+    # missed from the room's event log; a full snapshot only once the log has moved past it
+    client_seq = data.get('seq')
+    missed = room['events'].since(client_seq, current_seq(room)) if 'events' in room else None
+    
     # Notify player that they rejoined
     # Note: isCreator is always False on rejoin - creator rejoins as regular player
     # but can still delete empty room (checked by creator_user_id in database)
-    emit('room_rejoined', {
-        'roomCode': room_code,
-        'playerId': player_id,
-        'playerColor': player_color,
-        'isCreator': False,  # Always False on rejoin - player rejoins as regular player
-        'gameState': room.get('game_state') if room.get('started') else None
-    })
+    if missed is not None:
+        emit('room_rejoined', {
+            'roomCode': room_code,
+            'playerId': player_id,
+            'playerColor': player_color,
+            'isCreator': False,
+            'gameState': None,
+            'seq': client_seq,
+            'replay': True  # Keep the client's state; missed events follow
+        })
+        for event, payload in missed:
+            emit(event, payload)
+    else:
+        emit('room_rejoined', {
+            'roomCode': room_code,
+            'playerId': player_id,
+            'playerColor': player_color,
+            'isCreator': False,  # Always False on rejoin - player rejoins as regular player
+            'gameState': room.get('game_state') if room.get('started') else None,
+            'seq': current_seq(room)
+        })
     
     log_info("room_rejoined event sent to player", {
         'player_id': player_id,
         'username': username,
         'room_code': room_code,
         'is_creator': is_creator,
-        'has_game_state': room.get('game_state') is not None
+        'has_game_state': room.get('game_state') is not None,
+        'client_seq': client_seq,
+        'replayed_events': len(missed) if missed is not None else None
     })
     
     # Update players list
@@ -1601,21 +1942,27 @@ def handle_rejoin_room(data):
         'players_info': players_info,
         'room_players_count': len(room['players'])
     })
+    
+    lobby_changed(room_code)
 
 def handle_roll_dice(data):
     """Handle dice rolls from players; broadcast to room and decide starter when both rolled"""
-    player_id = request.sid
     try:
         roll = int(data.get('roll', 0) or 0)
     except Exception:
         roll = 0
+    error = roll_dice(request.sid, roll)
+    if error:
+        emit('error', {'message': error})
+
+def roll_dice(player_id, roll):
+    """Record a player's roll; returns an error message or None"""
     username = players.get(player_id, {}).get('username', 'Player')
     player_color = players.get(player_id, {}).get('color')
     room_code = players.get(player_id, {}).get('room_code')
-    if not room_code or room_code not in rooms:
-        emit('error', {'message': 'Otaq tapılmadı'})
-        return
-    room = rooms[room_code]
+    room = get_room(room_code)
+    if room is None:
+        return 'Otaq tapılmadı'
     if 'dice' not in room:
         room['dice'] = {}
     # Server-side clamp/randomize
@@ -1624,11 +1971,11 @@ def handle_roll_dice(data):
     room['dice'][player_id] = roll
     
     # Broadcast roll to room with player color
-    socketio.emit('dice_roll', {
+    socketio.emit('dice_roll', record_event(room, 'dice_roll', {
         'username': username,
         'roll': roll,
         'color': player_color
-    }, room=room_code)
+    }), room=room_code)
     
     log_info("Dice roll received", {
         'room_code': room_code,
@@ -1648,12 +1995,13 @@ def handle_roll_dice(data):
             if o == b:
                 # Tie - reset dice and ask to roll again
                 room['dice'] = {}
-                socketio.emit('dice_result', {
+                socketio.emit('dice_result', record_event(room, 'dice_result', {
                     'rolls': {'orange': o, 'blue': b},
                     'starter': None,
                     'tie': True
-                }, room=room_code)
+                }), room=room_code)
                 log_info("Dice tie - resetting", {'room_code': room_code, 'orange': o, 'blue': b})
+                schedule_bot_rolls(room_code)
                 return
             
             # Determine starter
@@ -1662,35 +2010,17 @@ def handle_roll_dice(data):
             # Update game state
             if room.get('game_state'):
                 room['game_state']['currentTurn'] = starter
-                room['started'] = True  # Mark game as started after dice roll
+                set_room_started(room_code, room, True)  # Mark game as started after dice roll
                 
-                # Save to database
-                if db_pool:
-                    try:
-                        conn = db_pool.getconn()
-                        cursor = conn.cursor()
-                        cursor.execute("""
-                            UPDATE three_stones_rooms 
-                            SET started = TRUE, started_at = %s, game_state = %s
-                            WHERE room_code = %s
-                        """, (datetime.now(UTC), json.dumps(room['game_state']), room_code))
-                        conn.commit()
-                        cursor.close()
-                        db_pool.putconn(conn)
-                    except Exception as e:
-                        log_error("Error updating game state after dice", e, {'room_code': room_code})
-                        if conn:
-                            db_pool.putconn(conn)
+                # Save to database (write-behind)
+                queue_game_state_save(room_code, started=True, started_at=datetime.now(UTC))
             
-            # Send dice result with both rolls and starter
-            socketio.emit('dice_result', {
+            # Send dice result with both rolls and starter; the starter is the
+            # only change to the game state, so clients apply it as a delta
+            socketio.emit('dice_result', record_event(room, 'dice_result', {
                 'rolls': {'orange': o, 'blue': b},
                 'starter': starter
-            }, room=room_code)
-            
-            # Send updated game state
-            if room.get('game_state'):
-                socketio.emit('game_state', {'gameState': room['game_state']}, room=room_code)
+            }), room=room_code)
             
             log_info("Dice result determined", {
                 'room_code': room_code,
@@ -1698,6 +2028,7 @@ def handle_roll_dice(data):
                 'blue_roll': b,
                 'starter': starter
             })
+            schedule_bot_turn(room_code)
 
 def handle_request_roll(data):
     """Authoritative server-side dice roll (no client-provided value)"""
@@ -1714,28 +2045,80 @@ def handle_request_roll(data):
         return
     
     # Generate random roll and process it
-    roll = random.randint(1, 6)
-    handle_roll_dice({'roll': roll})
+    error = roll_dice(player_id, random.randint(1, 6))
+    if error:
+        emit('error', {'message': error})
 
-def handle_get_lobby_list(data):
-    """Send lobby list to client"""
+def handle_get_lobby_list(data=None):
+    """Send a full lobby snapshot (initial load, or after the client saw a lobby_delta version gap)"""
     player_id = request.sid
-    lobby_list = get_lobby_list()
+    snapshot = get_lobby_snapshot()
+    lobby_list = snapshot['rooms']
     
-    log_info("=== GET LOBBY LIST REQUEST ===", {
+    log_debug("Lobby list requested", {
         'player_id': player_id,
+        'client_version': (data or {}).get('version'),
+        'lobby_version': snapshot['version'],
         'lobby_rooms_count': len(lobby_list),
-        'lobby_rooms': lobby_list,
         'total_rooms_in_memory': len(rooms),
-        'total_players_in_memory': len(players)
+        'total_players_in_memory': len(players),
+        'lobby_subscribers': len(lobby_subscribers)
     })
     
-    emit('lobby_list', {'rooms': lobby_list})
+    emit('lobby_list', snapshot)
+
+def handle_lobby_subscribe(data=None):
+    """Client opened the lobby screen: subscribe it to lobby_delta and send a full snapshot"""
+    player_id = request.sid
+    subscribe_to_lobby(player_id)
+    snapshot = get_lobby_snapshot()
+    
+    log_debug("Lobby subscribed", {
+        'player_id': player_id,
+        'lobby_version': snapshot['version'],
+        'subscribers': len(lobby_subscribers)
+    })
     
-    log_info("lobby_list event sent to player", {
+    emit('lobby_list', snapshot)
+
+def handle_lobby_unsubscribe(data=None):
+    """Client left the lobby screen: stop sending it lobby_delta"""
+    player_id = request.sid
+    unsubscribe_from_lobby(player_id)
+    log_debug("Lobby unsubscribed", {'player_id': player_id, 'subscribers': len(lobby_subscribers)})
+
+def handle_request_hint(data=None):
+    """Solved evaluation and best move for the player's game, or for a gameState sent for analysis"""
+    player_id = request.sid
+    data = data or {}
+    game_state = data.get('gameState')
+    if game_state is None:
+        room = rooms.get(players.get(player_id, {}).get('room_code'))
+        game_state = room.get('game_state') if room else None
+    if not isinstance(game_state, dict):
+        emit('error', {'message': 'Oyun vəziyyəti tapılmadı'})
+        return
+    analysis = position_table.analyse(game_state) if position_table else None
+    if analysis is None:
+        emit('error', {'message': 'Bu mövqe təhlil edilə bilməz'})
+        return
+    emit('hint', analysis)
+
+def handle_request_sync(data=None):
+    """A client saw a gap in sequence numbers: send it the full game state"""
+    player_id = request.sid
+    room_code = players.get(player_id, {}).get('room_code')
+    room = rooms.get(room_code)
+    if not room or not room.get('game_state'):
+        emit('error', {'message': 'Oyun vəziyyəti tapılmadı'})
+        return
+    log_debug("Game state resync requested", {
+        'room_code': room_code,
         'player_id': player_id,
-        'rooms_count': len(lobby_list)
+        'client_seq': (data or {}).get('seq'),
+        'seq': current_seq(room)
     })
+    emit('game_state', snapshot(room))
 
 def handle_start_game(data):
     player_id = request.sid
@@ -1744,12 +2127,10 @@ def handle_start_game(data):
         return
     
     room_code = players[player_id]['room_code']
-    
-    if room_code not in rooms:
+    room = get_room(room_code)
+    if room is None:
         return
     
-    room = rooms[room_code]
-    
     # Check if both players are present
     if len(room['players']) < 2:
         emit('error', {'message': 'Hələ hər iki oyunçu yoxdur'})
@@ -1757,6 +2138,7 @@ def handle_start_game(data):
     
     # Initialize game state
     room['game_state'] = {
+        'schemaVersion': SCHEMA_VERSION,
         'orangeStones': [
             {'id': 'orange-1', 'nodeId': '10', 'reachedGoal': False, 'number': 1},
             {'id': 'orange-2', 'nodeId': '9', 'reachedGoal': False, 'number': 2},
@@ -1772,15 +2154,19 @@ def handle_start_game(data):
         'winner': None
     }
     
-    room['started'] = True
+    set_room_started(room_code, room, True)
     
     # Notify both players
-    socketio.emit('game_start', {
-        'gameState': room['game_state']
-    }, room=room_code)
+    socketio.emit('game_start', record_event(room, 'game_start', {
+        'gameState': copy.deepcopy(room['game_state'])
+    }), room=room_code)
+    
+    # Moves are logged against this snapshot
+    queue_game_state_save(room_code, started=True, started_at=datetime.now(UTC))
+    schedule_bot_turn(room_code)
 
-def handle_make_move(data):
-    player_id = request.sid
+def make_move(player_id, data):
+    """Validate and apply a move for player_id; returns an error message or None"""
     
     if player_id not in players:
         return
@@ -1788,178 +2174,108 @@ def handle_make_move(data):
     player_info = players[player_id]
     room_code = player_info['room_code']
     player_color = player_info['color']
-    
-    if room_code not in rooms:
+    room = get_room(room_code)
+    if room is None:
         return
     
-    room = rooms[room_code]
     game_state = room['game_state']
     
     if not game_state or game_state['gameOver']:
         return
     
-    # Normalize node IDs (map old IDs to new IDs)
-    node_id_map = {
-        'LT': '10',  # Left Top -> 10
-        'LM': '9',   # Left Middle -> 9
-        'LB': '8',   # Left Bottom -> 8
-        'RT': '5',   # Right Top -> 5
-        'RM': '6',   # Right Middle -> 6
-        'RB': '7',   # Right Bottom -> 7
-        'C_UL': '3', # Center Upper Left -> 3
-        'C_DR': '2'  # Center Down Right -> 2
-    }
-    
-    # IMPORTANT: Normalize all stone nodeIds in game_state BEFORE processing the move
-    # This ensures that even if game_state was loaded from database with old format, it's normalized
-    all_stones = game_state.get('orangeStones', []) + game_state.get('blueStones', [])
-    normalized_count = 0
-    for s in all_stones:
-        node_id = s.get('nodeId')
-        if node_id and node_id in node_id_map:
-            normalized_id = node_id_map[node_id]
-            s['nodeId'] = normalized_id
-            normalized_count += 1
-            log_debug(f"[DEBUG] handle_make_move: Normalized stone nodeId - stone_id={s.get('id')}, original={node_id}, normalized={normalized_id}")
-    
-    if normalized_count > 0:
-        log_debug(f"[DEBUG] handle_make_move: Normalized {normalized_count} stone nodeIds in game_state")
+    # Stored states are upgraded to numeric node IDs once, when they are loaded;
+    # only IDs sent by older clients still need mapping here
+    node_id_map = LEGACY_NODE_IDS
     
     # Check if it's player's turn
     if game_state['currentTurn'] != player_color:
-        emit('error', {'message': 'Sizin növbəniz deyil'})
-        return
+        return 'Sizin növbəniz deyil'
     
     stone_id = data.get('stoneId')
-    from_node_id = data.get('fromNodeId')  # Get fromNodeId from client (original position)
+    from_node_id = data.get('fromNodeId')  # Where the client thinks the stone stands
     to_node_id = data.get('toNodeId')
     new_x = data.get('x')
     new_y = data.get('y')
-    reached_goal = data.get('reachedGoal', False)
-    game_over = data.get('gameOver', False)
-    winner = data.get('winner')
     
     # Validate and update move
     stones = game_state['orangeStones'] if player_color == 'orange' else game_state['blueStones']
     stone = next((s for s in stones if s['id'] == stone_id), None)
     
     if not stone:
-        emit('error', {'message': 'Taş tapılmadı'})
-        return
+        return 'Taş tapılmadı'
     
-    # Validate move: check if target node is a neighbor and empty
-    # Use fromNodeId from client if provided, otherwise use stone's current nodeId
-    current_node_id = from_node_id if from_node_id else stone.get('nodeId')
+    # The move starts where the server has the stone; fromNodeId is only checked against it
+    current_node_id = stone.get('nodeId')
     if not current_node_id or not to_node_id:
-        emit('error', {'message': 'Hərəkət etmək üçün nöqtə seçilməyib'})
-        return
+        return 'Hərəkət etmək üçün nöqtə seçilməyib'
     
-    log_debug(f"[DEBUG] handle_make_move: Received move - stone_id={stone_id}, from_node_id={from_node_id}, current_node_id={current_node_id} (type: {type(current_node_id).__name__}), to_node_id={to_node_id} (type: {type(to_node_id).__name__}), player_color={player_color}, current_turn={game_state.get('currentTurn')}")
+    log_debug("handle_make_move: Received move", {
+        'room_code': room_code,
+        'stone_id': stone_id,
+        'from_node_id': from_node_id,
+        'current_node_id': current_node_id,
+        'to_node_id': to_node_id,
+        'player_color': player_color,
+        'current_turn': game_state.get('currentTurn')
+    })
     
     # Ensure current_node_id and to_node_id are strings first
     current_node_id = str(current_node_id) if current_node_id is not None else None
     to_node_id = str(to_node_id) if to_node_id is not None else None
     
-    # Double-check normalization (should already be normalized, but ensure it)
-    original_current_node_id = current_node_id
-    if current_node_id in node_id_map:
-        current_node_id = node_id_map[current_node_id]
-        # Update stone's nodeId only if we're using fromNodeId (client sent it)
-        if from_node_id:
-            stone['nodeId'] = current_node_id  # Update stone's nodeId to normalized value
-        log_debug(f"[DEBUG] handle_make_move: Normalized current node ID - original={original_current_node_id}, normalized={current_node_id}")
-    else:
-        log_debug(f"[DEBUG] handle_make_move: Current node ID already normalized or not in map - current_node_id={current_node_id}, node_id_map_keys={list(node_id_map.keys())}")
+    # A client that is out of date about this stone must resync before it moves it
+    if from_node_id:
+        client_node_id = str(from_node_id)
+        client_node_id = node_id_map.get(client_node_id, client_node_id)
+        if client_node_id != current_node_id:
+            log_debug("handle_make_move: fromNodeId does not match the stone", {
+                'room_code': room_code,
+                'stone_id': stone_id,
+                'from_node_id': from_node_id,
+                'current_node_id': current_node_id
+            })
+            return 'Taş artıq bu nöqtədə deyil'
     
     # Normalize target node ID if needed
     original_to_node_id = to_node_id
     if to_node_id in node_id_map:
         to_node_id = node_id_map[to_node_id]
-        log_debug(f"[DEBUG] handle_make_move: Normalized target node ID - original={original_to_node_id}, normalized={to_node_id}")
+        log_debug("handle_make_move: Normalized target node ID", {
+            'original': original_to_node_id,
+            'normalized': to_node_id
+        })
     
-    log_debug(f"[DEBUG] handle_make_move: After normalization - current_node_id={current_node_id} (type: {type(current_node_id).__name__}), to_node_id={to_node_id} (type: {type(to_node_id).__name__}), board_nodes_keys={list(BOARD_NODES.keys())}, current_node_id_in_board={current_node_id in BOARD_NODES}")
+    # Validate on bitboards: neighbor, empty target, opponent keeps at least one move
+    from_bit = rules.bit(current_node_id)
+    to_bit = rules.bit(to_node_id)
+    if not from_bit:
+        log_error("handle_make_move: Current node not found", None, {
+            'room_code': room_code,
+            'current_node_id': current_node_id,
+            'stone': stone,
+            'all_stone_node_ids': [s.get('nodeId') for s in game_state.get('orangeStones', []) + game_state.get('blueStones', [])]
+        })
+        return 'Cari nöqtə tapılmadı'
     
-    # Check if target node is a neighbor (1 step away)
-    current_node = BOARD_NODES.get(current_node_id)
-    if not current_node:
-        log_error(f"[DEBUG] handle_make_move: Current node not found - current_node_id={current_node_id} (type: {type(current_node_id).__name__}), original_current_node_id={original_current_node_id}, board_nodes_keys={list(BOARD_NODES.keys())}, stone={stone}, stone_nodeId={stone.get('nodeId')} (type: {type(stone.get('nodeId')).__name__}), all_stone_nodeIds={[s.get('nodeId') for s in all_stones]}")
-        emit('error', {'message': 'Cari nöqtə tapılmadı'})
-        return
+    own, other = rules.sides(game_state, player_color)
+    reason = rules.check_move(own, other, from_bit, to_bit)
     
-    if to_node_id not in current_node['neighbors']:
-        emit('error', {'message': 'Yalnız qonşu boş nöqtəyə hərəkət edə bilərsiniz'})
-        return
+    if reason == NOT_OWN_STONE:
+        return 'Bu taş sizin deyil'
     
-    # Check if target node is empty
-    # Normalize all stone node IDs before checking
-    all_stones = game_state['orangeStones'] + game_state['blueStones']
-    occupied_nodes = set()
-    for s in all_stones:
-        node_id = s.get('nodeId')
-        if node_id:
-            # Normalize node ID if needed
-            normalized_id = node_id_map.get(node_id, node_id)
-            occupied_nodes.add(normalized_id)
-            # Update stone's nodeId if it was normalized
-            if node_id != normalized_id:
-                s['nodeId'] = normalized_id
-    
-    if to_node_id in occupied_nodes:
-        emit('error', {'message': 'Bu nöqtə doludur'})
-        return
+    if reason == NOT_NEIGHBOR:
+        return 'Yalnız qonşu boş nöqtəyə hərəkət edə bilərsiniz'
     
-    # Check if this move would block opponent completely (stalemate prevention)
-    def check_opponent_has_valid_moves(current_color, from_node, to_node, orange_stones, blue_stones):
-        """Check if opponent has any valid moves after a hypothetical move"""
-        # Create temporary copies
-        temp_orange = [dict(s) for s in orange_stones]
-        temp_blue = [dict(s) for s in blue_stones]
-        
-        # Apply the move to temporary state
-        temp_collection = temp_orange if current_color == 'orange' else temp_blue
-        stone_idx = next((i for i, s in enumerate(temp_collection) if s.get('nodeId') == from_node), -1)
-        if stone_idx != -1:
-            temp_collection[stone_idx] = dict(temp_collection[stone_idx])
-            temp_collection[stone_idx]['nodeId'] = to_node
-        
-        # Get opponent's stones
-        opponent_stones = temp_blue if current_color == 'orange' else temp_orange
-        
-        # Get all occupied nodes after the move
-        all_temp_stones = temp_orange + temp_blue
-        occupied_after_move = {s.get('nodeId') for s in all_temp_stones if s.get('nodeId')}
-        
-        # Check if opponent has at least one stone that can move
-        for opp_stone in opponent_stones:
-            stone_node_id = opp_stone.get('nodeId')
-            if not stone_node_id:
-                continue
-            
-            stone_node = BOARD_NODES.get(stone_node_id)
-            if not stone_node:
-                continue
-            
-            # Check if this stone has at least one empty neighbor
-            neighbors = stone_node.get('neighbors', [])
-            has_valid_move = any(neighbor_id not in occupied_after_move for neighbor_id in neighbors)
-            if has_valid_move:
-                return True  # Opponent has at least one valid move
-        
-        return False  # Opponent has no valid moves
-    
-    # Check if move would block opponent completely
-    opponent_has_moves = check_opponent_has_valid_moves(
-        player_color,
-        current_node_id,
-        to_node_id,
-        game_state['orangeStones'],
-        game_state['blueStones']
-    )
+    if reason == OCCUPIED:
+        return 'Bu nöqtə doludur'
     
-    if not opponent_has_moves:
-        log_debug(f"[DEBUG] handle_make_move: Move would block opponent completely - from={current_node_id}, to={to_node_id}, player_color={player_color}")
-        emit('error', {'message': 'Bu hərəkət rəqibin bütün yollarını bağlayır. Belə bir hərəkətə icazə verilmir.'})
-        return
+    if reason == BLOCKS_OPPONENT:
+        log_debug("handle_make_move: Move would block opponent completely", {
+            'from': current_node_id,
+            'to': to_node_id,
+            'player_color': player_color
+        })
+        return 'Bu hərəkət rəqibin bütün yollarını bağlayır. Belə bir hərəkətə icazə verilmir.'
     
     # Update stone position (use nodeId if provided, otherwise use x,y)
     if to_node_id:
@@ -1969,62 +2285,51 @@ def handle_make_move(data):
     if new_y is not None:
         stone['y'] = new_y
     
-    # Check if stone reached goal
-    # Orange goal: 5, 6, 7 (right side) | Blue goal: 10, 9, 8 (left side)
-    goal_nodes = ['5', '6', '7'] if player_color == 'orange' else ['10', '9', '8']
-    if to_node_id and to_node_id in goal_nodes:
-        stone['reachedGoal'] = True
-    elif reached_goal is not None:
-        stone['reachedGoal'] = reached_goal
-    
-    # Check win condition - all stones must reach goal
-    all_stones_reached = all(s.get('reachedGoal', False) for s in stones)
-    if all_stones_reached:
+    # Goal, game over and winner are derived here, the same way replay_moves() rebuilds them from the
+    # move log; reachedGoal, gameOver and winner sent by the client are ignored
+    stone['reachedGoal'] = bool(rules.in_goal(player_color, to_bit))
+    
+    # Check win condition - all stones must stand on goal nodes
+    if rules.is_win(player_color, rules.move(own, from_bit, to_bit)):
         game_state['gameOver'] = True
         game_state['winner'] = player_color
-    elif game_over:
-        game_state['gameOver'] = game_over
-        if winner:
-            game_state['winner'] = winner
     
     # Switch turn only if game is not over
     previous_turn = game_state.get('currentTurn')
     if not game_state['gameOver']:
         new_turn = 'blue' if player_color == 'orange' else 'orange'
         game_state['currentTurn'] = new_turn
-        log_debug(f"[DEBUG] handle_make_move: Turn switched - previous_turn={previous_turn}, new_turn={new_turn}, player_color={player_color}")
-    else:
-        log_debug(f"[DEBUG] handle_make_move: Game over, turn not switched - winner={game_state.get('winner')}")
     
-    log_debug(f"[DEBUG] handle_make_move: Move completed successfully - stone_id={stone_id}, from={original_current_node_id}, to={to_node_id}, current_turn={game_state.get('currentTurn')}")
+    log_debug("handle_make_move: Move completed", {
+        'room_code': room_code,
+        'stone_id': stone_id,
+        'from': current_node_id,
+        'to': to_node_id,
+        'previous_turn': previous_turn,
+        'current_turn': game_state.get('currentTurn'),
+        'winner': game_state.get('winner')
+    })
     
-    # Save to database
-    if db_pool:
-        try:
-            conn = db_pool.getconn()
-            cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE three_stones_rooms 
-                SET game_state = %s
-                WHERE room_code = %s
-            """, (json.dumps(game_state), room_code))
-            conn.commit()
-            cursor.close()
-            db_pool.putconn(conn)
-        except Exception as e:
-            log_error("Error updating game state after move", e, {'room_code': room_code})
-            if conn:
-                db_pool.putconn(conn)
+    # Broadcast only what changed; clients that miss a sequence number ask for a snapshot
+    delta = record_event(room, 'move_made', move_delta(stone, current_node_id, game_state))
+    socketio.emit('move_made', delta, room=room_code)
     
-    # Broadcast updated game state
-    socketio.emit('move_made', {
-        'gameState': game_state
-    }, room=room_code)
+    # Append the move to the log (write-behind, flushed in batches)
+    queue_move_save(room_code, delta)
     
     # Check if game over
     if game_state['gameOver']:
-        socketio.emit('game_over', {
-            'winner': game_state['winner'],
-            'gameState': game_state
-        }, room=room_code)
+        socketio.emit('game_over', record_event(room, 'game_over', {
+            'winner': game_state['winner']
+        }), room=room_code)
+        # Final position is written immediately
+        queue_game_state_save(room_code)
+        if persister:
+            persister.flush([room_code])
+    else:
+        schedule_bot_turn(room_code)
 
+def handle_make_move(data):
+    error = make_move(request.sid, data)
+    if error:
+        emit('error', {'message': error})
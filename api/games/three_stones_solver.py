@@ -0,0 +1,185 @@
+"""
+Three Stones Solver
+Retrograde analysis of every 3-vs-3 position into a compact table of results and best moves
+"""
+
+import time
+from array import array
+from collections import deque
+
+from .three_stones_engine import COLORS, OPPONENT
+
+# Results, from the point of view of the side to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+UNKNOWN = 3
+RESULT_NAMES = {DRAW: 'draw', WIN: 'win', LOSS: 'loss'}
+
+STONES_PER_SIDE = 3
+
+
+class PositionTable:
+    """Game-theoretic value of every position, solved once at startup.
+
+    A position is (orange bitboard, blue bitboard, side to move). Each side's
+    3-stone mask is ranked among the C(nodes, 3) possible masks, which gives
+    the perfect hash ``turn * R * R + rank[orange] * R + rank[blue]``. The
+    table holds one byte per slot for the result, one for the distance
+    (plies until the result with best play: winner hurries, loser delays)
+    and two for the best move as node indexes.
+
+    Terminal positions: the side not to move already has every stone on its
+    goal (loss), or the side to move has no legal move, which the server has
+    no rule for (draw). Positions never resolved by retrograde propagation are
+    draws by repetition.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        nodes = len(rules.node_ids)
+        self.rank = array('h', [-1]) * (1 << nodes)
+        masks = [m for m in range(1 << nodes) if bin(m).count('1') == STONES_PER_SIDE]
+        for i, m in enumerate(masks):
+            self.rank[m] = i
+        self.masks = masks
+        self.ranks = len(masks)
+        self.size = 2 * self.ranks * self.ranks
+        self.results = bytearray([UNKNOWN]) * self.size
+        self.distances = bytearray(self.size)
+        self.best = bytearray([255]) * (2 * self.size)  # (from node index, to node index), 255 = none
+        self.solve_seconds = None
+        self.positions = 0
+
+    def index(self, orange, blue, turn):
+        """Slot for a position, or -1 if it is not a 3-vs-3 position"""
+        o, b = self.rank[orange], self.rank[blue]
+        if o < 0 or b < 0 or orange & blue:
+            return -1
+        return ((COLORS.index(turn) * self.ranks) + o) * self.ranks + b
+
+    def _sides(self, orange, blue, turn):
+        return (orange, blue) if turn == 'orange' else (blue, orange)
+
+    def _child(self, own, other, turn, from_bit, to_bit):
+        """Slot of the position after the side to move plays from_bit -> to_bit"""
+        moved = self.rules.move(own, from_bit, to_bit)
+        orange, blue = (moved, other) if turn == 'orange' else (other, moved)
+        return self.index(orange, blue, OPPONENT[turn])
+
+    def solve(self):
+        started = time.perf_counter()
+        rules = self.rules
+        parents = {}  # {child slot: [parent slots]}
+        remaining = {}  # {slot: legal moves not yet known to lead to a win for the opponent}
+        queue = deque()
+        for turn in COLORS:
+            for orange in self.masks:
+                for blue in self.masks:
+                    if orange & blue:
+                        continue
+                    slot = self.index(orange, blue, turn)
+                    self.positions += 1
+                    own, other = self._sides(orange, blue, turn)
+                    if rules.is_win(OPPONENT[turn], other):
+                        self.results[slot] = LOSS
+                        queue.append(slot)
+                        continue
+                    moves = rules.legal_moves(own, other)
+                    if not moves:
+                        self.results[slot] = DRAW
+                        continue
+                    remaining[slot] = len(moves)
+                    for from_bit, to_bit in moves:
+                        parents.setdefault(self._child(own, other, turn, from_bit, to_bit), []).append(slot)
+
+        # Positions come off the queue in order of distance, so the first
+        # winning move found is the fastest and the last losing one the slowest
+        while queue:
+            slot = queue.popleft()
+            result = self.results[slot]
+            for parent in parents.get(slot, ()):
+                if self.results[parent] != UNKNOWN:
+                    continue
+                if result == LOSS:
+                    self.results[parent] = WIN
+                elif result == WIN:
+                    remaining[parent] -= 1
+                    if remaining[parent]:
+                        continue
+                    self.results[parent] = LOSS
+                else:
+                    continue
+                self.distances[parent] = min(self.distances[slot] + 1, 255)
+                queue.append(parent)
+
+        for slot, result in enumerate(self.results):
+            if result == UNKNOWN and slot in remaining:
+                self.results[slot] = DRAW
+        self._pick_best_moves()
+        self.solve_seconds = time.perf_counter() - started
+        return self
+
+    def _pick_best_moves(self):
+        rules = self.rules
+        for turn in COLORS:
+            for orange in self.masks:
+                for blue in self.masks:
+                    if orange & blue:
+                        continue
+                    slot = self.index(orange, blue, turn)
+                    own, other = self._sides(orange, blue, turn)
+                    result = self.results[slot]
+                    best, best_key = None, None
+                    for from_bit, to_bit in rules.legal_moves(own, other):
+                        child = self._child(own, other, turn, from_bit, to_bit)
+                        child_result, child_distance = self.results[child], self.distances[child]
+                        if result == WIN:
+                            key = (child_result != LOSS, child_distance)
+                        elif result == LOSS:
+                            key = (0, -child_distance)
+                        else:
+                            key = (child_result != DRAW, 0)
+                        if best_key is None or key < best_key:
+                            best, best_key = (from_bit, to_bit), key
+                    if best:
+                        self.best[2 * slot] = best[0].bit_length() - 1
+                        self.best[2 * slot + 1] = best[1].bit_length() - 1
+
+    def lookup(self, orange, blue, turn):
+        """{'result', 'distance', 'bestMove'} for the side to move, or None for an unknown position"""
+        slot = self.index(orange, blue, turn)
+        if slot < 0:
+            return None
+        from_index, to_index = self.best[2 * slot], self.best[2 * slot + 1]
+        best_move = None
+        if from_index != 255:
+            node_ids = self.rules.node_ids
+            best_move = {'fromNodeId': node_ids[from_index], 'toNodeId': node_ids[to_index]}
+        return {
+            'turn': turn,
+            'result': RESULT_NAMES[self.results[slot]],
+            'distance': self.distances[slot],
+            'bestMove': best_move
+        }
+
+    def analyse(self, game_state):
+        """lookup() for a gameState dict (side to move is currentTurn)"""
+        turn = game_state.get('currentTurn')
+        if turn not in COLORS:
+            return None
+        orange, blue = self.rules.position(game_state)
+        return self.lookup(orange, blue, turn)
+
+    def stats(self):
+        counts = {name: 0 for name in RESULT_NAMES.values()}
+        for slot in range(self.size):
+            result = self.results[slot]
+            if result != UNKNOWN:
+                counts[RESULT_NAMES[result]] += 1
+        return {
+            'positions': self.positions,
+            'table_bytes': len(self.results) + len(self.distances) + len(self.best),
+            'solve_seconds': round(self.solve_seconds, 3) if self.solve_seconds is not None else None,
+            **counts
+        }
@@ -0,0 +1,180 @@
+"""
+Logging Pipeline
+Queue-based logging: callers only enqueue records, a listener thread formats and writes them
+"""
+
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Extra data is cut to this many characters once serialized
+MAX_PAYLOAD_CHARS = 2000
+# Lists/tuples in extra data are cut to this many items before serializing
+MAX_ITEMS = 20
+
+
+class LazyData:
+    """Extra log data, serialized only when a handler actually writes the record"""
+
+    __slots__ = ('data', 'max_chars', 'max_items')
+
+    def __init__(self, data, max_chars=MAX_PAYLOAD_CHARS, max_items=MAX_ITEMS):
+        # Shallow copy so later changes to the caller's dict do not leak into the record
+        self.data = dict(data) if isinstance(data, dict) else data
+        self.max_chars = max_chars
+        self.max_items = max_items
+
+    def _trim(self, value, depth=0):
+        if depth > 4:
+            return '...'
+        if isinstance(value, dict):
+            return {k: self._trim(v, depth + 1) for k, v in list(value.items())}
+        if isinstance(value, (list, tuple, set)):
+            items = list(value)
+            trimmed = [self._trim(v, depth + 1) for v in items[:self.max_items]]
+            if len(items) > self.max_items:
+                trimmed.append(f'... +{len(items) - self.max_items} more')
+            return trimmed
+        return value
+
+    def __str__(self):
+        try:
+            text = json.dumps(self._trim(self.data), default=str, ensure_ascii=False)
+        except (TypeError, ValueError, RuntimeError) as e:
+            text = f'<unserializable: {e}>'
+        if len(text) > self.max_chars:
+            text = f'{text[:self.max_chars]}... (+{len(text) - self.max_chars} chars)'
+        return text
+
+
+class DataFormatter(logging.Formatter):
+    """Appends ``| Data: ...`` for records carrying LazyData and notes suppressed duplicates"""
+
+    def formatMessage(self, record):
+        # Runs before the traceback (if any) is appended
+        text = super().formatMessage(record)
+        data = getattr(record, 'data', None)
+        if data is not None:
+            text = f'{text} | Data: {data}'
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            text = f'{text} (+{suppressed} similar suppressed)'
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Per-message sampling and rate caps, applied before a record is queued.
+
+    Records below WARNING are keyed by their message template. A key listed in
+    ``sample_rates`` keeps only that fraction of its records; any key logged
+    more than ``rate_limit`` times within one second has the excess dropped,
+    and the next record that gets through reports how many were suppressed.
+    A record can also carry its own ``sample`` rate.
+    """
+
+    def __init__(self, rate_limit=20, sample_rates=None):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.sample_rates = sample_rates or {}
+        self._windows = {}  # {key: [window_start, count, suppressed]}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = record.msg
+        rate = getattr(record, 'sample', None)
+        if rate is None:
+            rate = self.sample_rates.get(key)
+        if rate is not None and random.random() >= rate:
+            self.dropped += 1
+            return False
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1.0:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                if len(self._windows) > 10000:
+                    # Keys built with f-strings never repeat; forget idle ones
+                    self._windows = {k: w for k, w in self._windows.items() if now - w[0] < 1.0}
+                return True
+            if window[1] >= self.rate_limit:
+                window[2] += 1
+                self.dropped += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never formats on the caller's thread and drops records when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only exceptions are rendered here: traceback objects must not outlive the frame
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Root logger -> filter -> bounded queue -> listener thread -> real handlers"""
+
+    def __init__(self, handlers, rate_limit=20, sample_rates=None, queue_size=10000):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.filter = SamplingFilter(rate_limit, sample_rates)
+        self.handler.addFilter(self.filter)
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+
+    def install(self, logger):
+        logger.addHandler(self.handler)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out everything still queued (safe to call more than once)"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'dropped_full': self.handler.dropped,
+            'dropped_sampled': self.filter.dropped
+        }
+
+
+def parse_sample_rates(spec):
+    """'Client connected=0.1;Move made=0.05' -> {'Client connected': 0.1, 'Move made': 0.05}"""
+    rates = {}
+    for part in (spec or '').split(';'):
+        if '=' not in part:
+            continue
+        message, _, rate = part.rpartition('=')
+        try:
+            rates[message.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
@@ -0,0 +1,185 @@
+"""
+Metrics Registry
+Minimal in-process counters, gauges and histograms rendered in Prometheus text format
+"""
+
+import bisect
+import threading
+
+# Seconds; covers sub-millisecond socket handlers up to slow database calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Recipients per emit
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _labels(self.label_names, key), value) for key, value in items]
+
+
+class Gauge:
+    """Value read from a callback at scrape time (returns a number or {label_values: number})"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            return [(self.name, _labels(self.label_names, key if isinstance(key, tuple) else (key,)), v)
+                    for key, v in value.items()]
+        return [(self.name, '', value)]
+
+
+class CounterValue(Gauge):
+    """Monotonic total kept elsewhere (a pool or queue counter), read from a callback at scrape time"""
+
+    kind = 'counter'
+
+
+class Snapshot:
+    """Calls ``callback`` at most once per render(), so several gauges can share one stats call"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._value = None
+        self._fresh = False
+
+    def __call__(self):
+        if not self._fresh:
+            self._value = self.callback()
+            self._fresh = True
+        return self._value
+
+    def expire(self):
+        self._fresh = False
+        self._value = None
+
+
+class Histogram:
+    """Fixed-bucket histogram per label set; observe() is a bisect and three additions"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # {label_values: [bucket counts..., +Inf count, sum]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        samples = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', _labels(self.label_names, key, f'le="{_number(bound)}"'), cumulative))
+            labels = _labels(self.label_names, key)
+            samples.append((f'{self.name}_count', labels, cumulative))
+            samples.append((f'{self.name}_sum', labels, series[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for the /api/metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+        self._snapshots = []
+        self._render_lock = threading.Lock()
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, callback, labels=()):
+        return self.register(Gauge(name, help_text, callback, labels))
+
+    def counter_value(self, name, help_text, callback, labels=()):
+        return self.register(CounterValue(name, help_text, callback, labels))
+
+    def snapshot(self, callback):
+        """A callable returning ``callback()``, computed once per scrape however many gauges read it"""
+        snapshot = Snapshot(callback)
+        self._snapshots.append(snapshot)
+        return snapshot
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        # One scrape at a time, so concurrent scrapes never share or clear each other's snapshots
+        with self._render_lock:
+            try:
+                for metric in self._metrics:
+                    try:
+                        samples = metric.samples()
+                    except Exception as e:
+                        lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+                        continue
+                    lines.append(f'# HELP {metric.name} {metric.help}')
+                    lines.append(f'# TYPE {metric.name} {metric.kind}')
+                    for name, labels, value in samples:
+                        lines.append(f'{name}{labels} {_number(value)}')
+            finally:
+                for snapshot in self._snapshots:
+                    snapshot.expire()
+        return '\n'.join(lines) + '\n'
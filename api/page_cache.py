@@ -0,0 +1,217 @@
+"""
+HTML Page Cache
+Preloaded, minified and precompressed pages behind a precompiled route table
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import logging
+import threading
+
+from flask import Response
+
+from static_assets import brotli, MIN_COMPRESSION_GAIN
+
+logger = logging.getLogger(__name__)
+
+HTML_CONTENT_TYPE = 'text/html; charset=utf-8'
+
+# Script/style bodies are kept apart so comment stripping never touches them
+RAW_BLOCK_RE = re.compile(r'(<(script|style)\b[^>]*>.*?</\2\s*>)', re.IGNORECASE | re.DOTALL)
+COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+
+
+def _minify_text(text):
+    """Strip indentation and blank lines from markup between script/style blocks"""
+    body = '\n'.join(line for line in (line.strip() for line in text.splitlines()) if line)
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    # Keep one separator where a raw block meets the text, so nothing is glued together
+    lead = '\n' if '\n' in leading else (' ' if leading else '')
+    trail = '\n' if '\n' in trailing else (' ' if trailing else '')
+    if not body:
+        return '\n' if '\n' in text else (' ' if text else '')
+    return lead + body + trail
+
+
+def minify_html(html):
+    """Conservative minification: drop HTML comments, indentation and blank lines.
+
+    Script and style blocks are passed through byte for byte, so inline
+    scripts (template literals, ASI, // comments) behave the same.
+    """
+    parts = []
+    for i, chunk in enumerate(RAW_BLOCK_RE.split(html)):
+        # split() yields [text, block, tag name, text, block, tag name, ...]
+        if i % 3 == 2:
+            continue
+        if i % 3 == 0:
+            chunk = _minify_text(COMMENT_RE.sub('', chunk))
+        parts.append(chunk)
+    return ''.join(parts).strip() + '\n'
+
+
+class CachedPage:
+    """One page held in memory as ready-to-send bodies per Content-Encoding"""
+
+    __slots__ = ('url_path', 'file_path', 'mtime', 'assets', 'variants', 'size')
+
+    def __init__(self, url_path, file_path, static_files):
+        self.url_path = url_path
+        self.file_path = file_path
+        self.render(static_files)
+
+    def render(self, static_files):
+        with open(self.file_path, encoding='utf-8') as f:
+            source = f.read()
+        self.mtime = os.path.getmtime(self.file_path)
+        html = source
+        self.assets = []
+        if static_files is not None:
+            html = static_files.rewrite_html(html, self.url_path)
+            self.assets = static_files.referenced(source, self.url_path)
+        body = minify_html(html).encode('utf-8')
+        self.size = len(source.encode('utf-8'))
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': (body, f'"{digest}"')}
+        limit = len(body) * MIN_COMPRESSION_GAIN
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gz) < limit:
+            self.variants['gzip'] = (gz, f'"{digest}-gz"')
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) < limit:
+                self.variants['br'] = (br, f'"{digest}-br"')
+
+    def stale(self, static_files):
+        """True if the page file or an asset it references changed on disk"""
+        try:
+            if os.path.getmtime(self.file_path) != self.mtime:
+                return True
+        except OSError:
+            return False
+        return static_files is not None and any([static_files.refresh(asset) for asset in self.assets])
+
+
+class PageCache:
+    """Every HTML page of the site, keyed by every URL path that serves it.
+
+    ``routes`` maps request paths (``login.html``, ``login``, ``games/bilinmez/index.html``,
+    aliases such as ``''`` for the start page) to CachedPage entries, so serving
+    a page is one dictionary lookup and a buffer write. With ``auto_reload``
+    (development) an entry is re-rendered when its file or one of its assets
+    changes.
+    """
+
+    def __init__(self, root, static_files=None, aliases=None, auto_reload=False):
+        self.root = root
+        self.static_files = static_files
+        self.aliases = aliases or {}  # {request path: page path}
+        self.auto_reload = auto_reload
+        self.routes = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'reloads': 0}
+        self.build()
+
+    def _discover(self):
+        """[(url_path, file_path)] for pages/*.html (served at the root) and games/**/*.html"""
+        found = []
+        pages_folder = os.path.join(self.root, 'pages')
+        if os.path.isdir(pages_folder):
+            for filename in sorted(os.listdir(pages_folder)):
+                if filename.endswith('.html'):
+                    found.append((filename, os.path.join(pages_folder, filename)))
+        games_folder = os.path.join(self.root, 'games')
+        for dirpath, dirnames, filenames in os.walk(games_folder):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.html'):
+                    file_path = os.path.join(dirpath, filename)
+                    found.append((os.path.relpath(file_path, self.root).replace(os.sep, '/'), file_path))
+        return found
+
+    def build(self):
+        routes = {}
+        total = 0
+        for url_path, file_path in self._discover():
+            try:
+                page = CachedPage(url_path, file_path, self.static_files)
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Skipping page {url_path}: {e}")
+                continue
+            total += len(page.variants['identity'][0])
+            routes[url_path] = page
+            if '/' not in url_path:
+                # pages/ also answer without the extension (/login -> login.html)
+                routes.setdefault(url_path[:-len('.html')], page)
+        for alias, target in self.aliases.items():
+            if target in routes:
+                routes[alias] = routes[target]
+        with self._lock:
+            self.routes = routes
+        logger.info(f"Page cache built: {len(set(map(id, routes.values())))} pages, {total} bytes minified")
+
+    def get(self, path):
+        """Cached page for a request path, or None"""
+        path = path.strip('/')
+        page = self.routes.get(path)
+        if page is None:
+            # Repeated segments from broken relative links (reset-password.html/reset-password.html)
+            segments = path.split('/')
+            if len(segments) > 1 and len(set(segments)) == 1:
+                page = self.routes.get(segments[0])
+        if page is not None and self.auto_reload and page.stale(self.static_files):
+            with self._lock:
+                try:
+                    page.render(self.static_files)
+                    self._stats['reloads'] += 1
+                except OSError as e:
+                    logger.warning(f"Failed to reload page {page.url_path}: {e}")
+        return page
+
+    def response(self, path, request):
+        """Response for ``path`` (negotiated encoding, 304 on a matching ETag), or None"""
+        page = self.get(path)
+        with self._lock:
+            self._stats['hits' if page is not None else 'misses'] += 1
+        if page is None:
+            return None
+        variants = page.variants
+
+        matched = next((etag for _, etag in variants.values() if etag.strip('"') in request.if_none_match), None)
+        if matched:
+            with self._lock:
+                self._stats['not_modified'] += 1
+            response = Response(status=304)
+            response.headers['ETag'] = matched
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+
+        encoding = 'identity'
+        accepted = request.accept_encodings
+        for candidate in ('br', 'gzip'):
+            if candidate in variants and accepted[candidate]:
+                encoding = candidate
+                break
+        body, etag = variants[encoding]
+        response = Response(body, content_type=HTML_CONTENT_TYPE)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['ETag'] = etag
+        # Pages keep stable URLs, so browsers revalidate them on every load
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            pages = {id(page): page for page in self.routes.values()}.values()
+        snapshot['pages'] = len(pages)
+        snapshot['routes'] = len(self.routes)
+        snapshot['source_bytes'] = sum(page.size for page in pages)
+        snapshot['minified_bytes'] = sum(len(page.variants['identity'][0]) for page in pages)
+        return snapshot
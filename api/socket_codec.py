@@ -0,0 +1,208 @@
+"""
+Socket.IO Codec Negotiation
+Per-connection MessagePack encoding of Socket.IO packets, with JSON kept for every other client
+"""
+
+import logging
+from importlib.metadata import version, PackageNotFoundError
+from urllib.parse import parse_qs
+
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import msgpack
+    from socketio.msgpack_packet import MsgPackPacket
+except ImportError:  # Optional - every client gets JSON when msgpack is not installed
+    msgpack = None
+    MsgPackPacket = None
+
+logger = logging.getLogger(__name__)
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+# SocketCodecs.install() wraps python-socketio/engineio internals (Server._send_packet,
+# Server._handle_eio_connect/_disconnect, Manager.emit). It only does so on the release series these
+# hooks were checked against; requirements.txt only sets a floor, so any newer series (a security
+# upgrade included) installs fine and every client gets plain JSON until this module is re-checked.
+SUPPORTED_VERSIONS = {'python-socketio': (5, 17), 'python-engineio': (4, 14)}
+HOOKED_ATTRIBUTES = ('_send_packet', '_send_eio_packet', '_handle_eio_connect', '_handle_eio_disconnect')
+
+
+def release_series(installed):
+    """(major, minor) of a version string, or None if it does not start with two numbers"""
+    parts = (installed or '').split('.')
+    try:
+        return int(parts[0]), int(parts[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def unsupported_versions():
+    """{package: installed version} for every package outside its SUPPORTED_VERSIONS series"""
+    mismatched = {}
+    for package, supported in SUPPORTED_VERSIONS.items():
+        try:
+            installed = version(package)
+        except PackageNotFoundError:
+            installed = None
+        if release_series(installed) != supported:
+            mismatched[package] = installed
+    return mismatched
+
+
+class NegotiatedPacket(packet.Packet):
+    """Socket.IO packet that reads both codecs.
+
+    JSON clients send packets as text frames (binary frames only ever follow
+    a BINARY_EVENT header as attachments), while the MessagePack parser sends
+    every packet as one binary frame, so the frame type tells them apart.
+    encode() stays JSON; encode_msgpack() gives the MessagePack form. Both
+    MessagePack directions go through python-socketio's own MsgPackPacket.
+    """
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, bytes) and MsgPackPacket is not None:
+            try:
+                decoded = MsgPackPacket(encoded_packet=encoded_packet)
+            except Exception as e:
+                # Same error a malformed JSON packet gives, so Socket.IO treats it as a protocol error
+                raise ValueError(f'Invalid MessagePack packet: {e}') from e
+            if not isinstance(decoded.packet_type, int):
+                raise ValueError('Invalid MessagePack packet type')
+            self.packet_type = decoded.packet_type
+            self.data = decoded.data
+            self.id = decoded.id
+            self.namespace = decoded.namespace
+            return 0
+        return super().decode(encoded_packet)
+
+    def encode_msgpack(self):
+        packet_type = self.packet_type
+        # MessagePack carries bytes inline, so there are no attachment packet types
+        if packet_type == packet.BINARY_EVENT:
+            packet_type = packet.EVENT
+        elif packet_type == packet.BINARY_ACK:
+            packet_type = packet.ACK
+        return MsgPackPacket(packet_type, data=self.data, namespace=self.namespace, id=self.id).encode()
+
+
+class SocketCodecs:
+    """Sends each connection packets in the codec it asked for.
+
+    A client opts in with ``?codec=msgpack`` on the connection URL (and a
+    MessagePack parser on its side); anything else gets JSON. Broadcasts are
+    encoded at most once per codec, however many clients they address.
+    Without msgpack, or on a python-socketio/engineio release series other
+    than SUPPORTED_VERSIONS, nothing is hooked and every client gets JSON.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.codecs = {}  # {eio_sid: MSGPACK}, JSON connections are not listed
+        self.stats = {JSON: 0, MSGPACK: 0}
+        self.installed = False
+
+    @property
+    def available(self):
+        return msgpack is not None and self.installed
+
+    def install(self):
+        if msgpack is None:
+            logger.info("msgpack is not installed; Socket.IO clients use JSON only")
+            return self
+        mismatched = unsupported_versions()
+        if mismatched:
+            logger.warning(f"MessagePack codec not installed: needs {SUPPORTED_VERSIONS}, found {mismatched}; "
+                           f"Socket.IO clients use JSON only")
+            return self
+        missing = [name for name in HOOKED_ATTRIBUTES if not hasattr(self.server, name)]
+        if missing or not hasattr(self.server, 'manager'):
+            logger.warning(f"MessagePack codec not installed: Socket.IO server lacks {missing or ['manager']}; "
+                           f"Socket.IO clients use JSON only")
+            return self
+        self.installed = True
+        server = self.server
+        server.packet_class = NegotiatedPacket
+        manager = server.manager
+        eio_connect = server._handle_eio_connect
+        eio_disconnect = server._handle_eio_disconnect
+        send_packet = server._send_packet
+        manager_emit = manager.emit
+
+        def handle_eio_connect(eio_sid, environ):
+            query = parse_qs(environ.get('QUERY_STRING', ''))
+            codec = MSGPACK if self.available and query.get('codec', [JSON])[0] == MSGPACK else JSON
+            if codec == MSGPACK:
+                self.codecs[eio_sid] = MSGPACK
+            self.stats[codec] += 1
+            return eio_connect(eio_sid, environ)
+
+        def handle_eio_disconnect(eio_sid, *args):
+            self.codecs.pop(eio_sid, None)
+            return eio_disconnect(eio_sid, *args)
+
+        def send(eio_sid, pkt):
+            if eio_sid in self.codecs:
+                server.eio.send(eio_sid, pkt.encode_msgpack())
+            else:
+                send_packet(eio_sid, pkt)
+
+        def emit(event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+            if callback or not self.codecs:
+                # Acks need a packet per recipient anyway; with no MessagePack clients nothing changes
+                return manager_emit(event, data, namespace, room=room, skip_sid=skip_sid,
+                                    callback=callback, to=to, **kwargs)
+            room = to or room
+            if namespace not in manager.rooms:
+                return
+            if isinstance(data, tuple):
+                data = list(data)
+            elif data is not None:
+                data = [data]
+            else:
+                data = []
+            if not isinstance(skip_sid, list):
+                skip_sid = [skip_sid]
+            pkt = server.packet_class(packet.EVENT, namespace=namespace, data=[event] + data)
+            encoded = {}  # {codec: [engine.io packets]}
+            for sid, eio_sid in manager.get_participants(namespace, room):
+                if sid in skip_sid:
+                    continue
+                codec = self.codecs.get(eio_sid, JSON)
+                eio_packets = encoded.get(codec)
+                if eio_packets is None:
+                    eio_packets = encoded[codec] = self._eio_packets(pkt, codec)
+                for eio_pkt in eio_packets:
+                    server._send_eio_packet(eio_sid, eio_pkt)
+
+        # Engine.IO keeps the bound methods it was given, so register the wrappers there too
+        server._handle_eio_connect = handle_eio_connect
+        server._handle_eio_disconnect = handle_eio_disconnect
+        server.eio.on('connect', handle_eio_connect)
+        server.eio.on('disconnect', handle_eio_disconnect)
+        server._send_packet = send
+        manager.emit = emit
+        return self
+
+    @staticmethod
+    def _eio_packets(pkt, codec):
+        if codec == MSGPACK:
+            return [eio_packet.Packet(eio_packet.MESSAGE, pkt.encode_msgpack())]
+        encoded = pkt.encode()
+        if not isinstance(encoded, list):
+            encoded = [encoded]
+        return [eio_packet.Packet(eio_packet.MESSAGE, p) for p in encoded]
+
+    def get_stats(self):
+        return {
+            'available': self.available,
+            'connected_msgpack': len(self.codecs),
+            'connections': dict(self.stats)
+        }
+
+
+def install_codecs(socketio):
+    """Negotiate JSON/MessagePack per connection on a Flask-SocketIO server"""
+    return SocketCodecs(socketio.server).install()
@@ -0,0 +1,238 @@
+"""
+Static Asset Manifest
+Content-hashed, precompressed static files with fingerprinted URLs and ETag revalidation
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import threading
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # Optional - gzip is used when brotli is not installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# File types served through the manifest (HTML pages are served separately)
+STATIC_EXTENSIONS = {
+    '.js', '.css', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+    '.json', '.webmanifest', '.woff', '.woff2', '.mp3', '.wav', '.ogg'
+}
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.webmanifest'}
+TEXT_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.webmanifest'}
+
+# Must keep a stable URL (service worker scope/updates), so never fingerprinted
+UNVERSIONED = {'sw.js'}
+
+# Precompressed variants smaller than this fraction of the original are kept
+MIN_COMPRESSION_GAIN = 0.9
+
+HASH_LENGTH = 10
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+FINGERPRINT_RE = re.compile(r'^(.+)\.([0-9a-f]{%d})(\.[A-Za-z0-9]+)$' % HASH_LENGTH)
+# Quoted references to static files in HTML (attributes and JS string literals)
+REFERENCE_RE = re.compile(
+    r'(["\'])([^"\'\s<>?]+?(?:%s))(?:\?v=[\w.\-]+)?\1' % '|'.join(re.escape(ext) for ext in sorted(STATIC_EXTENSIONS))
+)
+
+mimetypes.add_type('application/manifest+json', '.webmanifest')
+mimetypes.add_type('image/svg+xml', '.svg')
+mimetypes.add_type('image/webp', '.webp')
+
+
+class StaticAsset:
+    """One file from the manifest with its precompressed variants"""
+
+    __slots__ = ('path', 'file_path', 'mtime', 'content_type', 'digest', 'url', 'variants')
+
+    def __init__(self, path, file_path):
+        self.path = path  # URL path relative to the site root, e.g. 'assets/game.js'
+        self.file_path = file_path
+        self.load()
+
+    def load(self):
+        with open(self.file_path, 'rb') as f:
+            body = f.read()
+        self.mtime = os.path.getmtime(self.file_path)
+        ext = os.path.splitext(self.path)[1].lower()
+        content_type = mimetypes.guess_type(self.path)[0] or 'application/octet-stream'
+        if ext in TEXT_EXTENSIONS:
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+        if os.path.basename(self.path) in UNVERSIONED:
+            self.url = '/' + self.path
+        else:
+            stem, ext_part = posixpath.splitext(self.path)
+            self.url = f'/{stem}.{self.digest}{ext_part}'
+        # {encoding: (body, etag)}; identity is always present
+        self.variants = {'identity': (body, f'"{self.digest}"')}
+        if ext in COMPRESSIBLE_EXTENSIONS and body:
+            limit = len(body) * MIN_COMPRESSION_GAIN
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < limit:
+                self.variants['gzip'] = (gz, f'"{self.digest}-gz"')
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < limit:
+                    self.variants['br'] = (br, f'"{self.digest}-br"')
+
+    def etags(self):
+        return {etag for _, etag in self.variants.values()}
+
+
+class StaticAssets:
+    """Manifest of every static file under ``folders`` of the site root.
+
+    Built once at startup: each file is read, hashed and precompressed in
+    memory. Fingerprinted URLs (``game.<hash>.js``) are served as immutable;
+    plain URLs are served with ``no-cache`` so browsers revalidate with the
+    ETag and get a 304. With ``auto_reload`` (development) a file whose mtime
+    changed is re-read on the next request.
+    """
+
+    def __init__(self, root, folders=('assets', 'games'), auto_reload=False):
+        self.root = root
+        self.folders = folders
+        self.auto_reload = auto_reload
+        self._assets = {}  # {'assets/game.js': StaticAsset}
+        self._lock = threading.Lock()
+        self.build()
+
+    def build(self):
+        assets = {}
+        canonical = {}  # {(digest, ext): url} - identical copies share one cacheable URL
+        for folder in self.folders:
+            base = os.path.join(self.root, folder)
+            for dirpath, dirnames, filenames in os.walk(base):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+                for filename in filenames:
+                    if os.path.splitext(filename)[1].lower() not in STATIC_EXTENSIONS:
+                        continue
+                    file_path = os.path.join(dirpath, filename)
+                    path = os.path.relpath(file_path, self.root).replace(os.sep, '/')
+                    try:
+                        asset = StaticAsset(path, file_path)
+                    except OSError as e:
+                        logger.warning(f"Skipping static file {path}: {e}")
+                        continue
+                    if asset.url != '/' + path:
+                        asset.url = canonical.setdefault((asset.digest, os.path.splitext(path)[1]), asset.url)
+                    assets[path] = asset
+        with self._lock:
+            self._assets = assets
+        logger.info(f"Static manifest built: {len(assets)} files, brotli={'on' if brotli else 'off'}")
+
+    def get(self, path):
+        """Look up a plain or fingerprinted path; returns (asset, fingerprinted) or (None, False)"""
+        path = path.lstrip('/')
+        asset = self._assets.get(path)
+        digest = None
+        if asset is None:
+            match = FINGERPRINT_RE.match(path)
+            if match:
+                asset = self._assets.get(match.group(1) + match.group(3))
+                digest = match.group(2)
+        if asset is None:
+            return None, False
+        if self.auto_reload:
+            self.refresh(asset)
+        # An outdated hash still gets the current file, just not as immutable
+        return asset, digest == asset.digest
+
+    def refresh(self, asset):
+        """Re-read an asset whose file changed on disk; returns True if it was reloaded"""
+        try:
+            if os.path.getmtime(asset.file_path) == asset.mtime:
+                return False
+            with self._lock:
+                asset.load()
+            return True
+        except OSError:
+            return False
+
+    def url(self, path):
+        """Fingerprinted URL for a site-relative path, or None if it is not in the manifest"""
+        asset, _ = self.get(path)
+        return asset.url if asset is not None else None
+
+    def _resolve(self, ref, page_dir):
+        """Asset a quoted reference on a page points at, or None"""
+        if '://' in ref or ref.startswith('//') or ref.startswith('data:'):
+            return None
+        target = ref if ref.startswith('/') else posixpath.normpath(posixpath.join(page_dir, ref))
+        return self.get(target)[0]
+
+    def rewrite_html(self, html, page_path):
+        """Point quoted static references in a page at their fingerprinted URLs"""
+        page_dir = posixpath.dirname('/' + page_path.lstrip('/'))
+
+        def replace(match):
+            asset = self._resolve(match.group(2), page_dir)
+            if asset is None:
+                return match.group(0)
+            quote = match.group(1)
+            return f'{quote}{asset.url}{quote}'
+
+        return REFERENCE_RE.sub(replace, html)
+
+    def referenced(self, html, page_path):
+        """Assets a page references (so a cached copy of the page can tell when they change)"""
+        page_dir = posixpath.dirname('/' + page_path.lstrip('/'))
+        assets = {}
+        for match in REFERENCE_RE.finditer(html):
+            asset = self._resolve(match.group(2), page_dir)
+            if asset is not None:
+                assets[asset.path] = asset
+        return list(assets.values())
+
+    def response(self, path, request):
+        """Build the response for ``path``, or None if it is not a known static file"""
+        asset, fingerprinted = self.get(path)
+        if asset is None:
+            return None
+        cache_control = IMMUTABLE if fingerprinted else REVALIDATE
+
+        matched = next((etag for etag in asset.etags() if etag.strip('"') in request.if_none_match), None)
+        if matched:
+            response = Response(status=304)
+            response.headers['ETag'] = matched
+            response.headers['Cache-Control'] = cache_control
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+
+        encoding = 'identity'
+        accepted = request.accept_encodings
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and accepted[candidate]:
+                encoding = candidate
+                break
+        body, etag = asset.variants[encoding]
+        response = Response(body, content_type=asset.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def stats(self):
+        with self._lock:
+            assets = list(self._assets.values())
+        return {
+            'files': len(assets),
+            'bytes': sum(len(a.variants['identity'][0]) for a in assets),
+            'gzip_bytes': sum(len(a.variants.get('gzip', a.variants['identity'])[0]) for a in assets),
+            'brotli': brotli is not None
+        }
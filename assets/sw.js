@@ -1,5 +1,5 @@
 // Minimal service worker to enable installability and basic offline shell
-const SW_VERSION = '3.0-nocache';
+const SW_VERSION = '4.0-http-cache';
 console.log('[SW] version', SW_VERSION);
 
 self.addEventListener('install', (event) => {
@@ -17,8 +17,9 @@ self.addEventListener('activate', (event) => {
 });
 
 self.addEventListener('fetch', (event) => {
-  // Network-only with explicit no-store to keep browser cache clean
-  event.respondWith(fetch(event.request, { cache: 'no-store' }).catch(() => new Response('Offline', { status: 503 })));
+  // Network-first through the normal HTTP cache: fingerprinted assets are immutable
+  // and everything else is revalidated by the server with ETags
+  event.respondWith(fetch(event.request).catch(() => new Response('Offline', { status: 503 })));
 });
 
 // Optional: Clear caches on demand via message
@@ -60,6 +60,10 @@ class ThreeStonesGame {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.lobbyRefreshInterval = null;
+        this.lobbyVersion = null; // Last lobby version applied (from lobby_list / lobby_delta)
+        this.lobbyRooms = [];
+        this.gameSeq = null; // Last game state sequence applied (from snapshots / move_made deltas)
+        this.lobbySubscribed = false; // In the server's lobby room (receives lobby_delta)
         this.transitionAnimation = null; // Three.js animation instance
         this.isLeavingRoom = false; // Flag to prevent double animation when leaving room
         this.isTransitioning = false; // Flag to prevent multiple simultaneous transitions
@@ -162,6 +166,12 @@ class ThreeStonesGame {
             deleteRoomBtn.addEventListener('click', () => this.deleteRoom());
         }
         
+        // Fill the empty seat with a server-side bot
+        const addBotBtn = document.getElementById('addBotBtn');
+        if (addBotBtn) {
+            addBotBtn.addEventListener('click', () => this.addBot());
+        }
+        
         const homeBtn = document.getElementById('homeBtn');
         if (homeBtn) {
             homeBtn.addEventListener('click', () => {
@@ -340,13 +350,18 @@ class ThreeStonesGame {
         const host = window.location.host;
         const socketUrl = `${protocol}//${host}`;
         
+        // socket_parser.js reads MessagePack as well as JSON, so ask for MessagePack whenever it is loaded;
+        // a server without MessagePack support ignores the codec query and keeps sending JSON
+        const parser = window.ThreeStonesSocketParser;
+        
         this.socket = io(socketUrl, {
             transports: ['websocket', 'polling'],
             reconnection: true,
             reconnectionDelay: 1000,
             reconnectionDelayMax: 5000,
             reconnectionAttempts: 5,
-            timeout: 20000 // 20 seconds timeout
+            timeout: 20000, // 20 seconds timeout
+            ...(parser ? { parser, query: { codec: 'msgpack' } } : {})
         });
         
         this.socket.on('connect', () => {
@@ -369,9 +384,11 @@ class ThreeStonesGame {
                 // Small delay to ensure socket is fully connected
                 setTimeout(() => {
                     if (this.socket && this.socket.connected) {
+                        // The server replays what we missed after gameSeq (null after a page refresh)
                         this.sendMessage('rejoin_room', {
                             roomCode: savedRoomCode,
-                            username: savedUsername
+                            username: savedUsername,
+                            seq: this.gameSeq
                         });
                     }
                 }, 100);
@@ -382,16 +399,18 @@ class ThreeStonesGame {
             if (lobbyList) {
                 setTimeout(() => {
                     if (this.socket && this.socket.connected) {
-                        this.refreshLobby();
-                        // Start periodic lobby refresh
+                        if (!this.roomCode) {
+                            this.subscribeLobby();
+                        }
+                        // Lobby changes arrive as lobby_delta events; only resync occasionally as a safety net
                         if (this.lobbyRefreshInterval) {
                             clearInterval(this.lobbyRefreshInterval);
                         }
                         this.lobbyRefreshInterval = setInterval(() => {
-                            if (this.socket && this.socket.connected) {
+                            if (this.socket && this.socket.connected && this.lobbySubscribed) {
                                 this.refreshLobby();
                             }
-                        }, 5000);
+                        }, 30000);
                     }
                 }, 500);
             }
@@ -399,6 +418,9 @@ class ThreeStonesGame {
         
         this.socket.on('disconnect', () => {
             console.log('Socket.IO disconnected');
+            // Deltas may be missed while offline; take a full snapshot after reconnecting
+            this.lobbyVersion = null;
+            this.lobbySubscribed = false;
             // Clear lobby refresh interval
             if (this.lobbyRefreshInterval) {
                 clearInterval(this.lobbyRefreshInterval);
@@ -445,6 +467,7 @@ class ThreeStonesGame {
                 });
                 
                 this.roomCode = data.roomCode;
+                this.unsubscribeLobby();
                 this.playerId = data.playerId;
                 this.playerColor = 'orange';
                 this.isCreator = true; // Mark as creator
@@ -489,6 +512,7 @@ class ThreeStonesGame {
             case 'room_joined':
                 // User joined room - show animation (user-initiated action)
                 this.roomCode = data.roomCode;
+                this.unsubscribeLobby();
                 this.playerId = data.playerId;
                 this.playerColor = data.playerColor || this.playerColor;
                 this.isCreator = data.isCreator || false;
@@ -592,6 +616,9 @@ class ThreeStonesGame {
                 
             case 'room_rejoined':
                 // User rejoined room (after page refresh) - Show animation
+                if (!data.replay) {
+                    this.setGameSeq(data);
+                }
                 console.log('[DEBUG] room_rejoined: Event received', {
                     roomCode: data.roomCode,
                     playerId: data.playerId,
@@ -605,6 +632,7 @@ class ThreeStonesGame {
                 });
                 
                 this.roomCode = data.roomCode;
+                this.unsubscribeLobby();
                 this.playerId = data.playerId;
                 this.playerColor = data.playerColor || this.playerColor;
                 this.isCreator = data.isCreator || false;
@@ -656,6 +684,11 @@ class ThreeStonesGame {
                             blueStones: this.gameState.blueStones
                         });
                     }
+                } else if (data.replay) {
+                    // Reconnected mid-game - keep our state, the missed events follow
+                    console.log('[DEBUG] room_rejoined: Replaying missed events', {
+                        seq: this.gameSeq
+                    });
                 } else {
                     // No game state - reset for new game
                     console.log('[DEBUG] room_rejoined: No game state, resetting for new game');
@@ -913,6 +946,7 @@ class ThreeStonesGame {
                     // Handle both camelCase and snake_case
                     this.gameState = data.game_state;
                 }
+                this.setGameSeq(data);
                 
                 // IMPORTANT: Normalize game state BEFORE checking if game has started
                 // This ensures hasGameStarted() works correctly with node-based positions
@@ -997,6 +1031,7 @@ class ThreeStonesGame {
                 });
                 
                 this.gameState = data.gameState;
+                this.setGameSeq(data);
                 
                 // IMPORTANT: Normalize game state BEFORE checking if game has started
                 // This ensures hasGameStarted() works correctly with node-based positions
@@ -1045,10 +1080,12 @@ class ThreeStonesGame {
 
             case 'dice_roll':
                 // Another player's roll broadcast
+                this.advanceGameSeq(data);
                 this.showDiceRoll(data.username || '', data.roll, data.color);
                 break;
             case 'dice_result':
                 // Both rolls and starter announced
+                this.advanceGameSeq(data);
                 this.applyDiceResult(data);
                 break;
                 
@@ -1058,21 +1095,20 @@ class ThreeStonesGame {
                 
                 console.log('[DEBUG] move_made event received', {
                     roomCode: this.roomCode,
-                    previousGameState: this.gameState,
                     previousTurn: previousTurn,
-                    newGameState: data.gameState,
-                    newTurn: data.gameState?.currentTurn,
+                    seq: data.seq,
+                    lastSeq: this.gameSeq,
+                    stoneId: data.stoneId,
+                    from: data.from,
+                    to: data.to,
+                    newTurn: data.turn,
                     previousDiceResolved: this.diceResolved,
                     myColor: this.playerColor
                 });
                 
-                this.gameState = data.gameState;
-                
-                // IMPORTANT: Normalize game state BEFORE updating game board
-                // This ensures stones are positioned correctly
-                if (this.gameState && this.gameState.orangeStones && this.gameState.blueStones) {
-                    console.log('[DEBUG] move_made: Normalizing game state before updating board');
-                    this.normalizeGameStateToNodes();
+                if (!this.applyMoveDelta(data)) {
+                    // Stale, or a move was missed and a snapshot is on its way as game_state
+                    break;
                 }
                 
                 // Log turn change
@@ -1120,16 +1156,27 @@ class ThreeStonesGame {
                 break;
                 
             case 'game_over':
-                this.gameState = data.gameState;
+                // The final move already arrived as a move_made delta
+                this.advanceGameSeq(data);
                 this.showGameOver(data.winner);
                 break;
                 
             case 'error':
+                // A refused add_bot (room full) leaves the button usable again
+                if (document.getElementById('addBotBtn')) {
+                    document.getElementById('addBotBtn').disabled = false;
+                }
                 alert(data.message || 'Xəta baş verdi');
                 break;
                 
             case 'lobby_list':
-                this.updateLobbyList(data.rooms || []);
+                this.lobbyRooms = data.rooms || [];
+                this.lobbyVersion = typeof data.version === 'number' ? data.version : null;
+                this.updateLobbyList(this.lobbyRooms);
+                break;
+                
+            case 'lobby_delta':
+                this.applyLobbyDelta(data);
                 break;
                 
             case 'room_deleted':
@@ -1374,7 +1421,110 @@ class ThreeStonesGame {
             return;
         }
         
-        this.sendMessage('get_lobby_list');
+        this.sendMessage('get_lobby_list', { version: this.lobbyVersion });
+    }
+    
+    subscribeLobby() {
+        // Join the server's lobby room; the server answers with a full lobby_list snapshot
+        if (!document.getElementById('lobbyList') || !this.socket || !this.socket.connected) {
+            return;
+        }
+        this.lobbySubscribed = true;
+        this.sendMessage('lobby_subscribe');
+    }
+    
+    unsubscribeLobby() {
+        // Entering a match - the server also drops us from the lobby room on create/join/rejoin
+        this.lobbySubscribed = false;
+        this.lobbyVersion = null;
+    }
+    
+    setGameSeq(data) {
+        // Snapshots carry the sequence number they are current as of
+        this.gameSeq = typeof data.seq === 'number' ? data.seq : null;
+    }
+
+    advanceGameSeq(data) {
+        // Room events other than moves carry a sequence number but change no stones;
+        // like a move delta, one that skips a number means something was missed
+        if (typeof data.seq !== 'number' || this.gameSeq === null || data.seq <= this.gameSeq) {
+            return false;
+        }
+        if (data.seq !== this.gameSeq + 1) {
+            this.requestGameSync();
+            return false;
+        }
+        this.gameSeq = data.seq;
+        return true;
+    }
+
+    requestGameSync() {
+        this.sendMessage('request_sync', { seq: this.gameSeq });
+    }
+
+    applyMoveDelta(delta) {
+        // delta: { seq, stoneId, from, to, turn, flags, winner? }
+        if (this.gameSeq === null || delta.seq > this.gameSeq + 1) {
+            this.requestGameSync();
+            return false;
+        }
+        if (delta.seq <= this.gameSeq) {
+            // Already contained in the snapshot we have
+            return false;
+        }
+        const stones = [...(this.gameState.orangeStones || []), ...(this.gameState.blueStones || [])];
+        const stone = stones.find(s => s.id === delta.stoneId);
+        if (!stone) {
+            this.requestGameSync();
+            return false;
+        }
+        stone.nodeId = delta.to;
+        stone.reachedGoal = !!(delta.flags & 1);
+        this.gameState.currentTurn = delta.turn;
+        if (delta.flags & 2) {
+            this.gameState.gameOver = true;
+            this.gameState.winner = delta.winner || null;
+        }
+        this.gameSeq = delta.seq;
+        return true;
+    }
+
+    applyLobbyDelta(delta) {
+        if (!document.getElementById('lobbyList')) {
+            return;
+        }
+        if (this.lobbyVersion === null || delta.version > this.lobbyVersion + 1) {
+            // No snapshot yet, or a delta was missed - ask for the full list
+            this.refreshLobby();
+            return;
+        }
+        if (delta.version <= this.lobbyVersion) {
+            // Already contained in the snapshot we have
+            return;
+        }
+        
+        const removed = new Set(delta.removed || []);
+        const changed = new Map();
+        (delta.updated || []).forEach(room => changed.set(room.code, room));
+        (delta.added || []).forEach(room => changed.set(room.code, room));
+        
+        let rooms = this.lobbyRooms
+            .filter(room => !removed.has(room.code))
+            .map(room => {
+                const updated = changed.get(room.code);
+                if (updated) {
+                    changed.delete(room.code);
+                    return updated;
+                }
+                return room;
+            });
+        // Whatever is left is new - newest rooms go on top
+        const added = Array.from(changed.values()).reverse();
+        rooms = added.concat(rooms);
+        
+        this.lobbyRooms = rooms;
+        this.lobbyVersion = delta.version;
+        this.updateLobbyList(rooms);
     }
     
     showSearchRoomModal() {
@@ -2038,8 +2188,8 @@ class ThreeStonesGame {
         this.transitionToScreen('waitingRoom', () => {
             // Update UI after transition
             this.updateLobbyUI();
-            // Refresh lobby after transition
-            this.refreshLobby();
+            // Back in the lobby - subscribe again (sends a fresh snapshot)
+            this.subscribeLobby();
             // Clear flag after transition
             this.isLeavingRoom = false;
         });
@@ -2071,8 +2221,8 @@ class ThreeStonesGame {
         // Update UI
         this.updateLobbyUI();
         
-        // Refresh lobby
-        this.refreshLobby();
+        // Back in the lobby - subscribe again (sends a fresh snapshot)
+        this.subscribeLobby();
     }
     
     updateDeleteButtonVisibility() {
@@ -2205,6 +2355,13 @@ class ThreeStonesGame {
             blueCard.classList.remove('blue');
         }
         
+        // A bot can only take the seat while exactly one player is waiting
+        const addBotBtn = document.getElementById('addBotBtn');
+        if (addBotBtn) {
+            addBotBtn.style.display = (players.orange ? 1 : 0) + (players.blue ? 1 : 0) === 1 ? 'block' : 'none';
+            addBotBtn.disabled = false;
+        }
+        
         // Update message based on player count
         const messageDiv = document.getElementById('roomWaitingMessage');
         if (players.orange && players.blue) {
@@ -2222,6 +2379,17 @@ class ThreeStonesGame {
         }
     }
     
+    addBot(level = 'normal') {
+        if (!this.roomCode) {
+            return;
+        }
+        const addBotBtn = document.getElementById('addBotBtn');
+        if (addBotBtn) {
+            addBotBtn.disabled = true;  // re-enabled when player_joined updates the seats
+        }
+        this.sendMessage('add_bot', { roomCode: this.roomCode, level });
+    }
+    
     handlePlayerLeft(data) {
         const leftColor = data.color;
         const players = data.players || {};
@@ -2294,8 +2462,6 @@ class ThreeStonesGame {
             messageDiv.style.display = 'block';
         }
         
-        // Refresh lobby to update room status (but don't show lobby)
-        this.refreshLobby();
     }
     
     startGame(showAnimation = true) {
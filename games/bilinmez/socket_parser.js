@@ -0,0 +1,247 @@
+// Socket.IO parser for the Three Stones client: sends JSON, reads both JSON and MessagePack packets.
+// Passed to io() as `parser` together with `query: { codec: 'msgpack' }`; a server with MessagePack
+// support (api/socket_codec.py) then sends this connection binary MessagePack frames, any other
+// server keeps sending JSON text frames, and both decode here.
+
+(function(){
+    // Socket.IO packet types
+    const CONNECT = 0;
+    const EVENT = 2;
+    const ACK = 3;
+    const BINARY_EVENT = 5;
+    const BINARY_ACK = 6;
+
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    // ===== MessagePack =====
+
+    function msgpackEncode(value) {
+        const bytes = [];
+        const pushUint = (n, size) => {
+            for (let shift = (size - 1) * 8; shift >= 0; shift -= 8) {
+                bytes.push(Math.floor(n / 2 ** shift) & 0xff);
+            }
+        };
+        const pushRaw = (raw) => {
+            for (let i = 0; i < raw.length; i++) bytes.push(raw[i]);
+        };
+        const write = (v) => {
+            if (v === null || v === undefined) {
+                bytes.push(0xc0);
+            } else if (v === false || v === true) {
+                bytes.push(v ? 0xc3 : 0xc2);
+            } else if (typeof v === 'number') {
+                if (Number.isInteger(v) && v >= 0 && v < 2 ** 32) {
+                    if (v < 0x80) bytes.push(v);
+                    else if (v < 0x100) { bytes.push(0xcc); pushUint(v, 1); }
+                    else if (v < 0x10000) { bytes.push(0xcd); pushUint(v, 2); }
+                    else { bytes.push(0xce); pushUint(v, 4); }
+                } else if (Number.isInteger(v) && v < 0 && v >= -(2 ** 31)) {
+                    if (v >= -32) bytes.push(v & 0xff);
+                    else if (v >= -128) { bytes.push(0xd0); pushUint(v & 0xff, 1); }
+                    else if (v >= -32768) { bytes.push(0xd1); pushUint(v & 0xffff, 2); }
+                    else { bytes.push(0xd2); pushUint(v >>> 0, 4); }
+                } else {
+                    const view = new DataView(new ArrayBuffer(8));
+                    view.setFloat64(0, v);
+                    bytes.push(0xcb);
+                    pushRaw(new Uint8Array(view.buffer));
+                }
+            } else if (typeof v === 'string') {
+                const raw = textEncoder.encode(v);
+                if (raw.length < 32) bytes.push(0xa0 | raw.length);
+                else if (raw.length < 0x100) { bytes.push(0xd9); pushUint(raw.length, 1); }
+                else if (raw.length < 0x10000) { bytes.push(0xda); pushUint(raw.length, 2); }
+                else { bytes.push(0xdb); pushUint(raw.length, 4); }
+                pushRaw(raw);
+            } else if (v instanceof ArrayBuffer || ArrayBuffer.isView(v)) {
+                const raw = v instanceof ArrayBuffer ? new Uint8Array(v) : new Uint8Array(v.buffer, v.byteOffset, v.byteLength);
+                if (raw.length < 0x100) { bytes.push(0xc4); pushUint(raw.length, 1); }
+                else if (raw.length < 0x10000) { bytes.push(0xc5); pushUint(raw.length, 2); }
+                else { bytes.push(0xc6); pushUint(raw.length, 4); }
+                pushRaw(raw);
+            } else if (Array.isArray(v)) {
+                if (v.length < 16) bytes.push(0x90 | v.length);
+                else if (v.length < 0x10000) { bytes.push(0xdc); pushUint(v.length, 2); }
+                else { bytes.push(0xdd); pushUint(v.length, 4); }
+                v.forEach(write);
+            } else if (typeof v.toJSON === 'function') {
+                write(v.toJSON());
+            } else {
+                // Like JSON.stringify: keys whose value is undefined or a function are left out
+                const keys = Object.keys(v).filter(k => v[k] !== undefined && typeof v[k] !== 'function');
+                if (keys.length < 16) bytes.push(0x80 | keys.length);
+                else if (keys.length < 0x10000) { bytes.push(0xde); pushUint(keys.length, 2); }
+                else { bytes.push(0xdf); pushUint(keys.length, 4); }
+                keys.forEach(k => { write(k); write(v[k]); });
+            }
+        };
+        write(value);
+        return new Uint8Array(bytes);
+    }
+
+    function msgpackDecode(buffer) {
+        const data = buffer instanceof ArrayBuffer ? new Uint8Array(buffer)
+            : new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+        const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+        let pos = 0;
+        const take = (size) => {
+            if (pos + size > data.length) throw new Error('Truncated MessagePack packet');
+            const start = pos;
+            pos += size;
+            return start;
+        };
+        const uint = (size) => {
+            const at = take(size);
+            if (size === 1) return view.getUint8(at);
+            if (size === 2) return view.getUint16(at);
+            if (size === 4) return view.getUint32(at);
+            return Number(view.getBigUint64(at));
+        };
+        const str = (length) => { const at = take(length); return textDecoder.decode(data.subarray(at, at + length)); };
+        const bin = (length) => { const at = take(length); return data.slice(at, at + length).buffer; };
+        const array = (length) => { const out = new Array(length); for (let i = 0; i < length; i++) out[i] = read(); return out; };
+        const map = (length) => {
+            const out = {};
+            for (let i = 0; i < length; i++) { const key = read(); out[key] = read(); }
+            return out;
+        };
+        const read = () => {
+            const byte = uint(1);
+            if (byte < 0x80) return byte;
+            if (byte < 0x90) return map(byte & 0x0f);
+            if (byte < 0xa0) return array(byte & 0x0f);
+            if (byte < 0xc0) return str(byte & 0x1f);
+            if (byte >= 0xe0) return byte - 0x100;
+            switch (byte) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(uint(1));
+                case 0xc5: return bin(uint(2));
+                case 0xc6: return bin(uint(4));
+                case 0xca: return view.getFloat32(take(4));
+                case 0xcb: return view.getFloat64(take(8));
+                case 0xcc: return uint(1);
+                case 0xcd: return uint(2);
+                case 0xce: return uint(4);
+                case 0xcf: return uint(8);
+                case 0xd0: return view.getInt8(take(1));
+                case 0xd1: return view.getInt16(take(2));
+                case 0xd2: return view.getInt32(take(4));
+                case 0xd3: return Number(view.getBigInt64(take(8)));
+                case 0xd9: return str(uint(1));
+                case 0xda: return str(uint(2));
+                case 0xdb: return str(uint(4));
+                case 0xdc: return array(uint(2));
+                case 0xdd: return array(uint(4));
+                case 0xde: return map(uint(2));
+                case 0xdf: return map(uint(4));
+                default: throw new Error(`Unsupported MessagePack type 0x${byte.toString(16)}`);
+            }
+        };
+        const value = read();
+        if (pos !== data.length) throw new Error('Trailing bytes after MessagePack packet');
+        return value;
+    }
+
+    // ===== Socket.IO JSON packets =====
+
+    function encodeJson(packet) {
+        let encoded = String(packet.type);
+        if (packet.nsp && packet.nsp !== '/') encoded += packet.nsp + ',';
+        if (packet.id !== undefined && packet.id !== null) encoded += packet.id;
+        if (packet.data !== undefined) encoded += JSON.stringify(packet.data);
+        return encoded;
+    }
+
+    function decodeJson(text) {
+        const type = Number(text.charAt(0));
+        if (!(type >= CONNECT && type <= BINARY_ACK)) throw new Error(`Unknown packet type ${text.charAt(0)}`);
+        if (type === BINARY_EVENT || type === BINARY_ACK) {
+            // The server only sends these for bytes, which Three Stones events never carry
+            throw new Error('Binary attachments are not supported');
+        }
+        let i = 1;
+        let nsp = '/';
+        if (text.charAt(i) === '/') {
+            const end = text.indexOf(',', i);
+            nsp = text.substring(i, end === -1 ? text.length : end);
+            i = end === -1 ? text.length : end + 1;
+        }
+        let id;
+        const idMatch = /^\d+/.exec(text.substring(i));
+        if (idMatch) {
+            id = Number(idMatch[0]);
+            i += idMatch[0].length;
+        }
+        const rest = text.substring(i);
+        const packet = { type, nsp };
+        if (id !== undefined) packet.id = id;
+        if (rest) packet.data = JSON.parse(rest);
+        return packet;
+    }
+
+    // ===== Parser interface expected by socket.io-client =====
+
+    class Encoder {
+        encode(packet) {
+            // Always JSON upstream: the server tells codecs apart by frame type, so this works with or without MessagePack
+            return [encodeJson(packet)];
+        }
+    }
+
+    class Decoder {
+        constructor() {
+            this.listeners = {};
+        }
+
+        on(event, fn) {
+            (this.listeners[event] = this.listeners[event] || []).push(fn);
+            return this;
+        }
+
+        off(event, fn) {
+            if (!event) {
+                this.listeners = {};
+            } else if (!fn) {
+                delete this.listeners[event];
+            } else if (this.listeners[event]) {
+                this.listeners[event] = this.listeners[event].filter(listener => listener !== fn);
+            }
+            return this;
+        }
+
+        emit(event, ...args) {
+            (this.listeners[event] || []).slice().forEach(fn => fn.apply(this, args));
+            return this;
+        }
+
+        add(chunk) {
+            let packet;
+            if (typeof chunk === 'string') {
+                packet = decodeJson(chunk);
+            } else {
+                const decoded = msgpackDecode(chunk);
+                if (!decoded || typeof decoded.type !== 'number' || typeof decoded.nsp !== 'string') {
+                    throw new Error('Invalid MessagePack packet');
+                }
+                packet = { type: decoded.type, nsp: decoded.nsp };
+                if (decoded.data !== undefined && decoded.data !== null) packet.data = decoded.data;
+                if (decoded.id !== undefined && decoded.id !== null) packet.id = decoded.id;
+            }
+            if ((packet.type === EVENT || packet.type === ACK) && !Array.isArray(packet.data)) {
+                throw new Error('Invalid event payload');
+            }
+            this.emit('decoded', packet);
+        }
+
+        destroy() {
+            this.listeners = {};
+        }
+    }
+
+    // Expose
+    window.ThreeStonesSocketParser = { Encoder, Decoder, msgpackEncode, msgpackDecode };
+})();
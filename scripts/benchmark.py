@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Three Stones Micro-Benchmarks
+Times the server hot paths in-process against an in-memory database stand-in and writes comparable JSON
+
+Covered: handle_make_move (accepted and rejected moves), the stone-list
+stalemate check the server used before rules.check_move, the bitboard rules
+engine and solver, move_made payload encoding, game_state persistence (JSON vs
+packed integer) both ways, get_lobby_list with 10/1k/10k rooms and
+load_room_from_db hydration from either column and from a snapshot plus logged
+moves.
+Handlers run inside a Flask request context with a real Flask-SocketIO server
+and no connected clients, so emits cost what an empty room costs.
+
+    python benchmark.py --output before.json
+    python benchmark.py --compare before.json
+    python benchmark.py --filter lobby --repeats 11
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, UTC
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from api.games import three_stones_server as server
+from api.games.three_stones_protocol import move_delta
+from api.games.three_stones_packed import pack_game_state, unpack_game_state
+
+LOBBY_SIZES = (10, 1000, 10000)
+
+
+class MemoryCursor:
+    """Answers the three_stones_rooms lookups the benchmarked code paths run"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._result = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        if sql.startswith('SELECT room_code, room_name, password_hash') and 'WHERE room_code = %s' in sql:
+            self._result = self.tables['three_stones_rooms'].get(params[0])
+        elif sql.startswith('SELECT seq, stone_id, to_node, flags FROM three_stones_moves'):
+            room_code, after = params
+            self._result = [move for move in self.tables['three_stones_moves'].get(room_code, ()) if move[0] > after]
+        else:
+            raise NotImplementedError(f'MemoryCursor does not handle: {sql[:80]}')
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return self._result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class MemoryConnection:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def cursor(self):
+        return MemoryCursor(self.tables)
+
+
+class MemoryPool:
+    """In-memory stand-in for DatabasePool (session() and scope() only)"""
+
+    def __init__(self):
+        self.tables = {'three_stones_rooms': {}, 'three_stones_moves': {}}
+
+    @contextmanager
+    def session(self):
+        yield MemoryConnection(self.tables)
+
+    @contextmanager
+    def scope(self):
+        yield
+
+
+def stone(color, number, node_id):
+    return {'id': f'{color}-{number}', 'nodeId': node_id, 'reachedGoal': False, 'number': number}
+
+
+def new_game_state(orange=('10', '9', '8'), blue=('5', '6', '7'), turn='orange'):
+    return {
+        'orangeStones': [stone('orange', i + 1, n) for i, n in enumerate(orange)],
+        'blueStones': [stone('blue', i + 1, n) for i, n in enumerate(blue)],
+        'currentTurn': turn,
+        'gameOver': False,
+        'winner': None
+    }
+
+
+def reset_server_state():
+    server.rooms.clear()
+    server.players.clear()
+    server.lobby_index.load([])
+    server.db_pool = None
+
+
+def add_match(room_code, started=True):
+    """In-memory room with both players seated; returns (orange_sid, blue_sid)"""
+    orange_sid, blue_sid = f'{room_code}-o', f'{room_code}-b'
+    server.rooms[room_code] = {
+        'name': f'Room {room_code}',
+        'password_hash': None,
+        'players': {'orange': orange_sid, 'blue': blue_sid},
+        'game_state': new_game_state() if started else None,
+        'started': started,
+        'created_at': datetime.now(UTC),
+        'creator': orange_sid
+    }
+    server.players[orange_sid] = {'username': f'{room_code}_o', 'room_code': room_code, 'color': 'orange'}
+    server.players[blue_sid] = {'username': f'{room_code}_b', 'room_code': room_code, 'color': 'blue'}
+    server.index_room(room_code, server.rooms[room_code])
+    return orange_sid, blue_sid
+
+
+class Bench:
+    """Flask app and Socket.IO server the handlers run against"""
+
+    def __init__(self):
+        self.app = Flask(__name__)
+        self.sio = SocketIO(self.app, async_mode='threading')
+        noop = lambda *args, **kwargs: None
+        server.initialize(self.sio, None, (noop, noop, noop, noop))
+
+    @contextmanager
+    def as_client(self, sid):
+        """Request context that looks like a Socket.IO event from ``sid``"""
+        with self.app.test_request_context('/'):
+            from flask import request
+            request.sid = sid
+            request.namespace = '/'
+            yield
+
+    def close(self):
+        server.shutdown()
+        reset_server_state()
+
+
+def bench_request_context(bench):
+    """Request context alone - subtract from the make_move numbers to get handler cost"""
+    def run():
+        with bench.as_client('BENCH0-o'):
+            pass
+
+    return run, None, 1
+
+
+def bench_make_move_cycle(bench):
+    """Four accepted moves that return to the opening position"""
+    orange_sid, blue_sid = add_match('BENCH1')
+    cycle = [
+        (orange_sid, {'stoneId': 'orange-2', 'fromNodeId': '9', 'toNodeId': '4'}),
+        (blue_sid, {'stoneId': 'blue-2', 'fromNodeId': '6', 'toNodeId': '1'}),
+        (orange_sid, {'stoneId': 'orange-2', 'fromNodeId': '4', 'toNodeId': '9'}),
+        (blue_sid, {'stoneId': 'blue-2', 'fromNodeId': '1', 'toNodeId': '6'})
+    ]
+
+    def run():
+        for sid, data in cycle:
+            with bench.as_client(sid):
+                server.handle_make_move(data)
+
+    def check():
+        run()
+        state = server.rooms['BENCH1']['game_state']
+        assert state['currentTurn'] == 'orange' and state['orangeStones'][1]['nodeId'] == '9', 'cycle did not apply'
+
+    return run, check, 4
+
+
+def bench_make_move_rejected(bench):
+    """Move onto an occupied node (runs every check up to the occupancy test)"""
+    orange_sid, _ = add_match('BENCH2')
+    data = {'stoneId': 'orange-1', 'fromNodeId': 'LT', 'toNodeId': 'LM'}
+
+    def run():
+        with bench.as_client(orange_sid):
+            server.handle_make_move(data)
+
+    return run, None, 1
+
+
+def opponent_has_moves_after(current_color, from_node, to_node, orange_stones, blue_stones):
+    """The server's old stalemate check on stone lists, kept to time against rules.check_move"""
+    rules = server.rules
+    orange, blue = rules.stones_mask(orange_stones), rules.stones_mask(blue_stones)
+    own, other = (orange, blue) if current_color == 'orange' else (blue, orange)
+    from_bit = rules.bit(from_node)
+    if from_bit & own:
+        own = rules.move(own, from_bit, rules.bit(to_node))
+    return rules.has_moves(other, own)
+
+
+def bench_stalemate_check(orange, blue, move, expected):
+    def setup(bench):
+        state = new_game_state(orange, blue)
+
+        def run():
+            return opponent_has_moves_after('orange', move[0], move[1],
+                                            state['orangeStones'], state['blueStones'])
+
+        def check():
+            assert run() is expected, 'unexpected stalemate result'
+
+        return run, check, 1
+    return setup
+
+
+def bench_engine(kind):
+    """Bitboard rules on the blocking position from stalemate_check.blocking"""
+    def setup(bench):
+        rules = server.rules
+        own, other = rules.mask(('6', '3', '4')), rules.mask(('5', '7', '2'))
+        from_bit, to_bit = rules.bit('4'), rules.bit('1')
+        if kind == 'check_move':
+            return lambda: rules.check_move(own, other, from_bit, to_bit), None, 1
+        return lambda: rules.legal_moves(own, other), None, 1
+    return setup
+
+
+def bench_solver_lookup(bench):
+    """Hint for a mid-game position from the solved table"""
+    state = new_game_state(orange=('10', '4', '8'), blue=('5', '1', '7'))
+
+    def check():
+        assert server.position_table.analyse(state)['bestMove'] is not None, 'no best move'
+
+    return lambda: server.position_table.analyse(state), check, 1
+
+
+def bench_move_payload(kind):
+    """JSON encoding of one move_made payload: full gameState (stones carry client x/y) or move delta"""
+    def setup(bench):
+        state = new_game_state(orange=('10', '4', '8'), blue=('5', '1', '7'), turn='blue')
+        for s in state['orangeStones'] + state['blueStones']:
+            s.update(x=412.5, y=187.25)
+        if kind == 'full':
+            payload = {'gameState': state}
+        else:
+            payload = {'seq': 17, **move_delta(state['orangeStones'][1], '9', state)}
+
+        return lambda: json.dumps(payload, separators=(',', ':')), None, 1
+    return setup
+
+
+def bench_stored_state(kind, direction):
+    """What the persister writes for one mid-game state (JSON text or packed int), or reading it back"""
+    def setup(bench):
+        state = server.parse_stored_game_state(
+            None, pack_game_state(new_game_state(orange=('10', '4', '8'), blue=('5', '1', '7'), turn='blue')))
+        if kind == 'json':
+            encode, decode = json.dumps, json.loads
+        else:
+            encode, decode = pack_game_state, unpack_game_state
+        stored = encode(state)
+        if direction == 'encode':
+            return lambda: encode(state), None, 1
+
+        def check():
+            assert decode(stored) == state, f'{kind} round trip changed the state'
+
+        return lambda: decode(stored), check, 1
+    return setup
+
+
+def bench_lobby_list(size):
+    def setup(bench):
+        # Every other room is hydrated with both players seated, the rest are index-only
+        rows = [(f'R{i:06d}', f'Room {i}', i % 5 == 0, False, f'sid-{i}', i, f'user{i}') for i in range(size)]
+        server.lobby_index.load(rows)
+        for code, *_ in rows[::2]:
+            add_match(code, started=False)
+
+        def check():
+            assert len(server.get_lobby_list()) == size
+
+        return server.get_lobby_list, check, 1
+    return setup
+
+
+def bench_load_room_from_db(kind):
+    """Hydrate one started room (row lookup, JSON parse or unpack, move replay, room dict, lobby index)"""
+    def setup(bench):
+        pool = MemoryPool()
+        if kind == 'replay':
+            # Packed opening position and the most moves logged before the next snapshot
+            columns = (None, pack_game_state(new_game_state()))
+            shuttle = (('orange-2', '4'), ('blue-2', '1'), ('orange-2', '9'), ('blue-2', '6'))
+            pool.tables['three_stones_moves']['HYDRA1'] = [
+                (seq, *shuttle[(seq - 1) % 4], 0) for seq in range(1, server.SNAPSHOT_EVERY)
+            ]
+        elif kind == 'json':
+            # A legacy row: named node IDs, no schemaVersion, upgraded on load
+            state = new_game_state(orange=('LT', '4', 'LB'), blue=('RT', '1', 'RB'), turn='blue')
+            columns = (json.dumps(state), None)
+        else:
+            columns = (None, pack_game_state(new_game_state(orange=('10', '4', '8'), blue=('5', '1', '7'), turn='blue')))
+        pool.tables['three_stones_rooms']['HYDRA1'] = (
+            'HYDRA1', 'Hydrated', None, 'sid-creator', 'sid-o', 'sid-b',
+            *columns, 0, True, datetime.now()
+        )
+        server.db_pool = pool
+
+        def run():
+            server.rooms.pop('HYDRA1', None)
+            return server.load_room_from_db('HYDRA1')
+
+        def check():
+            room = run()
+            assert room is not None and room['game_state']['currentTurn'] == 'blue', 'hydration failed'
+
+        return run, check, 1
+    return setup
+
+
+BENCHMARKS = {
+    'request_context.baseline': bench_request_context,
+    'make_move.cycle': bench_make_move_cycle,
+    'make_move.rejected_occupied': bench_make_move_rejected,
+    'stalemate_check.opening': bench_stalemate_check(('10', '9', '8'), ('5', '6', '7'), ('9', '4'), True),
+    'stalemate_check.blocking': bench_stalemate_check(('6', '3', '4'), ('5', '7', '2'), ('4', '1'), False),
+    'engine.check_move': bench_engine('check_move'),
+    'engine.legal_moves': bench_engine('legal_moves'),
+    'solver.analyse': bench_solver_lookup,
+    'payload.move_made.full': bench_move_payload('full'),
+    'payload.move_made.delta': bench_move_payload('delta'),
+    'stored_state.json.encode': bench_stored_state('json', 'encode'),
+    'stored_state.packed.encode': bench_stored_state('packed', 'encode'),
+    'stored_state.json.decode': bench_stored_state('json', 'decode'),
+    'stored_state.packed.decode': bench_stored_state('packed', 'decode'),
+    **{f'get_lobby_list.{size}': bench_lobby_list(size) for size in LOBBY_SIZES},
+    'load_room_from_db.hydrate': bench_load_room_from_db('json'),
+    'load_room_from_db.packed': bench_load_room_from_db('packed'),
+    'load_room_from_db.replay': bench_load_room_from_db('replay')
+}
+
+
+def measure(run, repeats, min_time, calls_per_run):
+    """Per-call timings (microseconds) over ``repeats`` rounds of auto-calibrated loops"""
+    timer = timeit.Timer(run)
+    loops, elapsed = timer.autorange()
+    if elapsed < min_time:
+        loops = max(loops, int(loops * min_time / max(elapsed, 1e-9)))
+    per_call = [t / loops / calls_per_run * 1e6 for t in timer.repeat(repeat=repeats, number=loops)]
+    median = statistics.median(per_call)
+    return {
+        'loops': loops,
+        'repeats': repeats,
+        'min_us': round(min(per_call), 3),
+        'median_us': round(median, 3),
+        'mean_us': round(statistics.fmean(per_call), 3),
+        'stdev_us': round(statistics.stdev(per_call), 3) if len(per_call) > 1 else 0.0,
+        'ops_per_second': round(1e6 / median, 1) if median else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    bench = Bench()
+    results = {}
+    try:
+        for name, setup in BENCHMARKS.items():
+            if args.filter and args.filter not in name:
+                continue
+            reset_server_state()
+            run, check, calls_per_run = setup(bench)
+            if check:
+                check()
+            results[name] = measure(run, args.repeats, args.min_time, calls_per_run)
+            row = results[name]
+            print(f"{name:<32}{row['median_us']:>12.3f} us{row['stdev_us']:>10.3f}{row['ops_per_second']:>14.1f} ops/s")
+    finally:
+        bench.close()
+    return results
+
+
+def print_comparison(results, baseline):
+    old = baseline.get('benchmarks', {})
+    print(f"\n== Compared with {baseline.get('git_revision') or 'baseline'} (median per call)")
+    for name, row in results.items():
+        before = old.get(name, {}).get('median_us')
+        if before:
+            after = row['median_us']
+            print(f"{name:<32}{before:>12.3f} -> {after:>10.3f} us ({(after - before) / before:+.1%})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Three Stones server micro-benchmarks')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeats', type=int, default=7, help='timed rounds per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per round')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--list', action='store_true', help='list benchmark names and exit')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        sys.exit(0)
+    print(f"{'benchmark':<32}{'median':>15}{'stdev':>10}{'throughput':>20}")
+    results = run_benchmarks(args)
+    report = {
+        'git_revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'repeats': args.repeats, 'min_time': args.min_time},
+        'benchmarks': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
